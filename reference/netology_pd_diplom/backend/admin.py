@@ -1,7 +1,107 @@
+from operator import attrgetter
+
 from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
+from .catalog import CatalogChanges, bump_catalog_version, bump_order_version, refresh_product_cards
+from .counters import category_pairs
+from .importer import reset_import_state
+from .offers import offer_products
 from .tasks import send_email_task, do_import
-from backend.models import User, Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem,     Contact, ConfirmEmailToken
+from backend.models import User, Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem,     Contact, ConfirmEmailToken, ShopImportState, ImportJob, ProductCard
+
+
+class CatalogAdminMixin:
+    """
+    Изменения каталога в админке увеличивают версию каталога, чтобы не выдавать
+    закешированные ответы. catalog_shop_field - путь к ID магазина; если не задан,
+    изменение касается общих данных всех магазинов, иначе у магазина сбрасываются метаданные
+    последней загрузки прайс-листа, чтобы повторный импорт того же файла не был пропущен.
+    card_lookup - путь от ProductInfo к удаляемому объекту для пересборки карточек товаров,
+    которые удаление не затрагивает каскадно (сохранение объектов обрабатывают сигналы).
+    offer_lookup - путь от ProductInfo к удаляемому объекту для пересчета сводок предложений
+    продуктов, у которых удаление забирает предложения.
+    count_lookup - путь от ProductCard к удаляемому объекту для пересчета счетчиков товаров категорий.
+    """
+    catalog_shop_field = None
+    card_lookup = None
+    offer_lookup = None
+    count_lookup = None
+
+    def bump_catalog(self, objects):
+        if self.catalog_shop_field:
+            shop_ids = {attrgetter(self.catalog_shop_field)(obj) for obj in objects}
+            reset_import_state(*shop_ids)
+            bump_catalog_version(*shop_ids)
+        else:
+            bump_catalog_version()
+
+    def affected_cards(self, objects):
+        if not self.card_lookup:
+            return []
+        return list(ProductInfo.objects.filter(**{f'{self.card_lookup}__in': [obj.pk for obj in objects]}).values_list(
+            'id', flat=True))
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self.bump_catalog([obj])
+
+    def affected_products(self, objects):
+        if not self.offer_lookup:
+            return set()
+        return offer_products(ProductInfo.objects.filter(
+            **{f'{self.offer_lookup}__in': [obj.pk for obj in objects]}))
+
+    def affected_pairs(self, objects):
+        if not self.count_lookup:
+            return set()
+        return category_pairs(ProductCard.objects.filter(
+            **{f'{self.count_lookup}__in': [obj.pk for obj in objects]}))
+
+    def affected_changes(self, objects):
+        # удаленные объекты могли уносить с собой товары в продаже
+        return CatalogChanges(self.affected_products(objects), self.affected_pairs(objects), names=True)
+
+    def delete_model(self, request, obj):
+        cards = self.affected_cards([obj])
+        changes = self.affected_changes([obj])
+        super().delete_model(request, obj)
+        refresh_product_cards(cards, changes=changes)
+        changes.apply()
+        self.bump_catalog([obj])
+
+    def delete_queryset(self, request, queryset):
+        objects = list(queryset)
+        cards = self.affected_cards(objects)
+        changes = self.affected_changes(objects)
+        super().delete_queryset(request, queryset)
+        refresh_product_cards(cards, changes=changes)
+        changes.apply()
+        self.bump_catalog(objects)
+
+
+class OrderVersionAdminMixin:
+    """
+    Изменения заказов в админке увеличивают версию заказов их пользователей, чтобы ETag
+    корзины и заказов не совпал с прежним. order_user_field - путь к ID пользователя
+    (сохранение вызывает save_related и после save_model, и после изменения позиций).
+    """
+    order_user_field = 'user_id'
+
+    def bump_orders(self, objects):
+        bump_order_version(*{attrgetter(self.order_user_field)(obj) for obj in objects})
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        self.bump_orders([form.instance])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.bump_orders([obj])
+
+    def delete_queryset(self, request, queryset):
+        objects = list(queryset)
+        super().delete_queryset(request, queryset)
+        self.bump_orders(objects)
 
 
 @admin.register(User)
@@ -23,10 +123,12 @@ class CustomUserAdmin(UserAdmin):
 
 
 @admin.register(Shop)
-class ShopAdmin(admin.ModelAdmin):
+class ShopAdmin(CatalogAdminMixin, admin.ModelAdmin):
+    catalog_shop_field = 'id'
+    offer_lookup = 'shop_id'
     list_display = ('name', 'user', 'state')
     list_filter = ('state',)
-    actions = ['update_pricelist']
+    actions = ['update_pricelist', 'update_pricelist_diff']
     fieldsets = (
         (None, {
             'fields': ('name', 'user', 'state'),
@@ -44,19 +146,49 @@ class ShopAdmin(admin.ModelAdmin):
         """
         for shop in queryset:
             if shop.url:
-                do_import.delay(shop.url, shop.id)
+                job = ImportJob.objects.create(user=request.user, shop=shop, url=shop.url)
+                do_import.delay(shop.url, shop.id, job_id=job.id)
                 self.message_user(request, f'Прайс-лист для магазина "{shop.name}" будет обновлен в ближайшее время.', messages.SUCCESS)
             else:
                 self.message_user(request, f'У магазина "{shop.name}" не указан URL для импорта.', messages.WARNING)
 
+    @admin.action(description='Обновить прайс-лист (только изменения)')
+    def update_pricelist_diff(self, request, queryset):
+        """
+        Запускает дифференциальный импорт: существующие товары обновляются по external_id,
+        а пропавшие из прайс-листа снимаются с продажи без удаления.
+        """
+        for shop in queryset:
+            if shop.url:
+                job = ImportJob.objects.create(user=request.user, shop=shop, url=shop.url, mode='diff')
+                do_import.delay(shop.url, shop.id, mode='diff', job_id=job.id)
+                self.message_user(request, f'Изменения прайс-листа магазина "{shop.name}" будут загружены в ближайшее время.', messages.SUCCESS)
+            else:
+                self.message_user(request, f'У магазина "{shop.name}" не указан URL для импорта.', messages.WARNING)
+
+
+@admin.register(ShopImportState)
+class ShopImportStateAdmin(admin.ModelAdmin):
+    list_display = ('shop', 'status', 'checked_at', 'imported_at')
+    list_filter = ('status',)
+    readonly_fields = ('checked_at',)
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('shop', 'user', 'mode', 'state', 'progress', 'created_at', 'finished_at')
+    list_filter = ('state', 'mode')
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
+
 
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
+class CategoryAdmin(CatalogAdminMixin, admin.ModelAdmin):
     search_fields = ('name',)
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(CatalogAdminMixin, admin.ModelAdmin):
+    count_lookup = 'product_info__product_id'
     list_display = ('name', 'category')
     list_filter = ('category',)
 
@@ -67,19 +199,30 @@ class ProductParameterInline(admin.TabularInline):
 
 
 @admin.register(ProductInfo)
-class ProductInfoAdmin(admin.ModelAdmin):
-    list_display = ('product', 'shop', 'price', 'quantity')
-    list_filter = ('shop',)
+class ProductInfoAdmin(CatalogAdminMixin, admin.ModelAdmin):
+    catalog_shop_field = 'shop_id'
+    offer_lookup = 'id'
+    count_lookup = 'product_info_id'
+    list_display = ('product', 'shop', 'price', 'quantity', 'is_active')
+    list_filter = ('shop', 'is_active')
     inlines = [ProductParameterInline]
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # характеристики из инлайна сохраняются после товара
+        refresh_product_cards([form.instance.id])
+
 
 @admin.register(Parameter)
-class ParameterAdmin(admin.ModelAdmin):
+class ParameterAdmin(CatalogAdminMixin, admin.ModelAdmin):
+    card_lookup = 'product_parameters__parameter_id'
     search_fields = ('name',)
 
 
 @admin.register(ProductParameter)
-class ProductParameterAdmin(admin.ModelAdmin):
+class ProductParameterAdmin(CatalogAdminMixin, admin.ModelAdmin):
+    catalog_shop_field = 'product_info.shop_id'
+    card_lookup = 'product_parameters__id'
     list_display = ('product_info', 'parameter', 'value')
 
 
@@ -99,7 +242,7 @@ class OrderItemInline(admin.TabularInline):
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(OrderVersionAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'user', 'dt', 'state', 'contact')
     list_filter = ('state',)
     search_fields = ('user__email', 'id')
@@ -126,12 +269,14 @@ class OrderAdmin(admin.ModelAdmin):
 
 
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
+class OrderItemAdmin(OrderVersionAdminMixin, admin.ModelAdmin):
+    order_user_field = 'order.user_id'
+
     list_display = ('order', 'product_info', 'quantity')
 
 
 @admin.register(Contact)
-class ContactAdmin(admin.ModelAdmin):
+class ContactAdmin(OrderVersionAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'city', 'street', 'phone')
     search_fields = ('user__email',)
 
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class BackendConfig(AppConfig):
@@ -7,5 +8,9 @@ class BackendConfig(AppConfig):
 
     def ready(self):
         """
-        импортируем сигналы
+        импортируем сигналы и создаем полнотекстовый индекс после миграций
         """
+        import backend.signals  # noqa: F401
+        from backend.search import create_search_index
+
+        post_migrate.connect(create_search_index, sender=self)
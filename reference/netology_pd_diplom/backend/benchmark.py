@@ -0,0 +1,427 @@
+"""
+Генератор синтетических прайс-листов и замеры скорости импорта.
+
+Прайс-листы повторяют схему data/shop1.yaml и пишутся потоково, поэтому можно получить
+файл на миллион товаров, не держа его в памяти. Все создаваемые объекты (магазины,
+категории, продукты, параметры) помечаются префиксом BENCHMARK_PREFIX. Перед замером
+existing_data запоминает id уже существующих объектов с такими именами, и cleanup удаляет
+только созданные замером объекты, не трогая данные с похожими именами. Категории получают id
+начиная с CATEGORY_ID_BASE; check_category_ids до замера проверяет, что эти id не заняты
+настоящими категориями, которые импорт иначе переименовал бы.
+
+Используется командами generate_price_list, benchmark_import и benchmark_serialization.
+"""
+import csv
+import http.server
+import os
+import random
+import sys
+import threading
+import time
+from functools import partial
+from itertools import islice
+
+import yaml
+from celery import current_app
+from django.conf import settings
+from django.core.management import call_command
+from django.db.models import Q
+from ujson import dumps as dump_json, loads as load_json
+
+from backend.catalog import CatalogChanges, bump_catalog_version, refresh_product_cards
+from backend.counters import category_pairs
+from backend.importer import QueryCounter, PriceListImporter
+from backend.models import Shop, User, Category, Product, Parameter, ImportJob, ProductInfo, ProductCard, Order, \
+    OrderItem
+from backend.offers import offer_products
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeDumper
+
+BENCHMARK_PREFIX = 'Benchmark'
+# первый id категорий синтетических прайс-листов
+CATEGORY_ID_BASE = 900000
+# количество категорий прайс-листа create_orders
+ORDER_CATEGORIES = 10
+# расширения файлов синтетических прайс-листов
+FORMAT_EXTENSIONS = {'yaml': '.yaml', 'jsonl': '.jsonl', 'csv': '.csv', 'msgpack': '.msgpack'}
+# количество товаров, сериализуемых за один вызов
+WRITE_BATCH_SIZE = 1000
+
+CSV_COLUMNS = ('shop', 'id', 'category', 'category_name', 'model', 'name', 'price', 'price_rrc', 'quantity',
+               'parameters')
+
+
+def shop_name(number):
+    return f'{BENCHMARK_PREFIX} shop {number}'
+
+
+def generate_categories(count):
+    """
+    Возвращает список категорий синтетического прайс-листа.
+    """
+    return [{'id': CATEGORY_ID_BASE + number, 'name': f'{BENCHMARK_PREFIX} category {number}'}
+            for number in range(count)]
+
+
+def check_category_ids(count):
+    """
+    Проверяет, что id категорий синтетических прайс-листов не заняты категориями, созданными не замером.
+
+    Args:
+        count (int): количество категорий.
+
+    Raises:
+        ValueError: в диапазоне id есть другие категории.
+    """
+    taken = list(Category.objects.filter(id__gte=CATEGORY_ID_BASE, id__lt=CATEGORY_ID_BASE + count).exclude(
+        name__startswith=BENCHMARK_PREFIX).values_list('id', flat=True)[:10])
+    if taken:
+        raise ValueError(f'id категорий {CATEGORY_ID_BASE}-{CATEGORY_ID_BASE + count - 1} заняты: '
+                         f'{", ".join(map(str, taken))}')
+
+
+def generate_goods(count, parameters=4, categories=10, seed=0):
+    """
+    Генерирует товары синтетического прайс-листа.
+
+    Названия и модели товаров зависят только от номера, поэтому прайс-листы разных магазинов
+    с одинаковым seed ссылаются на одни и те же продукты, а цены и остатки у них различаются.
+
+    Args:
+        count (int): количество товаров.
+        parameters (int): количество характеристик у каждого товара.
+        categories (int): количество категорий.
+        seed (int): зерно генератора случайных чисел.
+
+    Yields:
+        dict: товар в схеме data/shop1.yaml.
+    """
+    rnd = random.Random(seed)
+    for number in range(count):
+        price = rnd.randint(100, 200000)
+        yield {
+            'id': 1000000 + number,
+            'category': CATEGORY_ID_BASE + number % categories,
+            'model': f'benchmark/model-{number // 10}',
+            'name': f'{BENCHMARK_PREFIX} product {number}',
+            'price': price,
+            'price_rrc': price + rnd.randint(0, 10000),
+            'quantity': rnd.randint(0, 100),
+            'parameters': {
+                f'{BENCHMARK_PREFIX} parameter {index}':
+                    round(rnd.uniform(1, 1000), 1) if index % 2 else f'value {rnd.randint(1, 50)}'
+                for index in range(parameters)
+            },
+        }
+
+
+def write_price_list(path, file_format, shop, categories, goods):
+    """
+    Потоково записывает прайс-лист в файл.
+
+    Args:
+        path (str): путь к файлу.
+        file_format (str): yaml, jsonl, csv или msgpack.
+        shop (str): название магазина.
+        categories (list): категории.
+        goods (iterable): товары.
+    """
+    header = {'shop': shop, 'categories': categories}
+    if file_format == 'msgpack':
+        import msgpack
+
+        packer = msgpack.Packer()
+        with open(path, 'wb') as file:
+            file.write(packer.pack(header))
+            for item in goods:
+                file.write(packer.pack(item))
+        return
+
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        if file_format == 'yaml':
+            yaml.dump(header, file, Dumper=SafeDumper, allow_unicode=True, sort_keys=False)
+            file.write('goods:\n')
+            goods = iter(goods)
+            while batch := list(islice(goods, WRITE_BATCH_SIZE)):
+                yaml.dump(batch, file, Dumper=SafeDumper, allow_unicode=True, sort_keys=False)
+        elif file_format == 'jsonl':
+            file.write(dump_json(header, ensure_ascii=False) + '\n')
+            for item in goods:
+                file.write(dump_json(item, ensure_ascii=False) + '\n')
+        elif file_format == 'csv':
+            names = {category['id']: category['name'] for category in categories}
+            writer = csv.DictWriter(file, CSV_COLUMNS)
+            writer.writeheader()
+            for item in goods:
+                writer.writerow({**item, 'shop': shop, 'category_name': names.get(item['category'], ''),
+                                 'parameters': dump_json(item['parameters'], ensure_ascii=False)})
+        else:
+            raise ValueError(f'Неизвестный формат прайс-листа: {file_format}')
+
+
+def generate_price_lists(directory, goods, parameters=4, shops=1, categories=10, file_format='yaml', seed=0):
+    """
+    Записывает синтетические прайс-листы магазинов в каталог.
+
+    Returns:
+        list: пути к созданным файлам.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for number in range(1, shops + 1):
+        path = os.path.join(directory, f'shop{number}_{goods}{FORMAT_EXTENSIONS[file_format]}')
+        write_price_list(path, file_format, shop_name(number), generate_categories(categories),
+                         generate_goods(goods, parameters, categories, seed + number))
+        paths.append(path)
+    return paths
+
+
+def peak_rss_kb():
+    """
+    Пиковый размер резидентной памяти процесса в килобайтах.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # на macOS ru_maxrss в байтах, на Linux - в килобайтах
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def benchmark_user(number):
+    user, _ = User.objects.get_or_create(email=f'benchmark{number}@example.com',
+                                         defaults={'username': f'benchmark{number}@example.com', 'type': 'shop',
+                                                   'is_active': True})
+    return user
+
+
+def run_do_import(paths, file_format):
+    """
+    Импорт задачей do_import (в текущем процессе).
+    """
+    from backend.tasks import do_import
+
+    for number, path in enumerate(paths, start=1):
+        shop, _ = Shop.objects.get_or_create(name=shop_name(number), user=benchmark_user(number))
+        result = do_import('file://' + os.path.abspath(path), shop.id, file_format=file_format, force=True)
+        if not result['Status']:
+            raise RuntimeError(result.get('Error') or result.get('Errors'))
+
+
+def run_partner_update(paths, file_format):
+    """
+    Импорт через представление PartnerUpdate: файлы отдаются локальным HTTP-сервером.
+    """
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from backend.views import PartnerUpdate
+
+    handler = partial(_QuietHandler, directory=os.path.dirname(os.path.abspath(paths[0])))
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        factory = APIRequestFactory()
+        for number, path in enumerate(paths, start=1):
+            url = f'http://127.0.0.1:{server.server_port}/{os.path.basename(path)}'
+            request = factory.post('/api/v1/partner/update', {'url': url, 'format': file_format}, format='json')
+            force_authenticate(request, user=benchmark_user(number))
+            response = PartnerUpdate.as_view()(request)
+            if response.status_code != 202:
+                raise RuntimeError(response.content.decode())
+            job = ImportJob.objects.get(id=load_json(response.content)['Job'])
+            if job.state != 'done':
+                raise RuntimeError(job.error)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def run_load_shop_data(paths, file_format):
+    """
+    Импорт командой load_shop_data.
+    """
+    with open(os.devnull, 'w') as devnull:
+        for number, path in enumerate(paths, start=1):
+            call_command('load_shop_data', path, format=file_format, email=benchmark_user(number).email,
+                         stdout=devnull)
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+RUNNERS = {
+    'do_import': run_do_import,
+    'partner_update': run_partner_update,
+    'load_shop_data': run_load_shop_data,
+}
+
+
+def run_benchmark(runner, paths, file_format=None, goods=None):
+    """
+    Выполняет один замер импорта. Задачи Celery выполняются синхронно в текущем процессе.
+
+    Args:
+        runner (str): способ импорта из RUNNERS.
+        paths (list): пути к прайс-листам.
+        file_format (str): формат прайс-листов.
+        goods (int): общее количество товаров для расчета скорости.
+
+    Returns:
+        dict: время, пиковая память, количество запросов и скорость либо текст ошибки.
+    """
+    result = {'runner': runner, 'goods': goods, 'shops': len(paths), 'rss_before_kb': peak_rss_kb()}
+    always_eager = current_app.conf.task_always_eager
+    current_app.conf.task_always_eager = True
+    started = time.monotonic()
+    try:
+        with QueryCounter() as counter:
+            RUNNERS[runner](paths, file_format)
+    except Exception as error:
+        result.update(status='failed', error=str(error))
+    else:
+        result['status'] = 'ok'
+    finally:
+        current_app.conf.task_always_eager = always_eager
+    seconds = time.monotonic() - started
+    result.update(seconds=round(seconds, 3), peak_rss_kb=peak_rss_kb(), queries=counter.count,
+                  rows_per_sec=round(goods / seconds, 1) if goods and seconds else None)
+    return result
+
+
+def create_orders(orders, items, parameters=4):
+    """
+    Создает покупателя с заказами и корзиной из товаров синтетического прайс-листа.
+
+    Args:
+        orders (int): количество заказов (кроме корзины).
+        items (int): количество позиций в каждом заказе.
+        parameters (int): количество характеристик у каждого товара.
+
+    Returns:
+        User: покупатель.
+    """
+    shop, _ = Shop.objects.get_or_create(name=shop_name(1), user=benchmark_user(1))
+    PriceListImporter(shop).run({'shop': shop.name, 'categories': generate_categories(ORDER_CATEGORIES),
+                                 'goods': generate_goods(max(items * 10, 100), parameters)})
+    product_infos = list(ProductInfo.objects.filter(shop=shop).values_list('id', flat=True))
+    buyer, _ = User.objects.get_or_create(email='benchmark-buyer@example.com', defaults={
+        'username': 'benchmark-buyer@example.com', 'is_active': True})
+    created = Order.objects.bulk_create([Order(user=buyer, state='new' if number else 'basket')
+                                         for number in range(orders + 1)])
+    rnd = random.Random(0)
+    OrderItem.objects.bulk_create([OrderItem(order=order, product_info_id=product_info_id, quantity=rnd.randint(1, 5))
+                                   for order in created for product_info_id in rnd.sample(product_infos, items)])
+    return buyer
+
+
+def run_serialization_benchmark(user, repeat=5):
+    """
+    Сравнивает ответы OrderView и BasketView с сериализаторами DRF и быстрой сериализацией.
+
+    Args:
+        user (User): покупатель с заказами (create_orders).
+        repeat (int): количество запросов к каждому представлению каждым способом.
+
+    Returns:
+        list: лучшее время запроса каждым способом, ускорение и совпадение ответов.
+    """
+    from django.test import override_settings
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from backend.pagination import OrderCursorPagination
+    from backend.views import OrderView, BasketView
+
+    factory = APIRequestFactory()
+    endpoints = (('order', OrderView, {'page_size': OrderCursorPagination.max_page_size}),
+                 ('basket', BasketView, {}))
+    results = []
+    for name, view, params in endpoints:
+        result = {'endpoint': name}
+        content = {}
+        for mode, fast in (('drf', False), ('fast', True)):
+            timings = []
+            with override_settings(FAST_SERIALIZATION=fast):
+                for _ in range(repeat):
+                    request = factory.get(f'/api/v1/{name}', params)
+                    force_authenticate(request, user=user)
+                    started = time.perf_counter()
+                    response = view.as_view()(request)
+                    # ответы DRF рендерятся лениво
+                    if hasattr(response, 'render'):
+                        response.render()
+                    timings.append(time.perf_counter() - started)
+            content[mode] = response.content
+            result[f'{mode}_seconds'] = round(min(timings), 4)
+        result.update(bytes=len(content['fast']), identical=content['drf'] == content['fast'],
+                      speedup=round(result['drf_seconds'] / result['fast_seconds'], 1))
+        results.append(result)
+    return results
+
+
+def benchmark_data():
+    """
+    Объекты с именами замеров: магазины, пользователи, продукты, категории и параметры.
+    """
+    return (Shop.objects.filter(name__startswith=BENCHMARK_PREFIX),
+            User.objects.filter(email__startswith='benchmark', email__endswith='@example.com'),
+            Product.objects.filter(name__startswith=BENCHMARK_PREFIX),
+            Category.objects.filter(name__startswith=BENCHMARK_PREFIX),
+            Parameter.objects.filter(name__startswith=BENCHMARK_PREFIX))
+
+
+def existing_data():
+    """
+    id объектов с именами замеров, которые были в базе до замера.
+
+    Returns:
+        list: множества id в порядке benchmark_data.
+    """
+    return [set(queryset.values_list('id', flat=True)) for queryset in benchmark_data()]
+
+
+def cleanup(existing):
+    """
+    Удаляет данные, созданные замерами, и обновляет производные данные каталога так же, как удаление
+    в админке: пересобирает карточки товаров, у которых удаляются характеристики, пересчитывает
+    сводки предложений и счетчики категорий, из которых уходят товары, и увеличивает версии каталога.
+
+    Args:
+        existing (list): результат existing_data до замера; эти объекты не удаляются.
+    """
+    shops, users, products, categories, parameters = (
+        queryset.exclude(id__in=ids) for queryset, ids in zip(benchmark_data(), existing))
+    removed = ProductInfo.objects.filter(Q(shop__in=shops) | Q(shop__user__in=users) | Q(product__in=products) |
+                                         Q(product__category__in=categories))
+    # счетчики удаляемых магазинов и категорий удаляются каскадно
+    pairs = category_pairs(ProductCard.objects.filter(product_info__in=removed).exclude(
+        Q(shop__in=shops) | Q(shop__user__in=users) | Q(category__in=categories)))
+    changes = CatalogChanges(offer_products(removed), pairs, names=True)
+    cards = list(ProductInfo.objects.filter(product_parameters__parameter__in=parameters).exclude(
+        id__in=removed).values_list('id', flat=True).distinct())
+    for queryset in (shops, users, products, categories, parameters):
+        queryset.delete()
+    refresh_product_cards(cards, changes=changes)
+    changes.apply()
+    bump_catalog_version()
+
+
+def environment():
+    """
+    Описание окружения для отчета.
+    """
+    import django
+
+    return {
+        'python': sys.version.split()[0],
+        'django': django.get_version(),
+        'database': settings.DATABASES['default']['ENGINE'].rsplit('.', 1)[-1],
+        'batch_size': settings.IMPORT_BATCH_SIZE,
+        'chunk_size': settings.IMPORT_CHUNK_SIZE,
+    }
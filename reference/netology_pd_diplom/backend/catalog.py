@@ -0,0 +1,328 @@
+"""
+Кеширование ответов каталога.
+
+Ответы CategoryView, ShopView и ProductInfoView кешируются (Redis или локальная память,
+см. CACHES) по ключу из названия представления, адреса запроса с нормализованными параметрами
+и версии каталога. Версии хранятся в таблице CatalogVersion:
+- global - каталог в целом, меняется при любом изменении;
+- shared - общие для магазинов данные: категории, продукты, параметры;
+- shop:<id> - товары магазина, меняется при импорте, обновлении остатков и смене статуса магазина;
+- names - названия продуктов и модели товаров в продаже, по которым строится индекс подсказок
+  (backend.suggest); обновление цен и остатков ее не меняет.
+Представления, которые отбирают товары по shop_id (cache_catalog_response(shop_scoped=True)),
+для запросов с этим фильтром используют версии shared и магазина, остальные ответы - глобальную:
+у представлений, которые не фильтруют по магазину, ответ с shop_id зависит и от других магазинов.
+
+Версия увеличивается в той же транзакции, что и изменение данных, поэтому после фиксации
+изменений ответ с прежней версией уже не может быть выдан из кеша.
+
+Каталог товаров отдается из карточек ProductCard: JSON каждой карточки собирается заранее
+(refresh_product_cards) при импорте, обновлении цен и остатков и сохранении объектов каталога,
+поэтому страница каталога - это один запрос к таблице карточек без соединений и сериализаторов.
+
+Ответы каталога, корзины и заказов получают сильный ETag из версий, по которым они построены,
+и параметров запроса, поэтому ETag известен до построения ответа: при совпадении с If-None-Match
+отдается 304 без тела ценой одного запроса версий. Для корзины и заказов используется версия
+orders:<id пользователя>, которая увеличивается при изменении его заказов, корзины и адресов,
+и глобальная версия каталога, так как заказы содержат текущие данные товаров.
+"""
+import hashlib
+from functools import partial, wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from backend.models import CatalogVersion, ProductInfo, ProductParameter, ProductCard
+from backend.counters import refresh_category_counts
+from backend.offers import refresh_offer_summaries
+
+GLOBAL_SCOPE = 'global'
+SHARED_SCOPE = 'shared'
+NAMES_SCOPE = 'names'
+
+
+def shop_scope(shop_id):
+    return f'shop:{shop_id}'
+
+
+def order_scope(user_id):
+    return f'orders:{user_id}'
+
+
+def get_versions(scopes):
+    """
+    Возвращает версии областей одним запросом в виде строки (отсутствующая версия считается равной 0).
+    """
+    versions = dict(CatalogVersion.objects.filter(scope__in=scopes).values_list('scope', 'version'))
+    return '.'.join(str(versions.get(scope, 0)) for scope in scopes)
+
+
+def get_catalog_version(shop_id=None):
+    """
+    Возвращает версию каталога магазина или каталога в целом в виде строки.
+    """
+    return get_versions([SHARED_SCOPE, shop_scope(shop_id)] if shop_id else [GLOBAL_SCOPE])
+
+
+def bump_versions(scopes):
+    CatalogVersion.objects.filter(scope__in=scopes).update(version=F('version') + 1)
+    # отсутствующая версия читается как 0, поэтому новая запись начинается с 1
+    CatalogVersion.objects.bulk_create([CatalogVersion(scope=scope) for scope in scopes], ignore_conflicts=True)
+
+
+def bump_catalog_version(*shop_ids):
+    """
+    Увеличивает версию каталога. Если магазины не указаны, изменились общие данные
+    (категории, продукты, параметры), которые видны в каталоге любого магазина.
+
+    Args:
+        *shop_ids (int): ID магазинов, товары которых изменились.
+    """
+    bump_versions([GLOBAL_SCOPE, *(shop_scope(shop_id) for shop_id in shop_ids)] if shop_ids else
+                  [GLOBAL_SCOPE, SHARED_SCOPE])
+
+
+def bump_order_version(*user_ids):
+    """
+    Увеличивает версию заказов пользователей. Вызывается после изменения заказов,
+    чтобы ETag нового содержимого не совпал с прежним.
+    """
+    bump_versions([order_scope(user_id) for user_id in user_ids])
+
+
+def request_digest(request):
+    """
+    Хеш адреса, нормализованных параметров и формата ответа запроса.
+    """
+    params = sorted((key, value) for key in request.query_params for value in request.query_params.getlist(key))
+    renderer = getattr(request, 'accepted_renderer', None)
+    return hashlib.md5(repr((request.build_absolute_uri(request.path), params,
+                             renderer and renderer.format)).encode()).hexdigest()
+
+
+def make_etag(value):
+    return f'"{hashlib.md5(value.encode()).hexdigest()}"'
+
+
+def etag_matches(request, etag):
+    """
+    Совпадает ли ETag с заголовком If-None-Match (слабое сравнение, как требует RFC 9110).
+    """
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag in (value.removeprefix('W/') for value in etags)
+
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
+
+
+def catalog_cache_key(view, request, shop_scoped=False):
+    """
+    Ключ кеша ответа: представление, адрес, нормализованные параметры запроса и версия каталога.
+    Версия магазина вместо глобальной используется, только если shop_scoped.
+    """
+    shop_id = request.query_params.get('shop_id', '')
+    shop_id = shop_id if shop_scoped and shop_id.isdigit() else ''
+    version = get_catalog_version(int(shop_id) if shop_id else None)
+    return f'catalog:{type(view).__name__}:{shop_id}:{version}:{request_digest(request)}'
+
+
+def cache_catalog_response(method=None, *, shop_scoped=False):
+    """
+    Декоратор метода get представления каталога: успешные ответы кешируются
+    на settings.CATALOG_CACHE_TIMEOUT секунд в пределах версии каталога и получают ETag.
+
+    Args:
+        shop_scoped (bool): представление с параметром shop_id отдает только товары этого магазина,
+            поэтому такие ответы зависят от версий shared и магазина, а не от глобальной.
+    """
+    if method is None:
+        return partial(cache_catalog_response, shop_scoped=shop_scoped)
+
+    @wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        key = catalog_cache_key(view, request, shop_scoped)
+        etag = make_etag(key)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        cached = cache.get(key)
+        if cached is not None:
+            kind, value = cached
+            response = HttpResponse(value, content_type='application/json') if kind == 'raw' else Response(value)
+            response['ETag'] = etag
+            return response
+        response = method(view, request, *args, **kwargs)
+        if response.status_code == 200:
+            # готовый JSON кешируется как есть, ответы DRF - в виде данных для рендеринга
+            cached = ('data', response.data) if isinstance(response, Response) else ('raw', response.content)
+            cache.set(key, cached, settings.CATALOG_CACHE_TIMEOUT)
+            response['ETag'] = etag
+        return response
+    return wrapper
+
+
+def conditional_order_response(method):
+    """
+    Декоратор метода get корзины и заказов: ETag строится из версии заказов пользователя
+    и глобальной версии каталога, при совпадении с If-None-Match ответ не строится.
+    """
+    @wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return method(view, request, *args, **kwargs)
+        version = get_versions([order_scope(request.user.id), GLOBAL_SCOPE])
+        etag = make_etag(f'{type(view).__name__}:{request.user.id}:{version}:{request_digest(request)}')
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response = method(view, request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+        return response
+    return wrapper
+
+
+def render_json(data):
+    """
+    Сериализует данные в JSON так же, как JSONRenderer в ответах API.
+    """
+    # JSONRenderer превращает None в пустой ответ, а не в null
+    return b'null' if data is None else JSONRenderer().render(data)
+
+
+def render_card(info, parameters):
+    """
+    Собирает карточку товара в формате ProductInfoSerializer.
+
+    Args:
+        info (dict): поля ProductInfo, продукта и категории.
+        parameters (list): пары (название параметра, значение) в порядке создания.
+
+    Returns:
+        dict: карточка товара.
+    """
+    return {
+        'id': info['id'],
+        'model': info['model'],
+        'product': {'name': info['product__name'], 'category': info['product__category__name']},
+        'shop': info['shop_id'],
+        'quantity': info['quantity'],
+        'price': info['price'],
+        'price_rrc': info['price_rrc'],
+        'product_parameters': [{'parameter': name, 'value': value} for name, value in parameters],
+        'parameters': dict(parameters),
+    }
+
+
+def search_document(info, parameters):
+    """
+    Текст карточки для полнотекстового поиска: название продукта, модель и значения характеристик.
+    """
+    return '\n'.join([info['product__name'], info['model'], *(value for _, value in parameters)])
+
+
+def variant_group(model):
+    """
+    Группа вариантов товара: путь модели (apple/iphone/xr) без учета регистра и лишних косых черт.
+    Товары без модели вариантов не имеют.
+    """
+    return '/'.join(part.strip() for part in model.lower().split('/') if part.strip())
+
+
+class CatalogChanges:
+    """
+    Продукты и пары (категория, магазин), сводки предложений и счетчики которых нужно пересчитать,
+    и признак names - изменился набор названий и моделей товаров в продаже.
+
+    Импорт и обновление остатков накапливают их за всю транзакцию и пересчитывают одним вызовом
+    apply в ее конце: продукты, а затем счетчики пар блокируются один раз в порядке
+    возрастания ключей, поэтому параллельные транзакции пересчитывают сводки общих продуктов
+    и счетчики общих пар по очереди и не блокируют друг друга взаимно.
+    """
+
+    def __init__(self, products=(), pairs=(), names=False):
+        self.products = set(products)
+        self.pairs = set(pairs)
+        self.names = names
+
+    def apply(self, batch_size=None):
+        """
+        Пересчитывает накопленные сводки и счетчики, увеличивает версию names, если она изменилась,
+        и очищает накопленное.
+        """
+        refresh_offer_summaries(self.products, batch_size)
+        refresh_category_counts(self.pairs)
+        if self.names:
+            bump_versions([NAMES_SCOPE])
+        self.products, self.pairs, self.names = set(), set(), False
+
+
+def refresh_product_cards(product_infos, batch_size=None, changes=None):
+    """
+    Пересобирает карточки товаров пачками: на пачку три запроса на чтение и один upsert.
+    После карточек пересчитываются сводки предложений их продуктов и счетчики товаров пар
+    (категория, магазин), в которые карточки вошли или из которых вышли. Версия names
+    увеличивается, если у карточки изменился текст для поиска или признак продажи.
+
+    Args:
+        product_infos (QuerySet | iterable): ProductInfo или их id.
+        batch_size (int): размер пачки, по умолчанию settings.IMPORT_BATCH_SIZE.
+        changes (CatalogChanges): если передан, сводки и счетчики не пересчитываются сразу,
+            а добавляются к накопленным изменениям.
+    """
+    batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+    if hasattr(product_infos, 'values_list'):
+        product_infos = product_infos.order_by().values_list('id', flat=True).distinct()
+    ids = sorted(set(product_infos))
+    pending = CatalogChanges() if changes is None else changes
+    products, pairs = pending.products, pending.pairs
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        # (категория, магазин, в продаже) карточек до пересборки; продукты, к которым товары относились
+        # до пересборки, тоже пересчитываются: товар мог перейти к другому продукту
+        previous, texts = {}, {}
+        for product_info_id, product_id, category_id, shop_id, is_active, shop_state, search_text in \
+                ProductCard.objects.filter(product_info_id__in=chunk).values_list(
+                    'product_info_id', 'product_id', 'category_id', 'shop_id', 'is_active', 'shop_state',
+                    'search_text'):
+            previous[product_info_id] = (category_id, shop_id, is_active and shop_state)
+            texts[product_info_id] = search_text
+            products.add(product_id)
+        parameters = {}
+        for product_info_id, name, value in ProductParameter.objects.filter(
+                product_info_id__in=chunk).order_by('id').values_list('product_info_id', 'parameter__name', 'value'):
+            parameters.setdefault(product_info_id, []).append((name, value))
+        infos = ProductInfo.objects.filter(id__in=chunk).values(
+            'id', 'model', 'product_id', 'shop_id', 'quantity', 'price', 'price_rrc', 'is_active', 'shop__state',
+            'product__name', 'product__category_id', 'product__category__name')
+        cards = [
+            ProductCard(product_info_id=info['id'], product_id=info['product_id'], shop_id=info['shop_id'],
+                        category_id=info['product__category_id'], is_active=info['is_active'],
+                        shop_state=info['shop__state'],
+                        card=render_json(render_card(info, parameters.get(info['id'], []))).decode(),
+                        search_text=search_document(info, parameters.get(info['id'], [])),
+                        variant_group=variant_group(info['model']))
+            for info in infos
+        ]
+        products.update(info['product_id'] for info in infos)
+        for card in cards:
+            current = (card.category_id, card.shop_id, card.is_active and card.shop_state)
+            old = previous.get(card.product_info_id)
+            if old != current:
+                pairs.update(state[:2] for state in (old, current) if state)
+            if old != current or texts.get(card.product_info_id) != card.search_text:
+                pending.names = True
+        ProductCard.objects.bulk_create(cards, update_conflicts=True, unique_fields=['product_info'],
+                                        update_fields=['product', 'shop', 'category', 'is_active', 'shop_state',
+                                                       'card', 'search_text', 'variant_group'])
+    if changes is None:
+        pending.apply(batch_size)
@@ -0,0 +1,89 @@
+"""
+Счетчики товаров в продаже по категориям и магазинам.
+
+CategoryView отдает количество товаров каждой категории из таблицы CategoryOfferCount, а не
+подсчетом по ProductInfo. Счетчик пары (категория, магазин) пересчитывается, только когда
+меняется состав ее карточек: refresh_product_cards сравнивает прежние и новые категорию,
+магазин и признак продажи карточек, поэтому обновление цен и остатков счетчики не трогает.
+Снятие товаров с продажи и удаление товаров при импорте, смена статуса магазина и удаления
+в админке пересчитывают пары затронутых карточек. Пересчет выполняется по индексам карточек
+(category, product_info) и (shop, product_info) только для затронутых пар: условие отбора
+перечисляет сами пары, а не все сочетания их категорий и магазинов.
+
+Счетчик записывается абсолютным значением, посчитанным по данным, видимым транзакции,
+поэтому на PostgreSQL перед подсчетом строки счетчиков блокируются (недостающие сначала
+создаются): параллельные транзакции пересчитывают общую пару по очереди, и последняя
+учитывает изменения, зафиксированные предыдущими.
+"""
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db import connection, transaction
+from django.db.models import Count, Q
+
+from backend.models import ProductCard, CategoryOfferCount
+
+
+def category_pairs(cards):
+    """
+    Возвращает пары (id категории, id магазина) карточек.
+
+    Args:
+        cards (QuerySet): карточки ProductCard.
+    """
+    return set(cards.order_by().values_list('category_id', 'shop_id').distinct())
+
+
+def pairs_filter(pairs):
+    """
+    Условие отбора строк ровно указанных пар: категории сгруппированы по магазинам, поэтому
+    в условии столько слагаемых OR, сколько магазинов.
+
+    Args:
+        pairs (iterable): пары (id категории, id магазина).
+    """
+    categories = defaultdict(set)
+    for category_id, shop_id in pairs:
+        categories[shop_id].add(category_id)
+    return reduce(or_, (Q(shop_id=shop_id, category_id__in=sorted(category_ids))
+                        for shop_id, category_ids in sorted(categories.items())))
+
+
+def lock_counts(pairs):
+    """
+    Блокирует строки счетчиков пар до конца транзакции в порядке (категория, магазин),
+    предварительно создавая недостающие.
+
+    Args:
+        pairs (list): отсортированные пары (id категории, id магазина).
+    """
+    if not connection.features.has_select_for_update:
+        return
+    CategoryOfferCount.objects.bulk_create(
+        [CategoryOfferCount(category_id=category_id, shop_id=shop_id, count=0) for category_id, shop_id in pairs],
+        ignore_conflicts=True)
+    locked = CategoryOfferCount.objects.filter(pairs_filter(pairs)).order_by('category_id', 'shop_id')
+    list(locked.select_for_update().values_list('id', flat=True))
+
+
+def refresh_category_counts(pairs):
+    """
+    Пересчитывает счетчики пар (категория, магазин): один запрос на чтение и один upsert.
+
+    Args:
+        pairs (iterable): пары (id категории, id магазина); карточки без категории не учитываются.
+    """
+    pairs = sorted({(category_id, shop_id) for category_id, shop_id in pairs if category_id is not None})
+    if not pairs:
+        return
+    # блокировка держится до конца внешней транзакции, если она есть
+    with transaction.atomic(savepoint=False):
+        lock_counts(pairs)
+        cards = ProductCard.objects.filter(pairs_filter(pairs), is_active=True, shop_state=True).order_by()
+        counts = {(category_id, shop_id): total for category_id, shop_id, total in cards.values_list(
+            'category_id', 'shop_id').annotate(total=Count('product_info'))}
+        CategoryOfferCount.objects.bulk_create(
+            [CategoryOfferCount(category_id=category_id, shop_id=shop_id, count=counts.get((category_id, shop_id), 0))
+             for category_id, shop_id in pairs],
+            update_conflicts=True, unique_fields=['category', 'shop'], update_fields=['count'])
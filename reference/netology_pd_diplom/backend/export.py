@@ -0,0 +1,61 @@
+"""
+Потоковая выгрузка каталога.
+
+Карточки товаров читаются серверным курсором (QuerySet.iterator с chunk_size) и сразу
+пишутся в ответ StreamingHttpResponse пачками по settings.EXPORT_CHUNK_SIZE строк,
+поэтому потребление памяти не зависит от размера каталога. Карточки уже содержат
+готовый JSON товара (см. backend.catalog), так что NDJSON - это просто строки карточек,
+а для CSV карточка разбирается и раскладывается по столбцам.
+"""
+import csv
+import io
+
+from django.conf import settings
+from ujson import loads as load_json, dumps as dump_json
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+CSV_COLUMNS = ('id', 'model', 'name', 'category', 'shop', 'quantity', 'price', 'price_rrc', 'parameters')
+
+
+def csv_row(card):
+    card = load_json(card)
+    return (card['id'], card['model'], card['product']['name'], card['product']['category'], card['shop'],
+            card['quantity'], card['price'], card['price_rrc'], dump_json(card['parameters'], ensure_ascii=False))
+
+
+def export_cards(cards, file_format, chunk_size=None):
+    """
+    Выгружает карточки товаров построчно.
+
+    Args:
+        cards (QuerySet): карточки ProductCard.
+        file_format (str): ndjson или csv.
+        chunk_size (int): количество строк, читаемых из курсора и отдаваемых клиенту за раз,
+            по умолчанию settings.EXPORT_CHUNK_SIZE.
+
+    Yields:
+        str: очередная пачка строк выгрузки.
+    """
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if file_format == 'csv':
+        writer.writerow(CSV_COLUMNS)
+
+    rows = 0
+    for card in cards.order_by('product_info').values_list('card', flat=True).iterator(chunk_size=chunk_size):
+        if file_format == 'csv':
+            writer.writerow(csv_row(card))
+        else:
+            buffer.write(card)
+            buffer.write('\n')
+        rows += 1
+        if rows % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
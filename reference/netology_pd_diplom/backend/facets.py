@@ -0,0 +1,148 @@
+"""
+Фильтрация каталога по характеристикам товаров и подсчет фасетов.
+
+Фильтр задается параметром запроса param=<название>:<значение>, который можно повторять:
+значения одной характеристики объединяются через ИЛИ, разные характеристики - через И.
+Вместо значения можно указать диапазон чисел <от>..<до> (границы включаются, любую можно
+опустить): он проверяется по ProductParameter.value_numeric с индексом
+(parameter, value_numeric, product_info).
+
+Инвертированным индексом служит сама таблица ProductParameter с индексом
+(parameter, value, product_info): для каждой характеристики id подходящих товаров читаются
+из индекса без обращения к таблице, а товары, подходящие под все характеристики, находятся
+пересечением этих множеств (INTERSECT), а не цепочкой JOIN. Индекс обновляется вместе
+с характеристиками товаров при импорте.
+
+Счетчики фасетов для характеристики из фильтра считаются без ее собственного условия,
+чтобы покупатель видел, сколько товаров даст выбор другого значения.
+"""
+from django.db.models import Count, Q
+
+from backend.models import Parameter, ProductParameter, parse_numeric
+
+PARAMETER_FILTER = 'param'
+
+
+def parse_parameter_filters(values):
+    """
+    Разбирает значения параметра запроса param.
+
+    Args:
+        values (list): строки вида <название>:<значение>.
+
+    Returns:
+        dict: значения по названиям характеристик.
+
+    Raises:
+        ValueError: строка не содержит названия или значения.
+    """
+    filters = {}
+    for item in values:
+        name, _, value = item.partition(':')
+        if not name.strip() or not value.strip():
+            raise ValueError(f'Неверный фильтр по характеристике: {item}')
+        filters.setdefault(name.strip(), []).append(value.strip())
+    return filters
+
+
+def parse_range(value):
+    """
+    Разбирает диапазон вида <от>..<до>.
+
+    Returns:
+        tuple: границы диапазона (None - без ограничения) или None, если значение не является диапазоном.
+    """
+    low, separator, high = value.partition('..')
+    if not separator or not (low or high):
+        return None
+    bounds = tuple(parse_numeric(bound) if bound else None for bound in (low, high))
+    if any(bound and parsed is None for bound, parsed in zip((low, high), bounds)):
+        return None
+    return bounds
+
+
+def value_condition(values):
+    """
+    Условие на значение характеристики: точные значения и диапазоны объединяются через ИЛИ.
+    """
+    exact = [value for value in values if parse_range(value) is None]
+    condition = Q(value__in=exact) if exact else Q()
+    for low, high in filter(None, map(parse_range, values)):
+        bounds = Q(value_numeric__isnull=False)
+        if low is not None:
+            bounds &= Q(value_numeric__gte=low)
+        if high is not None:
+            bounds &= Q(value_numeric__lte=high)
+        condition = condition | bounds if condition else bounds
+    return condition
+
+
+def matching_product_infos(filters, parameter_ids):
+    """
+    Запрос id товаров, подходящих под все фильтры: пересечение множеств по каждой характеристике.
+    """
+    sets = [ProductParameter.objects.filter(value_condition(values), parameter_id=parameter_ids[name])
+            .order_by().values('product_info') for name, values in filters.items()]
+    return sets[0].intersection(*sets[1:]) if len(sets) > 1 else sets[0]
+
+
+def filter_by_parameters(cards, filters, parameter_ids=None):
+    """
+    Оставляет карточки товаров, подходящих под фильтры по характеристикам.
+
+    Args:
+        cards (QuerySet): карточки ProductCard.
+        filters (dict): значения по названиям характеристик (parse_parameter_filters).
+        parameter_ids (dict): id характеристик по названиям, если уже известны.
+
+    Returns:
+        QuerySet: отфильтрованные карточки.
+    """
+    if not filters:
+        return cards
+    if parameter_ids is None:
+        parameter_ids = get_parameter_ids(filters)
+    if len(parameter_ids) < len(filters):
+        # характеристики с таким названием нет ни у одного товара
+        return cards.none()
+    return cards.filter(product_info__in=matching_product_infos(filters, parameter_ids))
+
+
+def get_parameter_ids(filters):
+    """
+    Возвращает id характеристик из фильтра по их названиям.
+    """
+    return dict(Parameter.objects.filter(name__in=filters).values_list('name', 'id'))
+
+
+def facet_counts(cards, filters):
+    """
+    Считает товары по значениям характеристик.
+
+    Args:
+        cards (QuerySet): карточки ProductCard без фильтров по характеристикам.
+        filters (dict): значения по названиям характеристик.
+
+    Returns:
+        dict: {название характеристики: {значение: количество товаров}}.
+    """
+    parameter_ids = get_parameter_ids(filters)
+    facets = {}
+    if len(parameter_ids) < len(filters):
+        return facets
+
+    def count(parameters, matching):
+        for name, value, total in parameters.filter(product_info__in=matching.values('product_info')).order_by() \
+                .values_list('parameter__name', 'value').annotate(total=Count('id')) \
+                .order_by('parameter__name', 'value'):
+            facets.setdefault(name, {})[value] = total
+
+    # характеристики вне фильтра - по товарам, подходящим под все фильтры
+    count(ProductParameter.objects.exclude(parameter_id__in=parameter_ids.values()),
+          filter_by_parameters(cards, filters, parameter_ids))
+    # характеристика из фильтра - по товарам, подходящим под остальные фильтры
+    for name, parameter_id in parameter_ids.items():
+        others = {key: values for key, values in filters.items() if key != name}
+        count(ProductParameter.objects.filter(parameter_id=parameter_id),
+              filter_by_parameters(cards, others, parameter_ids))
+    return facets
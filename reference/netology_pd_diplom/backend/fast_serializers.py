@@ -0,0 +1,128 @@
+"""
+Быстрая сериализация заказов и корзины.
+
+JSON в формате OrderSerializer собирается из values/values_list не более чем тремя запросами
+на страницу (заказы, позиции, характеристики) и кодируется ujson в те же байты, что и у
+JSONRenderer. Запросы к полям, не выбранным через backend.sparse, пропускаются.
+
+Включается настройкой settings.FAST_SERIALIZATION для ответов в формате JSON;
+для Browsable API и при выключенной настройке используются сериализаторы DRF.
+Скорость сравнивается командой benchmark_serialization.
+"""
+from operator import itemgetter
+
+from django.conf import settings
+from django.db.models import Sum, F
+from rest_framework.fields import DateTimeField
+from ujson import dumps
+
+from backend.models import OrderItem, ProductParameter
+from backend.sparse import ORDER_FIELDS, ORDER_EXPANSIONS, Fieldset
+
+CONTACT_FIELDS = ('id', 'city', 'street', 'house', 'structure', 'building', 'apartment', 'phone')
+CONTACT_COLUMNS = ('contact_id', *(f'contact__{name}' for name in CONTACT_FIELDS[1:]))
+ITEM_COLUMNS = ('order_id', 'id', 'quantity', 'product_info_id', 'product_info__model',
+                'product_info__product__name', 'product_info__product__category__name', 'product_info__shop_id',
+                'product_info__quantity', 'product_info__price', 'product_info__price_rrc')
+
+# значения контакта из строки заказа в порядке полей ContactSerializer
+get_contact = itemgetter(*CONTACT_COLUMNS)
+format_datetime = DateTimeField().to_representation
+DEFAULT_FIELDSET = Fieldset(ORDER_FIELDS, frozenset(ORDER_EXPANSIONS), is_default=True)
+
+
+def use_fast_serialization(request):
+    """
+    Можно ли отдать ответ быстрым путем: настройка включена и клиент запросил JSON.
+    """
+    return settings.FAST_SERIALIZATION and request.accepted_renderer.format == 'json'
+
+
+def dump_json(data):
+    """
+    Кодирует данные в JSON, побайтно совпадающий с выводом JSONRenderer.
+    """
+    content = dumps(data, ensure_ascii=False, escape_forward_slashes=False)
+    # JSONRenderer экранирует разделители строк, недопустимые в JavaScript
+    return content.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+def order_rows(queryset, fieldset=DEFAULT_FIELDSET):
+    """
+    Запрос строк заказов для serialize_orders: только нужные столбцы и сумма заказа,
+    если она выводится. Строки - словари, чтобы по ним работала курсорная пагинация.
+    """
+    columns = ['id', 'state', 'dt']
+    if 'contact' in fieldset:
+        columns.extend(CONTACT_COLUMNS if fieldset.expands('contact') else CONTACT_COLUMNS[:1])
+    queryset = queryset.values(*columns)
+    if 'total_sum' in fieldset:
+        queryset = queryset.annotate(
+            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price')))
+    return queryset
+
+
+def order_items(order_ids, fieldset):
+    """
+    Позиции заказов в формате OrderItemSerializer или OrderItemCreateSerializer
+    в зависимости от раскрытых связей.
+
+    Returns:
+        dict: списки позиций по id заказов.
+    """
+    items = {}
+    queryset = OrderItem.objects.filter(order_id__in=order_ids).order_by('id')
+    if not fieldset.expands('product_info'):
+        for order_id, pk, product_info_id, quantity in queryset.values_list(
+                'order_id', 'id', 'product_info_id', 'quantity'):
+            items.setdefault(order_id, []).append({'id': pk, 'product_info': product_info_id, 'quantity': quantity})
+        return items
+
+    with_parameters = fieldset.expands('product_parameters')
+    product_infos = {}
+    for row in queryset.values_list(*ITEM_COLUMNS):
+        product_info = product_infos.get(row[3])
+        if product_info is None:
+            product_info = product_infos[row[3]] = {
+                'id': row[3], 'model': row[4], 'product': {'name': row[5], 'category': row[6]},
+                'shop': row[7], 'quantity': row[8], 'price': row[9], 'price_rrc': row[10]}
+            if with_parameters:
+                product_info['product_parameters'] = []
+        items.setdefault(row[0], []).append({'id': row[1], 'product_info': product_info, 'quantity': row[2]})
+
+    if with_parameters:
+        for product_info_id, name, value in ProductParameter.objects.filter(
+                product_info_id__in=list(product_infos)).order_by('id').values_list(
+                'product_info_id', 'parameter__name', 'value'):
+            product_infos[product_info_id]['product_parameters'].append({'parameter': name, 'value': value})
+    return items
+
+
+def serialize_orders(rows, fieldset=DEFAULT_FIELDSET):
+    """
+    Собирает заказы в формате OrderSerializer.
+
+    Args:
+        rows (iterable): строки order_rows.
+        fieldset (Fieldset): выводимые поля и раскрываемые связи.
+
+    Returns:
+        list: заказы с позициями.
+    """
+    rows = list(rows)
+    items = order_items([row['id'] for row in rows], fieldset) if 'ordered_items' in fieldset else {}
+    if fieldset.expands('contact'):
+        def contact(row):
+            return None if row['contact_id'] is None else dict(zip(CONTACT_FIELDS, get_contact(row)))
+    else:
+        contact = itemgetter('contact_id')
+    getters = {
+        'id': itemgetter('id'),
+        'ordered_items': lambda row: items.get(row['id'], []),
+        'state': itemgetter('state'),
+        'dt': lambda row: format_datetime(row['dt']),
+        'total_sum': itemgetter('total_sum'),
+        'contact': contact,
+    }
+    selected = [(name, getters[name]) for name in fieldset.fields]
+    return [{name: get(row) for name, get in selected} for row in rows]
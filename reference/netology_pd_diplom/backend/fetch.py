@@ -0,0 +1,191 @@
+"""
+Загрузка прайс-листов.
+
+Прайс-лист открывается для потокового чтения вместе с метаданными загрузки:
+ETag, Last-Modified и SHA-256 содержимого. По ним задача импорта определяет,
+что поставщик повторно опубликовал тот же файл, и пропускает работу с базой.
+
+HTTP-запросы выполняются через общую для процесса сессию requests с пулом соединений,
+поэтому при обновлении многих магазинов воркер переиспользует TCP/TLS-соединения.
+Запросы ограничены таймаутами подключения и чтения, общим временем загрузки и размером
+тела ответа; ошибки подключения и ответы 429/5xx повторяются с экспоненциальной задержкой.
+Параметры задаются в settings (PRICE_LIST_*).
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from django.conf import settings
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Размер блока при чтении и хешировании файла
+READ_CHUNK_SIZE = 64 * 1024
+# Ответы, при которых запрос повторяется
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+class PriceListTooLarge(ValueError):
+    """
+    Прайс-лист превышает settings.PRICE_LIST_MAX_SIZE.
+    """
+
+
+class PriceListTimeout(ValueError):
+    """
+    Прайс-лист не удалось загрузить за settings.PRICE_LIST_DOWNLOAD_TIMEOUT.
+    """
+
+
+def get_session():
+    """
+    Возвращает сессию requests текущего процесса. Сессия создается заново после fork,
+    чтобы дочерние процессы воркера не делили соединения родителя.
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = create_session()
+                _session_pid = pid
+    return _session
+
+
+def create_session():
+    """
+    Создает сессию requests с пулом соединений и повтором запросов.
+    """
+    retry = Retry(total=settings.PRICE_LIST_RETRIES, backoff_factor=settings.PRICE_LIST_RETRY_BACKOFF,
+                  status_forcelist=RETRY_STATUSES, allowed_methods=frozenset(['GET']), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=settings.PRICE_LIST_POOL_SIZE, pool_maxsize=settings.PRICE_LIST_POOL_SIZE,
+                          max_retries=retry)
+    session = Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get(url, **kwargs):
+    """
+    Выполняет GET-запрос через сессию процесса с таймаутами из settings.
+    """
+    kwargs.setdefault('timeout', (settings.PRICE_LIST_CONNECT_TIMEOUT, settings.PRICE_LIST_READ_TIMEOUT))
+    return get_session().get(url, **kwargs)
+
+
+def check_size(size):
+    """
+    Проверяет, что размер прайс-листа не превышает допустимый.
+    """
+    if settings.PRICE_LIST_MAX_SIZE and size > settings.PRICE_LIST_MAX_SIZE:
+        raise PriceListTooLarge(f'Размер прайс-листа превышает {settings.PRICE_LIST_MAX_SIZE} байт')
+
+
+class PriceListSource:
+    """
+    Открытый прайс-лист и метаданные его загрузки.
+
+    Attributes:
+        stream (file): бинарный файл с прайс-листом или None, если содержимое не изменилось.
+        content_type (str): Content-Type ответа (для локальных файлов - None).
+        etag (str): заголовок ETag ответа.
+        last_modified (str): заголовок Last-Modified ответа.
+        content_hash (str): SHA-256 содержимого.
+        not_modified (bool): содержимое совпадает с ранее загруженным.
+    """
+
+    def __init__(self, stream=None, content_type=None, etag='', last_modified='', content_hash='',
+                 not_modified=False):
+        self.stream = stream
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+        self.not_modified = not_modified
+
+    def metadata(self):
+        """
+        Возвращает метаданные загрузки в виде словаря, пригодного для передачи в задачу Celery.
+        """
+        return {'etag': self.etag, 'last_modified': self.last_modified, 'content_hash': self.content_hash}
+
+
+def hash_file(file):
+    """
+    Считает SHA-256 файла блоками и возвращает указатель в начало файла.
+    """
+    digest = hashlib.sha256()
+    for block in iter(lambda: file.read(READ_CHUNK_SIZE), b''):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+@contextmanager
+def open_price_list(url, etag='', last_modified='', content_hash=''):
+    """
+    Открывает прайс-лист для потокового чтения.
+
+    Локальный файл (file://) хешируется и читается напрямую. По HTTP отправляется условный запрос
+    с If-None-Match и If-Modified-Since; ответ 304 означает, что файл не изменился, иначе тело
+    ответа сохраняется во временный файл с подсчетом хеша, не занимая память.
+    Загрузка прерывается, если тело ответа больше settings.PRICE_LIST_MAX_SIZE
+    или не получено целиком за settings.PRICE_LIST_DOWNLOAD_TIMEOUT секунд.
+
+    Args:
+        url (str): URL или путь к файлу с прайс-листом.
+        etag (str): ETag предыдущей загрузки.
+        last_modified (str): Last-Modified предыдущей загрузки.
+        content_hash (str): хеш содержимого предыдущей загрузки.
+
+    Returns:
+        PriceListSource: открытый прайс-лист.
+    """
+    if url.startswith('file://'):
+        with open(urlparse(url).path, 'rb') as stream:
+            source = PriceListSource(stream, content_hash=hash_file(stream))
+            source.not_modified = source.content_hash == content_hash
+            yield source
+        return
+
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    with get(url, headers=headers, stream=True) as response:
+        if response.status_code == 304:
+            yield PriceListSource(etag=etag, last_modified=last_modified, content_hash=content_hash,
+                                  not_modified=True)
+            return
+        response.raise_for_status()
+        content_length = response.headers.get('Content-Length')
+        if content_length and content_length.isdigit():
+            check_size(int(content_length))
+        deadline = time.monotonic() + settings.PRICE_LIST_DOWNLOAD_TIMEOUT
+        with tempfile.TemporaryFile() as stream:
+            digest = hashlib.sha256()
+            size = 0
+            for block in response.iter_content(READ_CHUNK_SIZE):
+                size += len(block)
+                check_size(size)
+                if time.monotonic() > deadline:
+                    raise PriceListTimeout(f'Прайс-лист не загружен за {settings.PRICE_LIST_DOWNLOAD_TIMEOUT} с')
+                digest.update(block)
+                stream.write(block)
+            stream.seek(0)
+            source = PriceListSource(stream, response.headers.get('Content-Type'),
+                                     response.headers.get('ETag', ''), response.headers.get('Last-Modified', ''),
+                                     digest.hexdigest())
+            source.not_modified = source.content_hash == content_hash
+            yield source
@@ -0,0 +1,541 @@
+"""
+Движок импорта прайс-листов.
+
+Используется задачей do_import, представлением PartnerUpdate и командой load_shop_data.
+Вместо отдельного запроса на каждый товар и параметр идентификаторы категорий,
+продуктов и параметров берутся из словарей, загруженных один раз, а записи
+ProductInfo и ProductParameter создаются через bulk_create пачками.
+
+Поддерживаются два режима:
+- replace: товары магазина удаляются и создаются заново;
+- diff: товары сопоставляются с существующими по (магазин, external_id), изменяются
+  только отличающиеся строки, а пропавшие из прайс-листа снимаются с продажи.
+
+Для частого обновления цен и остатков без полного импорта служит StockUpdater.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from backend.catalog import CatalogChanges, bump_catalog_version, refresh_product_cards
+from backend.models import Category, Product, ProductInfo, Parameter, ProductParameter, ProductCard, ShopImportState, \
+    parse_numeric
+from backend.counters import category_pairs
+from backend.offers import offer_products
+
+logger = logging.getLogger(__name__)
+
+IMPORT_MODES = ('replace', 'diff')
+
+# Поля ProductInfo, которые сравниваются при дифференциальном импорте
+PRODUCT_INFO_FIELDS = ('product_id', 'model', 'price', 'price_rrc', 'quantity')
+
+# Поля ProductInfo, которые меняет обновление цен и остатков, в порядке следования в кортеже
+STOCK_FIELDS = ('price', 'price_rrc', 'quantity')
+
+
+class QueryCounter:
+    """
+    Контекстный менеджер для подсчета SQL-запросов.
+    Работает через execute_wrapper, поэтому не требует DEBUG=True.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._wrapper = None
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+
+class PriceListImporter:
+    """
+    Импорт прайс-листа магазина в одной транзакции.
+
+    Args:
+        shop (Shop): магазин, каталог которого обновляется.
+        batch_size (int): размер пачки для bulk_create, по умолчанию settings.IMPORT_BATCH_SIZE.
+        mode (str): режим импорта, replace или diff.
+        progress (callable): вызывается после каждой пачки с количеством обработанных товаров.
+    """
+
+    def __init__(self, shop, batch_size=None, mode='replace', progress=None):
+        if mode not in IMPORT_MODES:
+            raise ValueError(f'Неизвестный режим импорта: {mode}')
+        self.shop = shop
+        self.batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        self.mode = mode
+        self.progress = progress
+        # категории прайс-листа, уже созданные и привязанные к магазину
+        self.categories = set()
+        # (название, id категории) -> id продукта
+        self.products = {}
+        # категории, продукты которых уже загружены в self.products
+        self.loaded_categories = set()
+        # название параметра -> id параметра
+        self.parameters = {}
+        # id записей ProductInfo, встретившихся в прайс-листе (для режима diff)
+        self.seen = set()
+        # сводки и счетчики, пересчитываемые в конце транзакции (см. CatalogChanges)
+        self.changes = CatalogChanges()
+        self.stats = {
+            'shop_id': shop.id,
+            'mode': mode,
+            'goods': 0,
+            'inserted': 0,
+            'updated': 0,
+            'unchanged': 0,
+            'retired': 0,
+            'products_created': 0,
+            'parameters_created': 0,
+            'product_parameters': 0,
+        }
+
+    def run(self, data):
+        """
+        Выполняет импорт: категории, товары и удаление (replace) либо снятие с продажи (diff)
+        старых товаров магазина.
+
+        Args:
+            data (dict): прайс-лист с ключами shop, categories и goods.
+
+        Returns:
+            dict: статистика импорта (количество строк, запросов, время и скорость).
+        """
+        started = time.monotonic()
+        with QueryCounter() as counter, transaction.atomic():
+            self.import_categories(data.get('categories') or [])
+            self.load_parameters()
+            if self.mode == 'replace':
+                # Перед импортом новых товаров удаляем все старые товары этого магазина.
+                # Сводки их продуктов и счетчики их категорий пересчитываются после импорта:
+                # продуктов и категорий, которых нет в новом прайс-листе, могли лишиться товаров магазина.
+                self.changes.products.update(offer_products(ProductInfo.objects.filter(shop_id=self.shop.id)))
+                self.changes.pairs.update(category_pairs(ProductCard.objects.filter(shop_id=self.shop.id)))
+                self.changes.names = True
+                ProductInfo.objects.filter(shop_id=self.shop.id).delete()
+            self.import_goods(data.get('goods') or [])
+            if self.mode == 'diff':
+                self.retire_missing()
+            self.changes.apply(self.batch_size)
+            bump_catalog_version(self.shop.id)
+        return self.finish(started, counter)
+
+    def prepare(self, data, chunk_size):
+        """
+        Подготовка параллельного импорта: создает категории, продукты и параметры
+        и разбивает товары на чанки строк с уже разрешенными id.
+
+        Args:
+            data (dict): прайс-лист с ключами shop, categories и goods.
+            chunk_size (int): количество товаров в чанке.
+
+        Yields:
+            list: строки чанка для write_rows.
+        """
+        self.import_categories(data.get('categories') or [])
+        self.load_parameters()
+        chunk = []
+        for item in data.get('goods') or []:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                yield self.prepare_batch(chunk)
+                chunk = []
+        if chunk:
+            yield self.prepare_batch(chunk)
+
+    def finish(self, started, counter):
+        """
+        Дополняет статистику временем выполнения и количеством запросов и пишет ее в лог.
+        """
+        seconds = time.monotonic() - started
+        self.stats['queries'] = counter.count
+        self.stats['seconds'] = round(seconds, 3)
+        self.stats['rows_per_sec'] = round(self.stats['goods'] / seconds, 1) if seconds else 0
+        logger.info('Импорт прайс-листа магазина %s: %s', self.shop.id, self.stats)
+        return self.stats
+
+    def import_categories(self, categories):
+        """
+        Создает недостающие категории, обновляет названия существующих и привязывает их к магазину.
+        """
+        names = {category['id']: category['name'] for category in categories}
+        if not names:
+            return
+        existing = dict(Category.objects.filter(id__in=names).values_list('id', 'name'))
+        Category.objects.bulk_create(
+            [Category(id=category_id, name=name) for category_id, name in names.items()
+             if category_id not in existing])
+        renamed = [Category(id=category_id, name=name) for category_id, name in names.items()
+                   if category_id in existing and existing[category_id] != name]
+        if renamed:
+            Category.objects.bulk_update(renamed, ['name'])
+            # категории общие для всех магазинов
+            refresh_product_cards(ProductInfo.objects.filter(
+                product__category_id__in=[category.id for category in renamed]), self.batch_size, self.changes)
+            bump_catalog_version()
+        self.shop.categories.add(*names)
+        self.categories.update(names)
+
+    def load_parameters(self):
+        """
+        Загружает справочник параметров одним запросом.
+        """
+        self.parameters = dict(Parameter.objects.values_list('name', 'id'))
+
+    def import_goods(self, goods):
+        """
+        Загружает товары пачками по batch_size.
+
+        Args:
+            goods (iterable): товары прайс-листа, может быть генератором.
+        """
+        batch = []
+        for item in goods:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch)
+                batch = []
+        if batch:
+            self.write_batch(batch)
+
+    def write_batch(self, batch):
+        """
+        Записывает пачку товаров в соответствии с режимом импорта.
+        """
+        self.write_rows(self.prepare_batch(batch))
+
+    def prepare_batch(self, batch):
+        """
+        Разрешает id категорий, продуктов и параметров пачки и приводит товары к строкам ProductInfo.
+
+        Returns:
+            list: строки, пригодные для передачи в write_rows, в том числе через брокер Celery.
+        """
+        self.resolve_categories(batch)
+        self.resolve_products(batch)
+        self.resolve_parameters(batch)
+        return [self.clean(item) for item in batch]
+
+    def write_rows(self, rows):
+        """
+        Записывает подготовленные строки: вставкой (replace) или слиянием с существующими (diff),
+        и пересобирает карточки записанных товаров.
+        """
+        if self.mode == 'diff':
+            written = self.merge_rows(rows)
+        else:
+            written = self.insert_rows(rows)
+        refresh_product_cards(written, self.batch_size, self.changes)
+        self.stats['goods'] += len(rows)
+        if self.progress:
+            self.progress(self.stats['goods'])
+
+    def clean(self, item):
+        """
+        Приводит значения товара к типам полей ProductInfo.
+        Характеристики хранятся списком пар [id параметра, значение].
+        """
+        return {
+            'external_id': int(item['id']),
+            'product_id': self.products[(item['name'], item['category'])],
+            'model': str(item['model']),
+            'price': int(item['price']),
+            'price_rrc': int(item['price_rrc']),
+            'quantity': int(item['quantity']),
+            'parameters': [[self.parameters[name], str(value)]
+                           for name, value in (item.get('parameters') or {}).items()],
+        }
+
+    def insert_rows(self, rows):
+        """
+        Создает ProductInfo и ProductParameter через bulk_create.
+
+        Returns:
+            list: id созданных ProductInfo.
+        """
+        product_infos = ProductInfo.objects.bulk_create([
+            ProductInfo(shop_id=self.shop.id, external_id=row['external_id'],
+                        **{name: row[name] for name in PRODUCT_INFO_FIELDS})
+            for row in rows])
+        self.seen.update(product_info.id for product_info in product_infos)
+
+        product_parameters = [
+            ProductParameter(product_info_id=product_info.id, parameter_id=parameter_id, value=value,
+                             value_numeric=parse_numeric(value))
+            for row, product_info in zip(rows, product_infos)
+            for parameter_id, value in row['parameters']]
+        ProductParameter.objects.bulk_create(product_parameters, batch_size=self.batch_size)
+
+        self.stats['inserted'] += len(product_infos)
+        self.stats['product_parameters'] += len(product_parameters)
+        return [product_info.id for product_info in product_infos]
+
+    def merge_rows(self, rows):
+        """
+        Сопоставляет строки с существующими товарами магазина по external_id:
+        новые товары создаются, у существующих обновляются только изменившиеся поля и характеристики.
+
+        Returns:
+            list: id созданных и измененных ProductInfo.
+        """
+        # при повторе external_id внутри пачки побеждает последняя запись
+        rows = list({row['external_id']: row for row in rows}.values())
+        existing = {row['external_id']: row for row in ProductInfo.objects.filter(
+            shop_id=self.shop.id, external_id__in=[row['external_id'] for row in rows]).values(
+            'id', 'external_id', 'is_active', *PRODUCT_INFO_FIELDS)}
+
+        current_parameters = {}
+        for pk, product_info_id, parameter_id, value, numeric in ProductParameter.objects.filter(
+                product_info_id__in=[row['id'] for row in existing.values()]).values_list(
+                'id', 'product_info_id', 'parameter_id', 'value', 'value_numeric'):
+            current_parameters.setdefault(product_info_id, {})[parameter_id] = (pk, (value, numeric))
+
+        new_rows, changed_infos, written = [], [], []
+        new_parameters, changed_parameters, removed_parameters = [], [], []
+        for row in rows:
+            current_row = existing.get(row['external_id'])
+            if current_row is None:
+                new_rows.append(row)
+                continue
+            self.seen.add(current_row['id'])
+            fields = {name: row[name] for name in PRODUCT_INFO_FIELDS}
+            info_changed = not current_row['is_active'] or any(
+                current_row[name] != value for name, value in fields.items())
+            if info_changed:
+                changed_infos.append(ProductInfo(id=current_row['id'], is_active=True, **fields))
+
+            wanted = dict(row['parameters'])
+            current = current_parameters.get(current_row['id'], {})
+            parameters_changed = False
+            for parameter_id, value in wanted.items():
+                numeric = parse_numeric(value)
+                if parameter_id not in current:
+                    new_parameters.append(ProductParameter(product_info_id=current_row['id'],
+                                                           parameter_id=parameter_id, value=value,
+                                                           value_numeric=numeric))
+                    parameters_changed = True
+                elif current[parameter_id][1] != (value, numeric):
+                    # числовое значение сравнивается тоже, чтобы заполнить его у записей, созданных до его появления
+                    changed_parameters.append(ProductParameter(id=current[parameter_id][0], value=value,
+                                                               value_numeric=numeric))
+                    parameters_changed = True
+            for parameter_id, (pk, _) in current.items():
+                if parameter_id not in wanted:
+                    removed_parameters.append(pk)
+                    parameters_changed = True
+
+            if info_changed or parameters_changed:
+                self.stats['updated'] += 1
+                written.append(current_row['id'])
+            else:
+                self.stats['unchanged'] += 1
+
+        ProductInfo.objects.bulk_update(changed_infos, ['is_active', *PRODUCT_INFO_FIELDS],
+                                        batch_size=self.batch_size)
+        ProductParameter.objects.bulk_create(new_parameters, batch_size=self.batch_size)
+        ProductParameter.objects.bulk_update(changed_parameters, ['value', 'value_numeric'], batch_size=self.batch_size)
+        if removed_parameters:
+            ProductParameter.objects.filter(id__in=removed_parameters).delete()
+        self.stats['product_parameters'] += len(new_parameters) + len(changed_parameters)
+
+        if new_rows:
+            written.extend(self.insert_rows(new_rows))
+        return written
+
+    def retire_missing(self, delete=False):
+        """
+        Снимает с продажи товары магазина, которых не было в прайс-листе.
+        Записи не удаляются, поэтому позиции корзин и заказов сохраняются.
+        Сводки и счетчики затронутых товаров добавляются к self.changes.
+
+        Args:
+            delete (bool): удалить пропавшие товары вместе с зависимыми записями (режим replace).
+        """
+        queryset = ProductInfo.objects.filter(shop_id=self.shop.id)
+        if not delete:
+            queryset = queryset.filter(is_active=True)
+        missing = [product_info_id for product_info_id in queryset.values_list('id', flat=True)
+                   if product_info_id not in self.seen]
+        for start in range(0, len(missing), self.batch_size):
+            chunk = ProductInfo.objects.filter(id__in=missing[start:start + self.batch_size])
+            cards = ProductCard.objects.filter(product_info_id__in=missing[start:start + self.batch_size])
+            self.changes.products.update(offer_products(chunk))
+            self.changes.pairs.update(category_pairs(cards))
+            self.changes.names = True
+            if delete:
+                chunk.delete()
+            else:
+                chunk.update(is_active=False)
+                cards.update(is_active=False)
+        self.stats['deleted' if delete else 'retired'] = len(missing)
+
+    def resolve_categories(self, batch):
+        """
+        Создает категории, описанные в самих товарах (поле category_name),
+        для форматов без отдельного раздела categories, например CSV.
+        """
+        categories = {item['category']: item['category_name'] for item in batch
+                      if item.get('category_name') and item['category'] not in self.categories}
+        if categories:
+            self.import_categories([{'id': category_id, 'name': name} for category_id, name in categories.items()])
+
+    def resolve_products(self, batch):
+        """
+        Находит id продуктов пачки, создавая недостающие одним bulk_create.
+        Продукты категории подгружаются из базы при первом обращении к ней.
+        """
+        categories = {item['category'] for item in batch} - self.loaded_categories
+        if categories:
+            for name, category_id, product_id in Product.objects.filter(
+                    category_id__in=categories).values_list('name', 'category_id', 'id'):
+                self.products.setdefault((name, category_id), product_id)
+            self.loaded_categories |= categories
+
+        missing = {}
+        for item in batch:
+            key = (item['name'], item['category'])
+            if key not in self.products:
+                missing[key] = Product(name=item['name'], category_id=item['category'])
+        if missing:
+            for product in Product.objects.bulk_create(missing.values()):
+                self.products[(product.name, product.category_id)] = product.id
+            self.stats['products_created'] += len(missing)
+
+    def resolve_parameters(self, batch):
+        """
+        Создает отсутствующие в справочнике параметры пачки.
+        """
+        missing = {name for item in batch for name in (item.get('parameters') or {})
+                   if name not in self.parameters}
+        if missing:
+            for parameter in Parameter.objects.bulk_create([Parameter(name=name) for name in missing]):
+                self.parameters[parameter.name] = parameter.id
+            self.stats['parameters_created'] += len(missing)
+
+
+def clean_stock_item(item):
+    """
+    Приводит позицию обновления цен и остатков к кортежу (external_id, price, price_rrc, quantity).
+
+    Args:
+        item (list | dict): кортеж или словарь с ключами external_id, price, price_rrc и quantity.
+
+    Returns:
+        tuple: кортеж из четырех неотрицательных целых чисел.
+
+    Raises:
+        ValueError: позиция имеет неверный формат.
+    """
+    if isinstance(item, dict):
+        try:
+            item = [item['external_id'], *(item[name] for name in STOCK_FIELDS)]
+        except KeyError as error:
+            raise ValueError(f'Не указано поле {error.args[0]}')
+    if not isinstance(item, (list, tuple)) or len(item) != 1 + len(STOCK_FIELDS):
+        raise ValueError(f'Неверный формат позиции: {item}')
+    values = []
+    for value in item:
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError(f'Неверный формат позиции: {item}')
+        try:
+            number = int(value)
+        except ValueError:
+            raise ValueError(f'Неверный формат позиции: {item}')
+        if number < 0 or number != float(value):
+            raise ValueError(f'Неверный формат позиции: {item}')
+        values.append(number)
+    return tuple(values)
+
+
+def reset_import_state(*shop_ids):
+    """
+    Сбрасывает метаданные последней загрузки прайс-листа (ETag, Last-Modified, хеш) после изменения
+    товаров магазина в обход импорта. Иначе повторная загрузка неизмененного файла была бы пропущена
+    как not_modified, хотя данные в базе уже не совпадают с ним.
+
+    Args:
+        *shop_ids (int): ID магазинов, товары которых изменились.
+    """
+    ShopImportState.objects.filter(shop_id__in=shop_ids).update(etag='', last_modified='', content_hash='')
+
+
+class StockUpdater:
+    """
+    Обновление цен и остатков товаров магазина по external_id.
+
+    Продукты, категории и характеристики не затрагиваются: на каждую пачку выполняется
+    один запрос для поиска товаров, один bulk_update изменившихся строк и пересборка их карточек.
+
+    Args:
+        shop_id (int): ID магазина.
+        batch_size (int): размер пачки, по умолчанию settings.IMPORT_BATCH_SIZE.
+    """
+
+    def __init__(self, shop_id, batch_size=None):
+        self.shop_id = shop_id
+        self.batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        self.stats = {'shop_id': shop_id, 'items': 0, 'updated': 0, 'unchanged': 0, 'unknown': 0}
+        self.changes = CatalogChanges()
+
+    def run(self, items):
+        """
+        Применяет обновления цен и остатков.
+
+        Args:
+            items (iterable): кортежи (external_id, price, price_rrc, quantity).
+
+        Returns:
+            dict: статистика обновления.
+        """
+        started = time.monotonic()
+        with QueryCounter() as counter, transaction.atomic():
+            batch = []
+            for item in items:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    self.update_batch(batch)
+                    batch = []
+            if batch:
+                self.update_batch(batch)
+            self.changes.apply(self.batch_size)
+            if self.stats['updated']:
+                reset_import_state(self.shop_id)
+                bump_catalog_version(self.shop_id)
+        seconds = time.monotonic() - started
+        self.stats['queries'] = counter.count
+        self.stats['seconds'] = round(seconds, 3)
+        logger.info('Обновление цен и остатков магазина %s: %s', self.shop_id, self.stats)
+        return self.stats
+
+    def update_batch(self, batch):
+        """
+        Обновляет пачку позиций. При повторе external_id побеждает последняя позиция;
+        если в магазине несколько товаров с одним external_id, обновляются все.
+        """
+        wanted = {external_id: values for external_id, *values in batch}
+        self.stats['items'] += len(wanted)
+        changed, found, updated = [], set(), set()
+        for row in ProductInfo.objects.filter(shop_id=self.shop_id, external_id__in=list(wanted)).values(
+                'id', 'external_id', *STOCK_FIELDS):
+            found.add(row['external_id'])
+            values = dict(zip(STOCK_FIELDS, wanted[row['external_id']]))
+            if any(row[name] != value for name, value in values.items()):
+                changed.append(ProductInfo(id=row['id'], **values))
+                updated.add(row['external_id'])
+        ProductInfo.objects.bulk_update(changed, STOCK_FIELDS, batch_size=self.batch_size)
+        refresh_product_cards([info.id for info in changed], self.batch_size, self.changes)
+        self.stats['updated'] += len(updated)
+        self.stats['unchanged'] += len(found) - len(updated)
+        self.stats['unknown'] += len(wanted) - len(found)
@@ -0,0 +1,100 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from backend.benchmark import RUNNERS, FORMAT_EXTENSIONS, generate_price_lists, run_benchmark, existing_data, \
+    cleanup, environment, check_category_ids
+
+
+class Command(BaseCommand):
+    help = ('Benchmark price list import (do_import, PartnerUpdate, load_shop_data) on synthetic price lists '
+            'and write a JSON report with wall time, peak RSS, query count and rows/sec. '
+            'Runs against the configured database; data created by the benchmark is removed after each run, '
+            'objects that existed before it are kept.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000], help='Numbers of goods per price list')
+        parser.add_argument('--parameters', type=int, default=4, help='Number of parameters of each good')
+        parser.add_argument('--shops', type=int, default=1, help='Number of shops')
+        parser.add_argument('--categories', type=int, default=10, help='Number of categories')
+        parser.add_argument('--format', choices=sorted(FORMAT_EXTENSIONS), default='yaml', help='Price list format')
+        parser.add_argument('--runners', choices=sorted(RUNNERS), nargs='+', default=list(RUNNERS),
+                            help='Import paths to benchmark')
+        parser.add_argument('--repeat', type=int, default=1, help='Number of runs of each benchmark')
+        parser.add_argument('--output', type=str, default=None, help='Report file, stdout by default')
+        parser.add_argument('--data-dir', type=str, default=None,
+                            help='Directory for the generated price lists, a temporary one by default')
+        parser.add_argument('--in-process', action='store_true',
+                            help='Run benchmarks in this process (peak RSS is then cumulative)')
+        # запуск одного замера в дочернем процессе
+        parser.add_argument('--worker', choices=sorted(RUNNERS), help=None)
+        parser.add_argument('--files', nargs='+', help=None)
+        parser.add_argument('--goods', type=int, help=None)
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            # журнал SQL-запросов при DEBUG искажает время и память
+            settings.DEBUG = False
+            result = run_benchmark(options['worker'], options['files'], options['format'], options['goods'])
+            self.stdout.write(json.dumps(result))
+            return
+
+        try:
+            check_category_ids(options['categories'])
+        except ValueError as e:
+            raise CommandError(e)
+        data_dir = options['data_dir'] or tempfile.mkdtemp(prefix='benchmark_')
+        existing = existing_data()
+        report = {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'environment': environment(),
+            'format': options['format'],
+            'parameters': options['parameters'],
+            'shops': options['shops'],
+            'results': [],
+        }
+        try:
+            for size in options['sizes']:
+                paths = generate_price_lists(os.path.join(data_dir, str(size)), size, options['parameters'],
+                                             options['shops'], options['categories'], options['format'])
+                for runner in options['runners']:
+                    for run in range(1, options['repeat'] + 1):
+                        cleanup(existing)
+                        result = self.run(runner, paths, options['format'], size * options['shops'],
+                                          options['in_process'])
+                        result.update(size=size, run=run)
+                        report['results'].append(result)
+                        self.stderr.write(f"{runner} {size} goods: {result['status']}, {result['seconds']}s, "
+                                          f"{result['rows_per_sec']} rows/sec, {result['queries']} queries, "
+                                          f"peak RSS {result['peak_rss_kb']} KB")
+        finally:
+            cleanup(existing)
+            if not options['data_dir']:
+                shutil.rmtree(data_dir, ignore_errors=True)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+    @staticmethod
+    def run(runner, paths, file_format, goods, in_process):
+        """
+        Выполняет замер в отдельном процессе, чтобы пиковая память относилась только к нему.
+        """
+        if in_process:
+            return run_benchmark(runner, paths, file_format, goods)
+        command = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'benchmark_import',
+                   '--worker', runner, '--format', file_format, '--goods', str(goods), '--files', *paths]
+        process = subprocess.run(command, capture_output=True, text=True)
+        if process.returncode:
+            raise CommandError(process.stderr)
+        return json.loads(process.stdout.strip().splitlines()[-1])
@@ -0,0 +1,45 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from backend.benchmark import ORDER_CATEGORIES, create_orders, run_serialization_benchmark, existing_data, cleanup, \
+    environment, check_category_ids
+
+
+class Command(BaseCommand):
+    help = ('Benchmark OrderView and BasketView with DRF serializers and with the fast serialization path '
+            '(FAST_SERIALIZATION) on synthetic orders and write a JSON report with the best response time '
+            'of each path, the speedup and whether the responses are byte-identical. '
+            'Runs against the configured database; data created by the benchmark is removed afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=100, help='Number of orders')
+        parser.add_argument('--items', type=int, default=10, help='Number of items in each order')
+        parser.add_argument('--parameters', type=int, default=4, help='Number of parameters of each good')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of requests per path')
+        parser.add_argument('--output', type=str, default=None, help='Report file, stdout by default')
+
+    def handle(self, *args, **options):
+        # журнал SQL-запросов при DEBUG искажает время
+        settings.DEBUG = False
+        try:
+            check_category_ids(ORDER_CATEGORIES)
+        except ValueError as e:
+            raise CommandError(e)
+        existing = existing_data()
+        try:
+            user = create_orders(options['orders'], options['items'], options['parameters'])
+            results = run_serialization_benchmark(user, options['repeat'])
+        finally:
+            cleanup(existing)
+        for result in results:
+            self.stderr.write(f"{result['endpoint']}: DRF {result['drf_seconds']}s, fast {result['fast_seconds']}s, "
+                              f"x{result['speedup']}, identical: {result['identical']}")
+
+        output = json.dumps({'environment': environment(), 'orders': options['orders'], 'items': options['items'],
+                             'parameters': options['parameters'], 'results': results}, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
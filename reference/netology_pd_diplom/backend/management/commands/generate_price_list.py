@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from backend.benchmark import generate_price_lists, FORMAT_EXTENSIONS
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic price lists in the data/shop1.yaml schema'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', type=str, help='Directory for the generated price lists')
+        parser.add_argument('--goods', type=int, default=1000, help='Number of goods in each price list')
+        parser.add_argument('--parameters', type=int, default=4, help='Number of parameters of each good')
+        parser.add_argument('--shops', type=int, default=1, help='Number of shops (one price list per shop)')
+        parser.add_argument('--categories', type=int, default=10, help='Number of categories')
+        parser.add_argument('--format', choices=sorted(FORMAT_EXTENSIONS), default='yaml', help='Price list format')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+
+    def handle(self, *args, **options):
+        paths = generate_price_lists(options['directory'], options['goods'], options['parameters'],
+                                     options['shops'], options['categories'], options['format'], options['seed'])
+        for path in paths:
+            self.stdout.write(self.style.SUCCESS(f'Generated {path}'))
@@ -1,41 +1,29 @@
-
-import yaml
 from django.core.management.base import BaseCommand
-from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, User
+from backend.importer import PriceListImporter, IMPORT_MODES
+from backend.models import Shop, User
+from backend.parsers import parse_price_list, PARSERS
 
 
 class Command(BaseCommand):
-    help = 'Load shop data from a YAML file'
+    help = 'Load shop data from a price list file (YAML, JSON Lines, CSV or MessagePack)'
 
     def add_arguments(self, parser):
-        parser.add_argument('file_path', type=str, help='The path to the YAML file')
+        parser.add_argument('file_path', type=str, help='The path to the price list file')
+        parser.add_argument('--format', choices=sorted(PARSERS), default=None,
+                            help='Price list format, detected from the file extension by default')
+        parser.add_argument('--batch-size', type=int, default=None, help='Batch size for bulk inserts')
+        parser.add_argument('--mode', choices=IMPORT_MODES, default='replace',
+                            help='replace: rebuild the shop catalog, diff: update changed goods only')
+        parser.add_argument('--email', default='admin@example.com', help='Email of the shop owner')
 
     def handle(self, *args, **options):
         file_path = options['file_path']
-        with open(file_path, 'r') as file:
-            data = yaml.safe_load(file)
-
-        user, _ = User.objects.get_or_create(email='admin@example.com')
-
-        shop, _ = Shop.objects.get_or_create(name=data['shop'], user=user)
-        for category in data['categories']:
-            category_object, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
-            category_object.shops.add(shop.id)
-            category_object.save()
-        ProductInfo.objects.filter(shop_id=shop.id).delete()
-        for item in data['goods']:
-            product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category'])
-
-            product_info = ProductInfo.objects.create(product_id=product.id,
-                                                      external_id=item['id'],
-                                                      model=item['model'],
-                                                      price=item['price'],
-                                                      price_rrc=item['price_rrc'],
-                                                      quantity=item['quantity'],
-                                                      shop_id=shop.id)
-            for name, value in item['parameters'].items():
-                parameter_object, _ = Parameter.objects.get_or_create(name=name)
-                ProductParameter.objects.create(product_info_id=product_info.id,
-                                                parameter_id=parameter_object.id,
-                                                value=value)
-        self.stdout.write(self.style.SUCCESS('Successfully loaded data'))
+        user, _ = User.objects.get_or_create(email=options['email'])
+
+        with open(file_path, 'rb') as file:
+            data = parse_price_list(file, options['format'], filename=file_path)
+            shop, _ = Shop.objects.get_or_create(name=data['shop'], user=user)
+            stats = PriceListImporter(shop, batch_size=options['batch_size'], mode=options['mode']).run(data)
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully loaded data: {stats['goods']} goods in {stats['seconds']}s "
+            f"({stats['rows_per_sec']} rows/sec, {stats['queries']} queries)"))
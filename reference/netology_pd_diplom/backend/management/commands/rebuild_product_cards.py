@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from backend.catalog import CatalogChanges, refresh_product_cards, bump_catalog_version
+from backend.counters import category_pairs
+from backend.models import ProductInfo, ProductCard, ProductOfferSummary, CategoryOfferCount
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized product cards, offer summaries and category counts served by the catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', type=int, default=None, help='Rebuild the cards of this shop only')
+        parser.add_argument('--batch-size', type=int, default=None, help='Number of cards written per query')
+
+    def handle(self, *args, **options):
+        product_infos = ProductInfo.objects.all()
+        cards, counts = ProductCard.objects.all(), CategoryOfferCount.objects.all()
+        if options['shop']:
+            product_infos = product_infos.filter(shop_id=options['shop'])
+            cards, counts = cards.filter(shop_id=options['shop']), counts.filter(shop_id=options['shop'])
+        changes = CatalogChanges()
+        with transaction.atomic():
+            refresh_product_cards(product_infos, options['batch_size'], changes)
+            if options['shop']:
+                bump_catalog_version(options['shop'])
+            else:
+                # карточки товаров, которых больше нет, удаляются каскадно; здесь - на случай ручных правок
+                ProductCard.objects.exclude(product_info__in=ProductInfo.objects.all()).delete()
+                ProductOfferSummary.objects.exclude(product__in=ProductInfo.objects.values('product')).delete()
+                bump_catalog_version()
+            # карточки, которые не изменились, счетчики не пересчитывают
+            changes.pairs.update(category_pairs(cards) | set(counts.values_list('category_id', 'shop_id')))
+            changes.apply(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {product_infos.count()} product cards'))
@@ -1,3 +1,5 @@
+import re
+
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
@@ -21,6 +23,32 @@ USER_TYPE_CHOICES = (
 
 )
 
+IMPORT_JOB_STATE_CHOICES = (
+    ('queued', 'В очереди'),
+    ('running', 'Выполняется'),
+    ('done', 'Завершен'),
+    ('failed', 'Ошибка'),
+)
+
+IMPORT_STATUS_CHOICES = (
+    ('imported', 'Импортирован'),
+    ('not_modified', 'Не изменился'),
+    ('failed', 'Ошибка'),
+)
+
+# числовое значение характеристики: целое или десятичное, с точкой или запятой
+NUMERIC_VALUE = re.compile(r'[+-]?\d+(?:[.,]\d+)?')
+
+
+def parse_numeric(value):
+    """
+    Возвращает числовое значение характеристики или None, если значение не является числом.
+    """
+    value = str(value).strip()
+    if NUMERIC_VALUE.fullmatch(value):
+        return float(value.replace(',', '.'))
+    return None
+
 
 # Create your models here.
 
@@ -120,6 +148,87 @@ class Shop(models.Model):
         return self.name
 
 
+class ShopImportState(models.Model):
+    """
+    Метаданные последней загрузки прайс-листа магазина.
+    По ним повторно опубликованный без изменений файл не импортируется заново.
+    """
+    objects = models.manager.Manager()
+    shop = models.OneToOneField(Shop, verbose_name='Магазин', related_name='import_state',
+                                on_delete=models.CASCADE)
+    url = models.CharField(max_length=200, verbose_name='Ссылка', blank=True)
+    etag = models.CharField(max_length=200, verbose_name='ETag', blank=True)
+    last_modified = models.CharField(max_length=100, verbose_name='Last-Modified', blank=True)
+    content_hash = models.CharField(max_length=64, verbose_name='Хеш содержимого', blank=True)
+    status = models.CharField(verbose_name='Результат', choices=IMPORT_STATUS_CHOICES, max_length=15, blank=True)
+    checked_at = models.DateTimeField(verbose_name='Последняя проверка', auto_now=True)
+    imported_at = models.DateTimeField(verbose_name='Последний импорт', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Состояние импорта'
+        verbose_name_plural = "Состояния импорта"
+
+    def __str__(self):
+        return f'{self.shop} ({self.get_status_display()})'
+
+
+class CatalogVersion(models.Model):
+    """
+    Версия данных каталога. Меняется при каждом изменении каталога и входит в ключ кеша
+    ответов, поэтому после импорта закешированные ответы больше не используются.
+    scope - global для каталога в целом или shop:<id> для товаров одного магазина;
+    orders:<id> - версия заказов и корзины пользователя для их ETag.
+    """
+    objects = models.manager.Manager()
+    scope = models.CharField(max_length=30, verbose_name='Область', unique=True)
+    version = models.PositiveBigIntegerField(verbose_name='Версия', default=1)
+
+    class Meta:
+        verbose_name = 'Версия каталога'
+        verbose_name_plural = "Версии каталога"
+
+    def __str__(self):
+        return f'{self.scope}: {self.version}'
+
+
+class ImportJob(models.Model):
+    """
+    Задача импорта прайс-листа или обновления цен и остатков (mode=stock),
+    запущенная партнером или администратором.
+    """
+    objects = models.manager.Manager()
+    user = models.ForeignKey(User, verbose_name='Пользователь', related_name='import_jobs',
+                             blank=True, null=True, on_delete=models.SET_NULL)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='import_jobs', on_delete=models.CASCADE)
+    url = models.CharField(max_length=200, verbose_name='Ссылка', blank=True)
+    mode = models.CharField(max_length=10, verbose_name='Режим', default='replace')
+    state = models.CharField(verbose_name='Статус', choices=IMPORT_JOB_STATE_CHOICES, max_length=10,
+                             default='queued')
+    progress = models.PositiveIntegerField(verbose_name='Обработано товаров', default=0)
+    stats = models.JSONField(verbose_name='Статистика', default=dict, blank=True)
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+    created_at = models.DateTimeField(verbose_name='Создана', auto_now_add=True)
+    started_at = models.DateTimeField(verbose_name='Начата', null=True, blank=True)
+    finished_at = models.DateTimeField(verbose_name='Завершена', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Задача импорта'
+        verbose_name_plural = "Список задач импорта"
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f'{self.shop} {self.created_at} ({self.get_state_display()})'
+
+    @property
+    def duration(self):
+        """
+        Длительность выполнения в секундах.
+        """
+        if self.started_at and self.finished_at:
+            return (self.finished_at - self.started_at).total_seconds()
+        return None
+
+
 class Category(models.Model):
     objects = models.manager.Manager()
     name = models.CharField(max_length=40, verbose_name='Название')
@@ -160,6 +269,9 @@ class ProductInfo(models.Model):
     quantity = models.PositiveIntegerField(verbose_name='Количество')
     price = models.PositiveIntegerField(verbose_name='Цена')
     price_rrc = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
+    # Товары, пропавшие из прайс-листа при дифференциальном импорте, снимаются с продажи,
+    # а не удаляются, чтобы не затронуть корзины и заказы.
+    is_active = models.BooleanField(verbose_name='В продаже', default=True)
 
     class Meta:
         verbose_name = 'Информация о продукте'
@@ -167,6 +279,13 @@ class ProductInfo(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product', 'shop', 'external_id'], name='unique_product_info'),
         ]
+        indexes = [
+            # поиск товаров магазина по external_id при дифференциальном импорте и обновлении остатков
+            models.Index(fields=['shop', 'external_id'], name='product_info_shop_external_idx'),
+            # предложения продукта в наличии по возрастанию цены (см. backend.offers)
+            models.Index(fields=['product', 'price', 'id'], condition=models.Q(is_active=True, quantity__gt=0),
+                         name='product_info_offer_idx'),
+        ]
 
     def __str__(self):
         return f'{self.product.name} ({self.shop.name})'
@@ -193,6 +312,8 @@ class ProductParameter(models.Model):
     parameter = models.ForeignKey(Parameter, verbose_name='Параметр', related_name='product_parameters', blank=True,
                                   on_delete=models.CASCADE)
     value = models.CharField(verbose_name='Значение', max_length=100)
+    # заполняется по value (parse_numeric) для фильтрации по диапазону
+    value_numeric = models.FloatField(verbose_name='Числовое значение', null=True, blank=True, editable=False)
 
     class Meta:
         verbose_name = 'Параметр'
@@ -200,11 +321,109 @@ class ProductParameter(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product_info', 'parameter'], name='unique_product_parameter'),
         ]
+        indexes = [
+            # инвертированный индекс для фильтрации по характеристикам (см. backend.facets)
+            models.Index(fields=['parameter', 'value', 'product_info'], name='product_parameter_value_idx'),
+            models.Index(fields=['parameter', 'value_numeric', 'product_info'], name='product_parameter_numeric_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.value_numeric = parse_numeric(self.value)
+        return super().save(*args, **kwargs)
 
     def __str__(self):
         return f'{self.parameter.name}: {self.value}'
 
 
+class ProductCard(models.Model):
+    """
+    Готовая к выдаче карточка товара для каталога (см. backend.catalog.refresh_product_cards).
+    Хранит JSON в формате ProductInfoSerializer с дополнительным словарем parameters,
+    а также поля для фильтрации, чтобы страница каталога читалась одним запросом без соединений,
+    текст для полнотекстового поиска и группу вариантов товара.
+    """
+    objects = models.manager.Manager()
+    product_info = models.OneToOneField(ProductInfo, verbose_name='Информация о продукте', related_name='card',
+                                        primary_key=True, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, verbose_name='Продукт', related_name='product_cards', on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='product_cards', on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, verbose_name='Категория', related_name='product_cards', null=True,
+                                 blank=True, on_delete=models.CASCADE)
+    is_active = models.BooleanField(verbose_name='В продаже', default=True)
+    shop_state = models.BooleanField(verbose_name='Магазин принимает заказы', default=True)
+    card = models.TextField(verbose_name='Карточка (JSON)')
+    # по этому полю строится полнотекстовый индекс (см. backend.search)
+    search_text = models.TextField(verbose_name='Текст для поиска', blank=True, default='')
+    # модель без учета регистра: товары одной модели - варианты друг друга (см. backend.variants)
+    variant_group = models.CharField(verbose_name='Группа вариантов', max_length=80, blank=True, default='')
+
+    class Meta:
+        verbose_name = 'Карточка товара'
+        verbose_name_plural = "Карточки товаров"
+        indexes = [
+            models.Index(fields=['shop', 'product_info'], name='product_card_shop_idx'),
+            models.Index(fields=['category', 'product_info'], name='product_card_category_idx'),
+            models.Index(fields=['variant_group', 'product_info'], name='product_card_variant_idx'),
+        ]
+
+    def __str__(self):
+        return str(self.product_info_id)
+
+
+class ProductOfferSummary(models.Model):
+    """
+    Сводка предложений магазинов по продукту (см. backend.offers.refresh_offer_summaries):
+    учитываются товары в продаже с ненулевым остатком у магазинов, принимающих заказы.
+    Продукты без таких предложений в таблицу не попадают.
+    """
+    objects = models.manager.Manager()
+    product = models.OneToOneField(Product, verbose_name='Продукт', related_name='offer_summary', primary_key=True,
+                                   on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, verbose_name='Категория', related_name='offer_summaries', null=True,
+                                 blank=True, on_delete=models.CASCADE)
+    name = models.CharField(max_length=80, verbose_name='Название')
+    min_price = models.PositiveIntegerField(verbose_name='Минимальная цена')
+    max_price = models.PositiveIntegerField(verbose_name='Максимальная цена')
+    best_offer = models.ForeignKey(ProductInfo, verbose_name='Лучшее предложение', related_name='+',
+                                   on_delete=models.CASCADE)
+    best_shop = models.ForeignKey(Shop, verbose_name='Магазин с лучшим предложением', related_name='+',
+                                  on_delete=models.CASCADE)
+    offer_count = models.PositiveIntegerField(verbose_name='Количество предложений')
+    total_quantity = models.PositiveIntegerField(verbose_name='Общий остаток')
+
+    class Meta:
+        verbose_name = 'Сводка предложений'
+        verbose_name_plural = "Сводки предложений"
+        indexes = [
+            models.Index(fields=['min_price', 'product'], name='offer_summary_price_idx'),
+            models.Index(fields=['category', 'min_price', 'product'], name='offer_summary_category_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name}: {self.min_price}'
+
+
+class CategoryOfferCount(models.Model):
+    """
+    Количество товаров магазина в продаже по категории (см. backend.counters).
+    """
+    objects = models.manager.Manager()
+    category = models.ForeignKey(Category, verbose_name='Категория', related_name='offer_counts',
+                                 on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='offer_counts', on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(verbose_name='Количество товаров', default=0)
+
+    class Meta:
+        verbose_name = 'Количество товаров категории'
+        verbose_name_plural = "Количество товаров по категориям"
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'shop'], name='unique_category_offer_count'),
+        ]
+
+    def __str__(self):
+        return f'{self.category_id}/{self.shop_id}: {self.count}'
+
+
 class Contact(models.Model):
     objects = models.manager.Manager()
     user = models.ForeignKey(User, verbose_name='Пользователь',
@@ -242,6 +461,12 @@ class Order(models.Model):
         verbose_name = 'Заказ'
         verbose_name_plural = "Список заказ"
         ordering = ('-dt',)
+        indexes = [
+            # корзина пользователя
+            models.Index(fields=['user'], condition=models.Q(state='basket'), name='order_basket_idx'),
+            # оформленные заказы пользователя, новые первыми (курсорная пагинация по -id)
+            models.Index(fields=['user', '-id'], condition=~models.Q(state='basket'), name='order_history_idx'),
+        ]
 
     def __str__(self):
         return str(self.dt)
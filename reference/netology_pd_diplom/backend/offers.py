@@ -0,0 +1,81 @@
+"""
+Сводка предложений магазинов по продуктам.
+
+Один продукт продается несколькими магазинами через отдельные ProductInfo. Для каждого продукта
+заранее считаются минимальная и максимальная цены, лучшее (самое дешевое, при равной цене -
+самое раннее) предложение и его магазин, количество предложений и общий остаток
+(ProductOfferSummary). Сводки пересчитываются вместе с карточками товаров (refresh_product_cards),
+а также при снятии товаров с продажи, их удалении и смене статуса магазина, поэтому страница
+сравнения цен - это чтение таблицы сводок по индексу (min_price, product) или
+(category, min_price, product).
+
+Сводка пересчитывается целиком по данным, видимым транзакции, поэтому на PostgreSQL перед
+пересчетом блокируются строки продуктов: параллельные транзакции (чанки импорта, импорты
+разных магазинов) пересчитывают сводку общего продукта по очереди, и последняя учитывает
+изменения, зафиксированные предыдущими.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+
+from backend.models import Product, ProductInfo, ProductOfferSummary
+
+SUMMARY_FIELDS = ('category', 'name', 'min_price', 'max_price', 'best_offer', 'best_shop', 'offer_count',
+                  'total_quantity')
+
+
+def offer_products(product_infos):
+    """
+    Возвращает id продуктов товаров.
+
+    Args:
+        product_infos (QuerySet | iterable): ProductInfo или их id.
+    """
+    if not hasattr(product_infos, 'values_list'):
+        product_infos = ProductInfo.objects.filter(id__in=list(product_infos))
+    return set(product_infos.order_by().values_list('product_id', flat=True).distinct())
+
+
+def lock_products(ids):
+    """
+    Блокирует строки продуктов до конца транзакции в порядке id. Блокировка FOR NO KEY UPDATE
+    не мешает другим транзакциям добавлять товары продуктов.
+    """
+    if connection.features.has_select_for_update:
+        list(Product.objects.filter(id__in=ids).order_by('id').select_for_update(no_key=True).values_list(
+            'id', flat=True))
+
+
+def refresh_offer_summaries(products, batch_size=None):
+    """
+    Пересчитывает сводки предложений продуктов пачками: на пачку один запрос на чтение,
+    один upsert и одно удаление сводок продуктов, которые больше никто не продает.
+
+    Args:
+        products (iterable): id продуктов.
+        batch_size (int): размер пачки, по умолчанию settings.IMPORT_BATCH_SIZE.
+    """
+    batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+    ids = sorted(set(products))
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        # блокировка держится до конца внешней транзакции, если она есть
+        with transaction.atomic(savepoint=False):
+            lock_products(chunk)
+            summaries = {}
+            # предложения отсортированы так, что первое предложение продукта - лучшее
+            for product_id, offer_id, shop_id, price, quantity, name, category_id in ProductInfo.objects.filter(
+                    product_id__in=chunk, is_active=True, shop__state=True, quantity__gt=0).order_by(
+                    'product_id', 'price', 'id').values_list(
+                    'product_id', 'id', 'shop_id', 'price', 'quantity', 'product__name', 'product__category_id'):
+                summary = summaries.get(product_id)
+                if summary is None:
+                    summaries[product_id] = ProductOfferSummary(
+                        product_id=product_id, category_id=category_id, name=name, min_price=price, max_price=price,
+                        best_offer_id=offer_id, best_shop_id=shop_id, offer_count=1, total_quantity=quantity)
+                else:
+                    summary.max_price = price
+                    summary.offer_count += 1
+                    summary.total_quantity += quantity
+            ProductOfferSummary.objects.filter(product_id__in=chunk).exclude(product_id__in=list(summaries)).delete()
+            ProductOfferSummary.objects.bulk_create(summaries.values(), update_conflicts=True,
+                                                    unique_fields=['product'], update_fields=SUMMARY_FIELDS)
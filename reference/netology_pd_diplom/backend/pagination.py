@@ -0,0 +1,111 @@
+"""
+Курсорная (keyset) пагинация.
+
+Вместо OFFSET страница выбирается условием по ключу сортировки (id > курсор),
+поэтому запрос к глубокой странице стоит столько же, сколько к первой.
+Курсор непрозрачный: позиция кодируется DRF в параметре cursor.
+"""
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, Cursor
+
+
+class ProductCardCursorPagination(CursorPagination):
+    """
+    Пагинация карточек товаров в порядке добавления.
+    """
+    ordering = ('product_info',)
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class OrderCursorPagination(CursorPagination):
+    """
+    Пагинация заказов, новые заказы первыми.
+    """
+    ordering = ('-id',)
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class OfferCursorPagination(CursorPagination):
+    """
+    Пагинация сводок предложений по цене; ordering=-price - от дорогих к дешевым.
+
+    CursorPagination DRF фильтрует только по первому полю сортировки, а строки с равной ценой
+    пропускает смещением (OFFSET). Здесь курсор хранит пару (min_price, product) крайней строки
+    страницы, и соседняя страница выбирается условием (min_price, product) > (цена, продукт),
+    которое читается по индексу (min_price, product) без смещения.
+    """
+    # product_id, а не product: сортировка по связи использовала бы Meta.ordering продукта
+    orderings = {'price': ('min_price', 'product_id'), '-price': ('-min_price', '-product_id')}
+    ordering = orderings['price']
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def get_ordering(self, request, queryset, view):
+        return self.orderings.get(request.query_params.get('ordering'), self.ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor and self.parse_position(self.cursor.position)
+
+        # к началу списка (предыдущая страница или обратная сортировка) строки читаются по убыванию
+        descending = self.ordering[0].startswith('-') != reverse
+        queryset = queryset.order_by(*(('-min_price', '-product_id') if descending else ('min_price', 'product_id')))
+        if position:
+            price, product_id = position
+            if descending:
+                queryset = queryset.filter(Q(min_price__lte=price),
+                                           Q(min_price__lt=price) | Q(min_price=price, product__lt=product_id))
+            else:
+                queryset = queryset.filter(Q(min_price__gte=price),
+                                           Q(min_price__gt=price) | Q(min_price=price, product__gt=product_id))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        # пустая страница (строки удалены) ссылается на позицию своего курсора
+        current = self.cursor.position if self.cursor else None
+        self.next_position = self.format_position(self.page[-1]) if self.page else current
+        self.previous_position = self.format_position(self.page[0]) if self.page else current
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    @staticmethod
+    def format_position(summary):
+        return f'{summary.min_price}:{summary.product_id}'
+
+    def parse_position(self, position):
+        """
+        Разбирает позицию курсора вида цена:id продукта.
+        """
+        if position is None:
+            return None
+        try:
+            price, product_id = (int(value) for value in position.split(':'))
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        return price, product_id
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.previous_position))
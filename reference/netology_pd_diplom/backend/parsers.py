@@ -0,0 +1,269 @@
+"""
+Разбор прайс-листов.
+
+Прайс-лист разбирается потоково: заголовок (shop, categories) читается целиком,
+а товары из раздела goods отдаются генератором по одному, по мере чтения файла.
+Благодаря этому в памяти никогда не находится весь документ.
+
+Все форматы приводятся к одной схеме (shop, categories, goods), как в data/shop1.yaml.
+Парсер выбирается по названию формата, Content-Type ответа или расширению файла:
+- yaml: документ в формате data/shop1.yaml;
+- jsonl: первая строка - заголовок {"shop": ..., "categories": [...]}, далее по товару на строку;
+- csv: строка на товар с колонками id, category, category_name, model, name, price,
+  price_rrc, quantity, parameters (JSON-объект) и необязательной колонкой shop;
+- msgpack: поток объектов, как в jsonl, либо один объект со всеми разделами.
+"""
+import csv
+import io
+import os
+from itertools import chain
+
+from ujson import loads as load_json
+from yaml import YAMLError
+from yaml.events import AliasEvent, ScalarEvent, SequenceStartEvent, SequenceEndEvent, MappingStartEvent, \
+    MappingEndEvent, StreamStartEvent, DocumentStartEvent
+from yaml.nodes import ScalarNode, SequenceNode, MappingNode
+
+try:
+    # Загрузчик на libyaml заметно быстрее чисто питоновского
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# название формата -> функция разбора
+PARSERS = {}
+# Content-Type -> название формата
+CONTENT_TYPES = {}
+# расширение файла -> название формата
+EXTENSIONS = {}
+
+DEFAULT_FORMAT = 'yaml'
+
+
+def register_parser(name, content_types=(), extensions=()):
+    """
+    Декоратор для регистрации парсера прайс-листа.
+
+    Args:
+        name (str): название формата.
+        content_types (tuple): Content-Type, по которым выбирается формат.
+        extensions (tuple): расширения файлов, по которым выбирается формат.
+    """
+    def decorator(parser):
+        PARSERS[name] = parser
+        CONTENT_TYPES.update(dict.fromkeys(content_types, name))
+        EXTENSIONS.update(dict.fromkeys(extensions, name))
+        return parser
+    return decorator
+
+
+def get_parser(name=None, content_type=None, filename=None):
+    """
+    Возвращает парсер прайс-листа. Явно указанный формат важнее Content-Type,
+    Content-Type важнее расширения файла; по умолчанию используется YAML.
+
+    Args:
+        name (str): название формата.
+        content_type (str): значение заголовка Content-Type.
+        filename (str): имя файла или путь из URL.
+
+    Returns:
+        function: функция, принимающая bytes или бинарный файл и возвращающая прайс-лист.
+    """
+    if name:
+        if name not in PARSERS:
+            raise ValueError(f'Неизвестный формат прайс-листа: {name}')
+        return PARSERS[name]
+    if content_type:
+        name = CONTENT_TYPES.get(content_type.split(';')[0].strip().lower())
+    if not name and filename:
+        name = EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+    return PARSERS[name or DEFAULT_FORMAT]
+
+
+def parse_price_list(stream, name=None, content_type=None, filename=None):
+    """
+    Разбирает прайс-лист парсером, выбранным по get_parser.
+    """
+    return get_parser(name, content_type, filename)(stream)
+
+
+@register_parser('yaml', content_types=('application/x-yaml', 'application/yaml', 'text/yaml', 'text/x-yaml'),
+                 extensions=('.yaml', '.yml'))
+def parse_yaml(stream):
+    """
+    Потоково разбирает YAML-прайс-лист.
+
+    Разделы shop и categories должны предшествовать разделу goods.
+
+    Args:
+        stream (bytes | str | file): содержимое прайс-листа или открытый файл.
+
+    Returns:
+        dict: прайс-лист с ключами shop, categories и goods, где goods - генератор товаров.
+    """
+    loader = SafeLoader(stream)
+    try:
+        _expect(loader, StreamStartEvent)
+        _expect(loader, DocumentStartEvent)
+        _expect(loader, MappingStartEvent)
+        data = {}
+        while not loader.check_event(MappingEndEvent):
+            key = _expect(loader, ScalarEvent).value
+            if key == 'goods':
+                if 'categories' not in data:
+                    raise ValueError('Раздел categories должен предшествовать разделу goods')
+                data['goods'] = _iter_goods(loader)
+                return data
+            data[key] = loader.construct_document(_compose(loader))
+    except BaseException:
+        loader.dispose()
+        raise
+    loader.dispose()
+    data['goods'] = []
+    return data
+
+
+def _iter_goods(loader):
+    """
+    Отдает товары раздела goods по одному, не собирая весь список в памяти.
+    """
+    try:
+        _expect(loader, SequenceStartEvent)
+        while not loader.check_event(SequenceEndEvent):
+            yield loader.construct_document(_compose(loader))
+        loader.get_event()
+        if not loader.check_event(MappingEndEvent):
+            raise ValueError('Раздел goods должен быть последним в прайс-листе')
+    finally:
+        loader.dispose()
+
+
+def _expect(loader, event_class):
+    """
+    Читает следующее событие и проверяет его тип.
+    """
+    event = loader.get_event()
+    if not isinstance(event, event_class):
+        raise YAMLError(f'Неверная структура прайс-листа: ожидалось {event_class.__name__}, '
+                        f'получено {type(event).__name__}')
+    return event
+
+
+def _compose(loader):
+    """
+    Собирает узел YAML из событий парсера. Аналог Composer.compose_node,
+    который работает и с загрузчиком на libyaml.
+    """
+    event = loader.get_event()
+    if isinstance(event, AliasEvent):
+        raise YAMLError('Ссылки (alias) в прайс-листе не поддерживаются')
+    if isinstance(event, ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(ScalarNode, event.value, event.implicit)
+        return ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+    if isinstance(event, SequenceStartEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(SequenceNode, None, event.implicit)
+        node = SequenceNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+        while not loader.check_event(SequenceEndEvent):
+            node.value.append(_compose(loader))
+        node.end_mark = loader.get_event().end_mark
+        return node
+    if isinstance(event, MappingStartEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(MappingNode, None, event.implicit)
+        node = MappingNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+        while not loader.check_event(MappingEndEvent):
+            key = _compose(loader)
+            node.value.append((key, _compose(loader)))
+        node.end_mark = loader.get_event().end_mark
+        return node
+    raise YAMLError(f'Неожиданное событие {type(event).__name__}')
+
+
+def _binary(stream):
+    """
+    Оборачивает bytes в файловый объект.
+    """
+    return io.BytesIO(stream) if isinstance(stream, bytes) else stream
+
+
+@register_parser('jsonl', content_types=('application/x-ndjson', 'application/ndjson', 'application/jsonl',
+                                         'application/x-jsonlines'),
+                 extensions=('.jsonl', '.ndjson'))
+def parse_jsonl(stream):
+    """
+    Потоково разбирает прайс-лист в формате JSON Lines.
+
+    Первая строка содержит заголовок с разделами shop и categories,
+    каждая следующая строка - один товар.
+    """
+    lines = (line for line in _binary(stream) if line.strip())
+    header = load_json(next(lines, b'{}'))
+    goods = (load_json(line) for line in lines)
+    return {**header, 'goods': chain(header.get('goods') or [], goods), 'categories': header.get('categories') or []}
+
+
+def _number(value):
+    """
+    Преобразует строку из CSV в число.
+    """
+    value = value.strip()
+    return int(value) if value.isdigit() else float(value)
+
+
+@register_parser('csv', content_types=('text/csv', 'application/csv'), extensions=('.csv',))
+def parse_csv(stream):
+    """
+    Потоково разбирает прайс-лист в формате CSV.
+
+    Категории берутся из колонок category и category_name самих товаров,
+    характеристики - из колонки parameters с JSON-объектом.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(_binary(stream), encoding='utf-8-sig', newline=''))
+    first = next(reader, None)
+    goods = (_csv_item(row) for row in chain([first] if first else [], reader))
+    return {'shop': first.get('shop') if first else None, 'categories': [], 'goods': goods}
+
+
+def _csv_item(row):
+    """
+    Приводит строку CSV к структуре товара прайс-листа.
+    """
+    item = {
+        'id': int(row['id']),
+        'category': int(row['category']),
+        'model': row.get('model') or '',
+        'name': row['name'],
+        'price': _number(row['price']),
+        'price_rrc': _number(row['price_rrc']),
+        'quantity': _number(row['quantity']),
+        'parameters': load_json(row['parameters']) if row.get('parameters') else {},
+    }
+    if row.get('category_name'):
+        item['category_name'] = row['category_name']
+    return item
+
+
+@register_parser('msgpack', content_types=('application/msgpack', 'application/x-msgpack',
+                                           'application/vnd.msgpack'),
+                 extensions=('.msgpack', '.mpk', '.msgp'))
+def parse_msgpack(stream):
+    """
+    Потоково разбирает прайс-лист в формате MessagePack.
+
+    Первый объект - заголовок с разделами shop и categories (или весь прайс-лист целиком),
+    каждый следующий объект - один товар. Требует установленного пакета msgpack.
+    """
+    try:
+        import msgpack
+    except ImportError:
+        raise ValueError('Для разбора MessagePack необходимо установить пакет msgpack')
+
+    unpacker = msgpack.Unpacker(_binary(stream), raw=False, strict_map_key=False)
+    header = next(unpacker, {})
+    return {**header, 'goods': chain(header.get('goods') or [], unpacker), 'categories': header.get('categories') or []}
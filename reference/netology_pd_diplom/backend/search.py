@@ -0,0 +1,136 @@
+"""
+Полнотекстовый поиск по каталогу.
+
+Индексируется поле ProductCard.search_text (название продукта, модель и значения характеристик),
+которое refresh_product_cards заполняет вместе с JSON карточки, поэтому индекс обновляется
+при импорте, обновлении цен и остатков и сохранении объектов каталога без отдельного шага.
+
+Индекс зависит от СУБД и создается после миграций (create_search_index):
+- SQLite - таблица FTS5 с внешним содержимым backend_productcard, синхронизируемая триггерами;
+  результаты сортируются по bm25;
+- PostgreSQL - хранимая вычисляемая колонка search_vector = to_tsvector('simple', search_text)
+  с GIN-индексом; поиск и сортировка по ts_rank используют готовый вектор, а не вычисляют его
+  для каждой строки.
+На остальных СУБД поиск выполняется через LIKE без ранжирования.
+"""
+import re
+
+from django.db import connections, router
+
+from backend.models import ProductCard
+
+SEARCH_TABLE = 'backend_productcard_search'
+SEARCH_COLUMN = 'search_vector'
+SEARCH_INDEX = 'product_card_search_vector_idx'
+# прежний индекс по выражению to_tsvector(search_text), замененный индексом по SEARCH_COLUMN
+LEGACY_SEARCH_INDEX = 'product_card_search_idx'
+# конфигурация текстового поиска PostgreSQL: без стемминга, подходит для русских и английских названий
+TS_CONFIG = 'simple'
+# максимальное количество слов в поисковом запросе
+MAX_TERMS = 10
+
+SQLITE_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(
+        search_text, content='backend_productcard', content_rowid='product_info_id',
+        tokenize='unicode61 remove_diacritics 2')""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_insert AFTER INSERT ON backend_productcard BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, search_text) VALUES (new.product_info_id, new.search_text);
+    END""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_delete AFTER DELETE ON backend_productcard BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, search_text)
+        VALUES ('delete', old.product_info_id, old.search_text);
+    END""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_update AFTER UPDATE OF search_text ON backend_productcard BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, search_text)
+        VALUES ('delete', old.product_info_id, old.search_text);
+        INSERT INTO {SEARCH_TABLE}(rowid, search_text) VALUES (new.product_info_id, new.search_text);
+    END""",
+    # индексирует карточки, созданные до появления таблицы поиска
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')",
+]
+
+POSTGRESQL_SCHEMA = [
+    f"""ALTER TABLE backend_productcard ADD COLUMN IF NOT EXISTS {SEARCH_COLUMN} tsvector
+        GENERATED ALWAYS AS (to_tsvector('{TS_CONFIG}', search_text)) STORED""",
+    f"CREATE INDEX IF NOT EXISTS {SEARCH_INDEX} ON backend_productcard USING GIN ({SEARCH_COLUMN})",
+    f"DROP INDEX IF EXISTS {LEGACY_SEARCH_INDEX}",
+]
+
+
+def create_search_index(using='default', **kwargs):
+    """
+    Создает полнотекстовый индекс карточек, если его еще нет. Вызывается сигналом post_migrate.
+    """
+    if not router.allow_migrate_model(using, ProductCard):
+        return
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            if SEARCH_TABLE in connection.introspection.table_names(cursor):
+                return
+            for statement in SQLITE_SCHEMA:
+                cursor.execute(statement)
+        elif connection.vendor == 'postgresql':
+            for statement in POSTGRESQL_SCHEMA:
+                cursor.execute(statement)
+
+
+def search_terms(query):
+    """
+    Разбивает поисковый запрос на слова так же, как токенизатор индекса.
+    """
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def search_product_cards(query, shop_id=None, category_id=None, limit=20, using='default'):
+    """
+    Ищет карточки товаров в продаже, содержащие все слова запроса.
+
+    Args:
+        query (str): поисковый запрос.
+        shop_id (int): фильтр по магазину.
+        category_id (int): фильтр по категории.
+        limit (int): максимальное количество результатов.
+
+    Returns:
+        list: пары (id ProductInfo, JSON карточки), самые релевантные первыми.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    connection = connections[using]
+    where = ['c.is_active', 'c.shop_state']
+    filters = []
+    if shop_id:
+        where.append('c.shop_id = %s')
+        filters.append(shop_id)
+    if category_id:
+        where.append('c.category_id = %s')
+        filters.append(category_id)
+
+    if connection.vendor == 'sqlite':
+        # слова в кавычках, чтобы символы запроса не разбирались как синтаксис FTS5
+        sql = (f"SELECT c.product_info_id, c.card FROM {SEARCH_TABLE} s "
+               f"JOIN backend_productcard c ON c.product_info_id = s.rowid "
+               f"WHERE {SEARCH_TABLE} MATCH %s AND {' AND '.join(where)} "
+               f"ORDER BY s.rank, c.product_info_id LIMIT %s")
+        params = [' '.join(f'"{term}"' for term in terms), *filters, limit]
+    elif connection.vendor == 'postgresql':
+        sql = (f"SELECT c.product_info_id, c.card FROM backend_productcard c, "
+               f"plainto_tsquery('{TS_CONFIG}', %s) q "
+               f"WHERE c.{SEARCH_COLUMN} @@ q AND {' AND '.join(where)} "
+               f"ORDER BY ts_rank(c.{SEARCH_COLUMN}, q) DESC, c.product_info_id LIMIT %s")
+        params = [' '.join(terms), *filters, limit]
+    else:
+        queryset = ProductCard.objects.filter(is_active=True, shop_state=True)
+        if shop_id:
+            queryset = queryset.filter(shop_id=shop_id)
+        if category_id:
+            queryset = queryset.filter(category_id=category_id)
+        for term in terms:
+            queryset = queryset.filter(search_text__icontains=term)
+        return list(queryset.order_by('product_info').values_list('product_info', 'card')[:limit])
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
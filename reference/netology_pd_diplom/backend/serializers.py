@@ -1,7 +1,8 @@
 # Верстальщик
 from rest_framework import serializers
 
-from backend.models import User, Category, Shop, ProductInfo, Product, ProductParameter, OrderItem, Order, Contact
+from backend.models import User, Category, Shop, ProductInfo, Product, ProductParameter, OrderItem, Order, Contact, \
+    ImportJob, ProductOfferSummary, CategoryOfferCount
 
 
 class ContactSerializer(serializers.ModelSerializer):
@@ -30,12 +31,25 @@ class UserSerializer(serializers.ModelSerializer):
         return User.objects.create_user(**validated_data)
 
 
+class CategoryOfferCountSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CategoryOfferCount
+        fields = ('shop', 'count',)
+
+
 class CategorySerializer(serializers.ModelSerializer):
+    # счетчики загружаются CategoryView через Prefetch(..., to_attr='active_offer_counts')
+    shops = CategoryOfferCountSerializer(source='active_offer_counts', read_only=True, many=True)
+    product_count = serializers.SerializerMethodField()
+
     class Meta:
         model = Category
-        fields = ('id', 'name',)
+        fields = ('id', 'name', 'product_count', 'shops',)
         read_only_fields = ('id',)
 
+    def get_product_count(self, obj):
+        return sum(counter.count for counter in obj.active_offer_counts)
+
 
 class ShopSerializer(serializers.ModelSerializer):
     class Meta:
@@ -70,13 +84,23 @@ class ProductInfoSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class ProductOfferSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProductOfferSummary
+        fields = ('product', 'name', 'category', 'min_price', 'max_price', 'best_offer', 'best_shop', 'offer_count',
+                  'total_quantity',)
+        read_only_fields = fields
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = ('id', 'product_info', 'quantity', 'order',)
         read_only_fields = ('id',)
         extra_kwargs = {
-            'order': {'write_only': True}
+            'order': {'write_only': True},
+            # снятые с продажи товары нельзя добавить в корзину
+            'product_info': {'queryset': ProductInfo.objects.filter(is_active=True)},
         }
 
 
@@ -84,6 +108,15 @@ class OrderItemCreateSerializer(OrderItemSerializer):
     product_info = ProductInfoSerializer(read_only=True)
 
 
+class ProductInfoWithoutParametersSerializer(ProductInfoSerializer):
+    class Meta(ProductInfoSerializer.Meta):
+        fields = ('id', 'model', 'product', 'shop', 'quantity', 'price', 'price_rrc',)
+
+
+class OrderItemWithoutParametersSerializer(OrderItemSerializer):
+    product_info = ProductInfoWithoutParametersSerializer(read_only=True)
+
+
 class OrderSerializer(serializers.ModelSerializer):
     ordered_items = OrderItemCreateSerializer(read_only=True, many=True)
 
@@ -94,3 +127,30 @@ class OrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = ('id', 'ordered_items', 'state', 'dt', 'total_sum', 'contact',)
         read_only_fields = ('id',)
+
+    def __init__(self, *args, fieldset=None, **kwargs):
+        """
+        fieldset (backend.sparse.Fieldset) - выводимые поля и раскрываемые связи.
+        """
+        super().__init__(*args, **kwargs)
+        if fieldset is None:
+            return
+        for name in set(self.fields) - set(fieldset.fields):
+            self.fields.pop(name)
+        if 'contact' in self.fields and not fieldset.expands('contact'):
+            self.fields['contact'] = serializers.PrimaryKeyRelatedField(read_only=True)
+        if 'ordered_items' in self.fields:
+            if not fieldset.expands('product_info'):
+                self.fields['ordered_items'] = OrderItemSerializer(read_only=True, many=True)
+            elif not fieldset.expands('product_parameters'):
+                self.fields['ordered_items'] = OrderItemWithoutParametersSerializer(read_only=True, many=True)
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    duration = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ImportJob
+        fields = ('id', 'url', 'mode', 'state', 'progress', 'stats', 'error', 'created_at', 'started_at',
+                  'finished_at', 'duration')
+        read_only_fields = fields
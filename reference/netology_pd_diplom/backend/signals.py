@@ -5,7 +5,11 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver, Signal
 from django_rest_passwordreset.signals import reset_password_token_created
 
-from backend.models import ConfirmEmailToken, User, Order
+from backend.catalog import CatalogChanges, refresh_product_cards
+from backend.counters import category_pairs
+from backend.offers import offer_products
+from backend.models import ConfirmEmailToken, User, Order, Shop, Category, Product, ProductInfo, Parameter, \
+    ProductParameter, ProductCard
 from backend.tasks import send_email_task
 
 new_user_registered = Signal()
@@ -83,3 +87,43 @@ def new_order_signal(user_id, **kwargs):
         message=admin_message,
         recipient_list=admin_emails
     )
+
+
+@receiver(post_save, sender=ProductInfo)
+def product_info_saved(sender, instance, **kwargs):
+    """
+    Пересобираем карточку сохраненного товара.
+    Массовые операции импорта сигналов не вызывают и обновляют карточки сами.
+    """
+    refresh_product_cards([instance.id])
+
+
+@receiver(post_save, sender=ProductParameter)
+def product_parameter_saved(sender, instance, **kwargs):
+    refresh_product_cards([instance.product_info_id])
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, **kwargs):
+    if not created:
+        refresh_product_cards(ProductInfo.objects.filter(product_id=instance.id))
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    if not created:
+        refresh_product_cards(ProductInfo.objects.filter(product__category_id=instance.id))
+
+
+@receiver(post_save, sender=Parameter)
+def parameter_saved(sender, instance, created, **kwargs):
+    if not created:
+        refresh_product_cards(ProductInfo.objects.filter(product_parameters__parameter_id=instance.id))
+
+
+@receiver(post_save, sender=Shop)
+def shop_saved(sender, instance, created, **kwargs):
+    if not created:
+        ProductCard.objects.filter(shop_id=instance.id).update(shop_state=instance.state)
+        CatalogChanges(offer_products(ProductInfo.objects.filter(shop_id=instance.id)),
+                       category_pairs(ProductCard.objects.filter(shop_id=instance.id)), names=True).apply()
@@ -0,0 +1,105 @@
+"""
+Выборочные поля и раскрытие связей в ответах каталога, корзины и заказов.
+
+Параметры запроса:
+- fields=<поле>,<поле> - поля объектов ответа верхнего уровня (по умолчанию все);
+- expand=<связь>,<связь> - связи, которые встраиваются целиком; остальные отдаются как id
+  (заказы) или не отдаются (характеристики товаров каталога). Без параметра раскрываются все
+  связи, то есть ответ не отличается от прежнего.
+
+Набор полей влияет не только на вывод, но и на план запросов: для заказов без позиций не
+загружаются позиции, без раскрытых товаров - товары и характеристики, без суммы - не считается
+сумма заказа.
+"""
+from django.db.models import Sum, F
+
+ORDER_FIELDS = ('id', 'ordered_items', 'state', 'dt', 'total_sum', 'contact')
+ORDER_EXPANSIONS = ('product_info', 'product_parameters', 'contact')
+
+PRODUCT_FIELDS = ('id', 'model', 'product', 'shop', 'quantity', 'price', 'price_rrc', 'product_parameters',
+                  'parameters')
+PRODUCT_EXPANSIONS = ('product_parameters',)
+
+
+class Fieldset:
+    """
+    Выбранные поля и раскрываемые связи.
+
+    Attributes:
+        fields (tuple): поля в порядке полей сериализатора.
+        expand (frozenset): раскрываемые связи.
+        is_default (bool): выбраны все поля и раскрыты все связи.
+    """
+
+    def __init__(self, fields, expand, is_default=False):
+        self.fields = fields
+        self.expand = expand
+        self.is_default = is_default
+
+    def __contains__(self, name):
+        return name in self.fields
+
+    def expands(self, name):
+        return name in self.expand
+
+
+def split_names(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def parse_fieldset(params, fields, expansions):
+    """
+    Разбирает параметры fields и expand запроса.
+
+    Args:
+        params (QueryDict): параметры запроса.
+        fields (tuple): допустимые поля.
+        expansions (tuple): допустимые связи.
+
+    Returns:
+        Fieldset: выбранные поля и связи.
+
+    Raises:
+        ValueError: указаны неизвестные поля или связи.
+    """
+    selected = {}
+    for key, allowed in (('fields', fields), ('expand', expansions)):
+        if key not in params:
+            selected[key] = allowed
+            continue
+        names = split_names(params[key])
+        unknown = sorted(set(names) - set(allowed))
+        if unknown:
+            raise ValueError(f'Неизвестные значения параметра {key}: {", ".join(unknown)}')
+        selected[key] = tuple(name for name in allowed if name in names)
+    return Fieldset(selected['fields'], frozenset(selected['expand']),
+                    'fields' not in params and 'expand' not in params)
+
+
+def product_fieldset(params):
+    """
+    Поля карточек каталога: без раскрытия характеристик не отдаются ни список, ни словарь характеристик.
+    """
+    fieldset = parse_fieldset(params, PRODUCT_FIELDS, PRODUCT_EXPANSIONS)
+    if not fieldset.expands('product_parameters'):
+        fieldset.fields = tuple(name for name in fieldset.fields if name not in ('product_parameters', 'parameters'))
+    return fieldset
+
+
+def order_queryset(queryset, fieldset):
+    """
+    Добавляет к запросу заказов для OrderSerializer только нужные связи и сумму заказа.
+    """
+    if 'contact' in fieldset and fieldset.expands('contact'):
+        queryset = queryset.select_related('contact')
+    if 'ordered_items' in fieldset:
+        if fieldset.expands('product_info'):
+            queryset = queryset.prefetch_related('ordered_items__product_info__product__category')
+            if fieldset.expands('product_parameters'):
+                queryset = queryset.prefetch_related('ordered_items__product_info__product_parameters__parameter')
+        else:
+            queryset = queryset.prefetch_related('ordered_items')
+    if 'total_sum' in fieldset:
+        queryset = queryset.annotate(
+            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
+    return queryset
@@ -0,0 +1,165 @@
+"""
+Подсказки по префиксу для поиска по мере ввода.
+
+Индекс хранится в памяти процесса: отсортированные списки ключей и параллельные массивы номеров
+подсказок. Подсказки - названия продуктов и модели товаров в продаже (apple/iphone/xr); ключи -
+их тексты в нижнем регистре, начиная с каждого слова названия и каждой части модели, поэтому
+и «iphone», и «xr» находят apple/iphone/xr. Поиск - bisect по спискам ключей без обращения
+к базе данных, время ответа зависит только от limit, а не от размера каталога.
+
+Индекс строится при старте процесса (warm_suggest_index в wsgi.py) или при первом запросе
+и перестраивается, когда меняется версия names каталога: набор названий и моделей товаров
+в продаже (обновление цен и остатков ее не меняет). Версия проверяется не чаще раза
+в settings.SUGGEST_CHECK_INTERVAL секунд, поэтому большинство запросов не выполняют
+ни одного SQL-запроса. Новый индекс строится в фоновом потоке, а запросы до его готовности
+обслуживает прежний (settings.SUGGEST_BACKGROUND_REBUILD).
+"""
+import logging
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+
+from backend.catalog import NAMES_SCOPE, get_versions
+from backend.models import ProductInfo
+
+logger = logging.getLogger(__name__)
+
+# начала слов названия и частей модели
+WORD_START = re.compile(r'\w+')
+# символ после всех символов ключей: префикс + LAST_CHAR ограничивает диапазон ключей с префиксом
+LAST_CHAR = '\U0010ffff'
+
+
+class SuggestIndex:
+    """
+    Неизменяемый индекс подсказок.
+
+    Attributes:
+        version (str): версия каталога, по которой построен индекс.
+        suggestions (list): тексты подсказок.
+        heads (list), head_entries (array): тексты подсказок целиком в нижнем регистре
+            и номера подсказок в том же порядке.
+        keys (list), entries (array): окончания текстов, начиная с каждого слова, кроме первого,
+            и номера подсказок.
+    """
+
+    def __init__(self, version, texts):
+        self.version = version
+        self.suggestions = sorted(set(texts))
+        heads = sorted((text.lower(), number) for number, text in enumerate(self.suggestions))
+        keys = sorted({(text.lower()[match.start():], number) for number, text in enumerate(self.suggestions)
+                       for match in WORD_START.finditer(text) if match.start()})
+        self.heads, self.head_entries = [key for key, _ in heads], array('I', (number for _, number in heads))
+        self.keys, self.entries = [key for key, _ in keys], array('I', (number for _, number in keys))
+
+    def lookup(self, prefix, limit):
+        """
+        Возвращает до limit подсказок, начинающихся с префикса, а затем содержащих слово,
+        которое начинается с префикса. Просматривается не больше ключей, чем нужно для limit подсказок.
+        """
+        prefix = prefix.lower()
+        found = []
+        for keys, entries in ((self.heads, self.head_entries), (self.keys, self.entries)):
+            position, end = bisect_left(keys, prefix), bisect_left(keys, prefix + LAST_CHAR)
+            while position < end and len(found) < limit:
+                number = entries[position]
+                if number not in found:
+                    found.append(number)
+                position += 1
+        return [self.suggestions[number] for number in found]
+
+
+def build_suggest_index(version):
+    texts = set()
+    for name, model in ProductInfo.objects.filter(is_active=True, shop__state=True).order_by().values_list(
+            'product__name', 'model').distinct():
+        texts.add(name)
+        if model:
+            texts.add(model)
+    return SuggestIndex(version, texts)
+
+
+class SuggestIndexHolder:
+    """
+    Текущий индекс процесса. Индекс заменяется целиком, поэтому чтение не требует блокировки;
+    блокировка нужна только для того, чтобы индекс не строился несколькими потоками сразу.
+    Синхронно индекс строится только при первом обращении, перестроение идет в фоне.
+    """
+
+    def __init__(self):
+        self.index = None
+        self.checked_at = 0
+        self.lock = threading.Lock()
+        # поток, перестраивающий индекс
+        self.thread = None
+
+    def get(self):
+        index = self.index
+        if index is not None and time.monotonic() - self.checked_at < settings.SUGGEST_CHECK_INTERVAL:
+            return index
+        self.checked_at = time.monotonic()
+        version = get_versions([NAMES_SCOPE])
+        if index is None:
+            with self.lock:
+                if self.index is None:
+                    self.index = build_suggest_index(version)
+                return self.index
+        if index.version != version:
+            self.rebuild(version)
+        return self.index
+
+    def rebuild(self, version):
+        """
+        Перестраивает индекс, если его уже не перестраивает другой поток.
+        """
+        if not self.lock.acquire(blocking=False):
+            return
+        if not settings.SUGGEST_BACKGROUND_REBUILD:
+            self.build(version)
+            return
+        self.thread = threading.Thread(target=self.build, args=(version,), daemon=True)
+        self.thread.start()
+
+    def build(self, version):
+        try:
+            self.index = build_suggest_index(version)
+        except DatabaseError:
+            # прежний индекс остается, перестроение повторится при следующей проверке версии
+            logger.exception('Не удалось перестроить индекс подсказок')
+        finally:
+            self.lock.release()
+            if threading.current_thread() is self.thread:
+                connection.close()
+
+
+suggest_index = SuggestIndexHolder()
+
+
+def suggest(prefix, limit):
+    """
+    Подсказки для префикса.
+
+    Args:
+        prefix (str): введенный текст.
+        limit (int): максимальное количество подсказок.
+
+    Returns:
+        list: названия продуктов и модели товаров.
+    """
+    return suggest_index.get().lookup(prefix, limit)
+
+
+def warm_suggest_index():
+    """
+    Строит индекс при старте процесса. Ошибка базы данных (например, до применения миграций)
+    не мешает запуску: индекс будет построен при первом запросе.
+    """
+    try:
+        suggest_index.get()
+    except DatabaseError:
+        logger.warning('Индекс подсказок будет построен при первом запросе', exc_info=True)
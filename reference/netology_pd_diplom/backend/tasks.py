@@ -1,10 +1,20 @@
+from uuid import uuid4
+
 from celery import shared_task
 from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
 from django.core.mail import EmailMultiAlternatives
-from yaml import load as load_yaml, Loader
-from requests import get
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
 from urllib.parse import urlparse
-from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter
+from backend.catalog import bump_catalog_version
+from backend.fetch import open_price_list
+from backend.importer import PriceListImporter, StockUpdater
+from backend.models import Shop, ShopImportState, ImportJob
+from backend.parsers import parse_price_list
 
 
 @shared_task
@@ -23,64 +33,287 @@ def send_email_task(subject, message, recipient_list):
     msg.send()
 
 
+def import_progress_key(job_id):
+    """
+    Ключ кеша с прогрессом задачи импорта. Последовательный импорт идет в одной транзакции,
+    поэтому прогресс до ее завершения виден другим процессам только через кеш.
+    """
+    return f'import-job-progress:{job_id}'
+
+
+def parallel_import_keys(token):
+    """
+    Ключи кеша параллельного импорта: счетчик незавершенных чанков, параметры завершения
+    и префикс результатов чанков. Кеш должен быть общим для воркеров (settings.CACHE_URL).
+    """
+    return f'import-pending:{token}', f'import-finish:{token}', f'import-chunk:{token}:'
+
+
+# время жизни состояния параллельного импорта в кеше (с)
+PARALLEL_IMPORT_TIMEOUT = 24 * 60 * 60
+
+
+def update_job(job_id, **fields):
+    """
+    Обновляет задачу импорта, если она была передана.
+    """
+    if job_id:
+        ImportJob.objects.filter(id=job_id).update(**fields)
+
+
+def finish_job(job_id, result):
+    """
+    Сохраняет результат импорта в задачу: статистику при успехе, текст ошибки при неудаче.
+    """
+    if not job_id:
+        return
+    fields = {'finished_at': timezone.now()}
+    if result['Status']:
+        stats = result.get('Stats') or {'not_modified': result.get('NotModified', False)}
+        fields.update(state='done', stats=stats, progress=stats.get('goods', stats.get('items', 0)))
+    else:
+        fields.update(state='failed', error=result.get('Error') or result.get('Errors', ''))
+    update_job(job_id, **fields)
+    cache.delete(import_progress_key(job_id))
+
+
 @shared_task
-def do_import(url, shop_id):
+def do_import(url, shop_id, mode='replace', file_format=None, chunk_size=None, force=False, job_id=None,
+              rename_shop=False):
     """
-    Асинхронная задача для импорта товаров из YAML-файла.
-    Загружает данные по URL, обрабатывает их и обновляет каталог товаров магазина.
+    Асинхронная задача для импорта товаров из прайс-листа (YAML, JSON Lines, CSV или MessagePack).
+    Прайс-лист читается потоково, товары передаются в PriceListImporter пачками,
+    поэтому потребление памяти не зависит от размера файла.
+    Если прайс-лист не изменился с прошлого импорта (ответ 304 или тот же хеш содержимого),
+    работа с каталогом пропускается.
 
     Args:
         url (str): URL или путь к файлу с прайс-листом.
         shop_id (int): ID магазина, для которого выполняется импорт.
+        mode (str): режим импорта: replace - полная перезагрузка каталога магазина,
+            diff - обновление только изменившихся товаров по external_id.
+        file_format (str): формат прайс-листа; если не указан, определяется по Content-Type или расширению.
+        chunk_size (int): размер чанка для параллельного импорта, по умолчанию settings.IMPORT_CHUNK_SIZE;
+            0 - импорт выполняется последовательно в текущей задаче.
+        force (bool): импортировать, даже если прайс-лист не изменился.
+        job_id (int): ID задачи импорта ImportJob, в которую записываются статус и результат.
+        rename_shop (bool): переименовать магазин по названию из прайс-листа.
     """
+    update_job(job_id, state='running', started_at=timezone.now())
+    result = _do_import(url, shop_id, mode, file_format, chunk_size, force, job_id, rename_shop)
+    # параллельный импорт завершает задачу в finish_import
+    if not result.get('Chunks'):
+        finish_job(job_id, result)
+    return result
+
+
+def _do_import(url, shop_id, mode, file_format, chunk_size, force, job_id, rename_shop):
+    if chunk_size is None:
+        chunk_size = settings.IMPORT_CHUNK_SIZE
     if url:
         try:
-            # Проверяем, является ли URL локальным файлом, и читаем его напрямую,
-            # либо загружаем по HTTP.
-            if url.startswith('file://'):
-                path = urlparse(url).path
-                with open(path, 'rb') as f:
-                    stream = f.read()
-            else:
-                stream = get(url).content
+            shop = Shop.objects.get(id=shop_id)
+            state = None if force else ShopImportState.objects.filter(shop_id=shop_id, url=url).first()
+            known = {} if state is None else {
+                'etag': state.etag, 'last_modified': state.last_modified, 'content_hash': state.content_hash}
 
-            data = load_yaml(stream, Loader=Loader)
+            with open_price_list(url, **known) as source:
+                if source.not_modified:
+                    save_import_state(shop_id, 'not_modified', url, source.metadata())
+                    return {'Status': True, 'NotModified': True}
 
-            shop = Shop.objects.get(id=shop_id)
+                data = parse_price_list(source.stream, file_format, source.content_type, urlparse(url).path)
+                if rename_shop and data.get('shop') and data['shop'] != shop.name:
+                    shop.name = data['shop']
+                    shop.save(update_fields=['name'])
+                    bump_catalog_version(shop.id)
+                if chunk_size and parallel_import_supported():
+                    return import_parallel(shop, data, mode, chunk_size, url, source.metadata(), job_id)
+
+                progress = None
+                if job_id:
+                    def progress(goods):
+                        cache.set(import_progress_key(job_id), goods, timeout=24 * 60 * 60)
+                stats = PriceListImporter(shop, mode=mode, progress=progress).run(data)
 
-            # Обновляем или создаем категории.
-            # Использование update_or_create позволяет избежать ошибок
-            # при повторных импортах, обновляя существующие записи.
-            for category_data in data['categories']:
-                category, _ = Category.objects.update_or_create(
-                    id=category_data['id'],
-                    defaults={'name': category_data['name']}
-                )
-                category.shops.add(shop.id)
-                category.save()
-
-            # Перед импортом новых товаров, удаляем все старые товары этого магазина,
-            # чтобы поддерживать каталог в актуальном состоянии.
-            ProductInfo.objects.filter(shop_id=shop.id).delete()
-
-            # Создаем новые товары и их характеристики.
-            for item in data['goods']:
-                product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category'])
-
-                product_info = ProductInfo.objects.create(product_id=product.id,
-                                                          external_id=item['id'],
-                                                          model=item['model'],
-                                                          price=item['price'],
-                                                          price_rrc=item['price_rrc'],
-                                                          quantity=item['quantity'],
-                                                          shop_id=shop.id)
-                for name, value in item['parameters'].items():
-                    parameter_object, _ = Parameter.objects.get_or_create(name=name)
-                    ProductParameter.objects.create(product_info_id=product_info.id,
-                                                    parameter_id=parameter_object.id,
-                                                    value=value)
-
-            return {'Status': True}
+            save_import_state(shop_id, 'imported', url, source.metadata())
+            return {'Status': True, 'Stats': stats}
         except Exception as e:
+            if Shop.objects.filter(id=shop_id).exists():
+                save_import_state(shop_id, 'failed')
             return {'Status': False, 'Error': str(e)}
     return {'Status': False, 'Errors': 'No URL provided'}
+
+
+@shared_task
+def update_stock(shop_id, items, job_id=None):
+    """
+    Асинхронная задача для обновления цен и остатков товаров магазина без полного импорта.
+
+    Args:
+        shop_id (int): ID магазина.
+        items (list): позиции [external_id, price, price_rrc, quantity].
+        job_id (int): ID задачи импорта ImportJob, в которую записываются статус и результат.
+    """
+    update_job(job_id, state='running', started_at=timezone.now())
+    try:
+        stats = StockUpdater(shop_id).run(items)
+        result = {'Status': True, 'Stats': stats}
+    except Exception as e:
+        result = {'Status': False, 'Error': str(e)}
+    finish_job(job_id, result)
+    return result
+
+
+def save_import_state(shop_id, status, url=None, metadata=None):
+    """
+    Сохраняет результат загрузки прайс-листа. Метаданные (ETag, Last-Modified, хеш)
+    обновляются только вместе с успешной загрузкой, чтобы соответствовать данным в базе.
+    """
+    defaults = {'status': status}
+    if url is not None:
+        defaults['url'] = url
+    if metadata:
+        defaults.update(metadata)
+    if status == 'imported':
+        defaults['imported_at'] = timezone.now()
+    ShopImportState.objects.update_or_create(shop_id=shop_id, defaults=defaults)
+
+
+def parallel_import_supported():
+    """
+    Параллельный импорт требует базы данных с конкурентной записью (PostgreSQL): на SQLite
+    одновременные транзакции чанков завершаются ошибкой database is locked. Кроме того, счетчик
+    чанков и их результаты хранятся в кеше, который должен быть общим для воркеров (CACHE_URL):
+    с локальным кешем каждого процесса finish_import не был бы запущен. В остальных случаях
+    импорт выполняется последовательно. Исключение - синхронное выполнение задач
+    (CELERY_TASK_ALWAYS_EAGER), при котором чанки записываются по очереди в одном процессе.
+    """
+    if import_chunk.app.conf.task_always_eager:
+        return True
+    return connection.vendor != 'sqlite' and not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def import_parallel(shop, data, mode, chunk_size, url, metadata, job_id=None):
+    """
+    Запускает параллельный импорт: товары разбиваются на чанки с заранее разрешенными
+    id категорий, продуктов и параметров, и каждый чанк отправляется задаче import_chunk,
+    как только подготовлен, поэтому в памяти находится только текущий чанк.
+    Задача finish_import запускается последним завершившимся чанком (см. chunk_done).
+
+    В отличие от последовательного, параллельный импорт не атомарен: каждый чанк фиксируется
+    своей транзакцией. Если прайс-лист не удалось дочитать или чанк завершился ошибкой,
+    записанные чанки остаются, а finish_import помечает импорт неудачным и не снимает с продажи
+    пропавшие товары; каталог приводит в соответствие прайс-листу повторный импорт.
+    """
+    importer = PriceListImporter(shop, mode=mode)
+    token = uuid4().hex
+    pending, finish, _ = parallel_import_keys(token)
+    # единица за саму отправку: счетчик не дойдет до нуля, пока отправляются чанки
+    cache.set(pending, 1, PARALLEL_IMPORT_TIMEOUT)
+    chunks, error = 0, None
+    try:
+        for rows in importer.prepare(data, chunk_size):
+            cache.incr(pending)
+            import_chunk.delay(shop.id, rows, job_id, token, chunks)
+            chunks += 1
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        # и при ошибке последний чанк запускает finish_import, который завершит импорт неудачей
+        cache.set(finish, {'shop_id': shop.id, 'mode': mode, 'url': url, 'metadata': metadata, 'job_id': job_id,
+                           'chunks': chunks, 'error': error}, PARALLEL_IMPORT_TIMEOUT)
+        chunk_done(token)
+    return {'Status': True, 'Chunks': chunks, 'Stats': importer.stats}
+
+
+def chunk_done(token):
+    """
+    Уменьшает счетчик незавершенных чанков; обнуливший его запускает finish_import
+    с результатами всех чанков и ошибкой подготовки чанков, если она была.
+    """
+    pending, finish, prefix = parallel_import_keys(token)
+    if cache.decr(pending) > 0:
+        return
+    params = cache.get(finish)
+    keys = [f'{prefix}{number}' for number in range(params.pop('chunks'))]
+    found = cache.get_many(keys)
+    results = [found.get(key, {'Error': 'Результат чанка не найден'}) for key in keys]
+    error = params.pop('error')
+    if error:
+        results.append({'Error': error})
+    cache.delete_many([pending, finish, *keys])
+    finish_import.delay(results, **params)
+
+
+@shared_task
+def import_chunk(shop_id, rows, job_id=None, token=None, number=None):
+    """
+    Асинхронная задача для записи одного чанка параллельного импорта.
+    Чанки разных воркеров не пересекаются по external_id, поэтому записываются независимо,
+    слиянием с существующими товарами магазина.
+
+    Args:
+        shop_id (int): ID магазина.
+        rows (list): строки, подготовленные PriceListImporter.prepare.
+        job_id (int): ID задачи импорта для учета прогресса.
+        token (str): идентификатор параллельного импорта; результат сохраняется в кеш,
+            а последний чанк запускает finish_import.
+        number (int): номер чанка.
+
+    Returns:
+        dict: id записанных ProductInfo и статистика чанка либо текст ошибки.
+    """
+    try:
+        importer = PriceListImporter(Shop.objects.get(id=shop_id), mode='diff')
+        with transaction.atomic():
+            importer.write_rows(rows)
+            importer.changes.apply(importer.batch_size)
+            bump_catalog_version(shop_id)
+    except Exception as e:
+        result = {'Error': str(e)}
+    else:
+        update_job(job_id, progress=F('progress') + len(rows))
+        result = {'seen': list(importer.seen), 'stats': importer.stats}
+    if token:
+        cache.set(f'{parallel_import_keys(token)[2]}{number}', result, PARALLEL_IMPORT_TIMEOUT)
+        chunk_done(token)
+    return result
+
+
+@shared_task
+def finish_import(results, shop_id, mode, url=None, metadata=None, job_id=None):
+    """
+    Завершающая задача параллельного импорта. В одной транзакции удаляет (replace)
+    или снимает с продажи (diff) товары магазина, которых не было ни в одном чанке.
+    Если хотя бы один чанк завершился ошибкой, товары не удаляются, а импорт считается неудачным.
+
+    Args:
+        results (list): результаты задач import_chunk.
+        shop_id (int): ID магазина.
+        mode (str): режим импорта.
+        url (str): URL прайс-листа.
+        metadata (dict): метаданные загрузки для ShopImportState.
+        job_id (int): ID задачи импорта.
+    """
+    errors = [result['Error'] for result in results if 'Error' in result]
+    if errors:
+        save_import_state(shop_id, 'failed')
+        result = {'Status': False, 'Error': '; '.join(errors)}
+        finish_job(job_id, result)
+        return result
+
+    importer = PriceListImporter(Shop.objects.get(id=shop_id), mode=mode)
+    for result in results:
+        importer.seen.update(result['seen'])
+        for key in ('goods', 'inserted', 'updated', 'unchanged', 'product_parameters'):
+            importer.stats[key] += result['stats'][key]
+    with transaction.atomic():
+        importer.retire_missing(delete=mode == 'replace')
+        importer.changes.apply(importer.batch_size)
+        bump_catalog_version(shop_id)
+    save_import_state(shop_id, 'imported', url, metadata)
+    result = {'Status': True, 'Stats': importer.stats}
+    finish_job(job_id, result)
+    return result
@@ -1,16 +1,48 @@
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.contrib import admin
 from rest_framework.test import APITestCase
 from rest_framework import status
-from backend.models import User, Shop, Category, Product, ProductInfo, ConfirmEmailToken, Contact, Order
+from backend import fetch
+from backend.admin import ProductInfoAdmin, ShopAdmin
+from backend.benchmark import CATEGORY_ID_BASE, generate_price_lists, FORMAT_EXTENSIONS, existing_data, cleanup, \
+    shop_name
+from backend.serializers import ProductInfoSerializer
+from backend.catalog import NAMES_SCOPE, bump_catalog_version, bump_versions, get_catalog_version, get_versions
+from backend.counters import category_pairs, pairs_filter
+from backend.search import search_product_cards
+from backend.suggest import SuggestIndex, suggest, suggest_index
+from backend.variants import product_variants
+from backend.pagination import OfferCursorPagination
+from backend.importer import PriceListImporter, StockUpdater, clean_stock_item
+from backend.models import User, Shop, Category, Product, ProductInfo, ConfirmEmailToken, Contact, Order, OrderItem, \
+    Parameter, ProductParameter, ShopImportState, ImportJob, ProductCard, ProductOfferSummary, parse_numeric
+from backend.parsers import get_parser, parse_yaml, parse_jsonl, parse_csv, parse_msgpack
+from backend.tasks import do_import, import_parallel, parallel_import_supported
+from types import GeneratorType
+import csv
+import io
+import msgpack
+import os
+import tempfile
 import yaml
 import json
 from unittest.mock import patch, Mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
 
 
 class APITests(APITestCase):
 
     def setUp(self):
         """Настраивает тестовые данные для всех тестов."""
+        cache.clear()
         self.buyer_user = User.objects.create_user(email='buyer@example.com', password='password123', type='buyer')
         self.shop_user = User.objects.create_user(email='shop@example.com', password='password123', type='shop')
         self.admin_user = User.objects.create_superuser(email='admin@example.com', password='adminpassword')
@@ -111,7 +143,29 @@ class APITests(APITestCase):
         url = reverse('backend:products')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 15)
+        self.assertEqual(len(response.json()['results']), 15)
+        self.assertIsNone(response.json()['next'])
+
+    def test_product_info_cursor_pagination(self):
+        """Проверяет обход каталога по курсорам и ограничение размера страницы."""
+        url = reverse('backend:products')
+        ids, pages, queries = [], 0, []
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, {'page_size': 4} if not pages else None)
+            queries.append(len(context))
+            ids.extend(item['id'] for item in response.json()['results'])
+            url = response.json()['next']
+            pages += 1
+        self.assertEqual(pages, 4)
+        self.assertEqual(ids, sorted(ProductInfo.objects.values_list('id', flat=True)))
+        # глубокие страницы выполняют те же запросы, что и первая
+        self.assertEqual(len(set(queries)), 1)
+
+        response = self.client.get(reverse('backend:products'), {'page_size': 1000})
+        self.assertEqual(len(response.json()['results']), 15)
+        response = self.client.get(reverse('backend:products'), {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
     def test_basket_view_unauthenticated(self):
         """Проверяет доступ к корзине для неавторизованного пользователя."""
@@ -197,7 +251,7 @@ class APITests(APITestCase):
 
         # Verify order status is 'new'
         orders_list_response = self.client.get(order_url)
-        self.assertEqual(orders_list_response.json()[0]['state'], 'new')
+        self.assertEqual(orders_list_response.json()['results'][0]['state'], 'new')
 
     def test_view_created_orders(self):
         """Проверяет просмотр созданных заказов."""
@@ -233,8 +287,109 @@ class APITests(APITestCase):
         # Now, view the created orders
         view_orders_response = self.client.get(order_url)
         self.assertEqual(view_orders_response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(view_orders_response.json()), 1)  # Expecting one order
-        self.assertEqual(view_orders_response.json()[0]['state'], 'new')
+        self.assertEqual(len(view_orders_response.json()['results']), 1)  # Expecting one order
+        self.assertEqual(view_orders_response.json()['results'][0]['state'], 'new')
+
+    def test_fast_serialization(self):
+        """Проверяет, что быстрая сериализация заказов и корзины дает те же байты, что и DRF."""
+        parameter = Parameter.objects.create(name='Цвет/оттенок')
+        ProductParameter.objects.create(product_info=self.product_info, parameter=parameter, value='синий\u2028"x"')
+        contact = Contact.objects.create(user=self.buyer_user, city='Москва', street='Ленина', phone='+7900')
+        for number, state in enumerate(['basket', 'new', 'sent', 'delivered']):
+            order = Order.objects.create(user=self.buyer_user, state=state, contact=contact if number % 2 else None)
+            OrderItem.objects.create(order=order, product_info=self.product_info, quantity=number + 1)
+            if number:
+                OrderItem.objects.create(order=order, product_info=self.product_info2, quantity=2)
+        Order.objects.create(user=self.buyer_user, state='new')
+
+        self.client.force_authenticate(user=self.buyer_user)
+        for url, params in ((reverse('backend:basket'), {}), (reverse('backend:order'), {}),
+                            (reverse('backend:order'), {'page_size': 2})):
+            with CaptureQueriesContext(connection) as context:
+                fast = self.client.get(url, params)
+            # версии для ETag, заказы, позиции и характеристики
+            self.assertEqual(len(context), 4)
+            with override_settings(FAST_SERIALIZATION=False):
+                drf = self.client.get(url, params)
+            self.assertEqual(fast.status_code, status.HTTP_200_OK)
+            self.assertEqual(fast.content, drf.content)
+
+    def test_sparse_fieldsets(self):
+        """Проверяет параметры fields и expand у заказов, корзины и каталога."""
+        contact = Contact.objects.create(user=self.buyer_user, city='Москва', street='Ленина', phone='+7900')
+        for state in ('basket', 'new'):
+            order = Order.objects.create(user=self.buyer_user, state=state, contact=contact)
+            OrderItem.objects.create(order=order, product_info=self.product_info, quantity=2)
+        self.client.force_authenticate(user=self.buyer_user)
+
+        for url in (reverse('backend:basket'), reverse('backend:order')):
+            # первый запрос - версии для ETag
+            cases = (({'fields': 'id,state'}, 2), ({'expand': ''}, 3), ({'expand': 'product_info,contact'}, 3),
+                     ({}, 4))
+            for params, queries in cases:
+                with CaptureQueriesContext(connection) as context:
+                    fast = self.client.get(url, params)
+                # следующий запрос очищает журнал запросов, поэтому количество считается сразу
+                self.assertEqual(len(context), queries, params)
+                with override_settings(FAST_SERIALIZATION=False):
+                    drf = self.client.get(url, params)
+                self.assertEqual(fast.content, drf.content, params)
+
+            orders = self.client.get(url, {'fields': 'id,state'}).json()
+            order = (orders['results'] if 'results' in orders else orders)[0]
+            self.assertEqual(list(order), ['id', 'state'])
+            orders = self.client.get(url, {'expand': 'product_info'}).json()
+            order = (orders['results'] if 'results' in orders else orders)[0]
+            self.assertEqual(order['contact'], contact.id)
+            self.assertNotIn('product_parameters', order['ordered_items'][0]['product_info'])
+            self.assertFalse(self.client.get(url, {'fields': 'id,password'}).json()['Status'])
+
+        url = reverse('backend:products')
+        product = self.client.get(url, {'fields': 'id,price'}).json()['results'][0]
+        self.assertEqual(list(product), ['id', 'price'])
+        product = self.client.get(url, {'expand': ''}).json()['results'][0]
+        self.assertNotIn('product_parameters', product)
+        self.assertNotIn('parameters', product)
+        self.assertFalse(self.client.get(url, {'expand': 'shop'}).json()['Status'])
+
+    def test_etags(self):
+        """Проверяет ETag и ответы 304 для каталога, корзины и заказов."""
+        for url in (reverse('backend:categories'), reverse('backend:shops'), reverse('backend:products')):
+            etag = self.client.get(url)['ETag']
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            # только запрос версии каталога
+            self.assertEqual(len(context), 1)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=f'"x", W/{etag}').status_code,
+                             status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(self.client.get(url, {'format': 'api'}, HTTP_IF_NONE_MATCH=etag).status_code,
+                             status.HTTP_200_OK)
+            bump_catalog_version()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotEqual(response['ETag'], etag)
+
+        self.client.force_authenticate(user=self.buyer_user)
+        basket_url, order_url = reverse('backend:basket'), reverse('backend:order')
+        etags = {url: self.client.get(url)['ETag'] for url in (basket_url, order_url)}
+        for url, etag in etags.items():
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(len(context), 1)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.post(basket_url, {'items': json.dumps([{'product_info': self.product_info.id, 'quantity': 1}])},
+                         format='json')
+        for url, etag in etags.items():
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+        # ETag заказов разных пользователей не совпадают
+        etag = self.client.get(order_url)['ETag']
+        self.client.force_authenticate(user=self.shop_user)
+        self.assertEqual(self.client.get(order_url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
 
     @patch('backend.tasks.EmailMultiAlternatives')
     def test_new_order_email_sent(self, mock_email):
@@ -283,7 +438,7 @@ class APITests(APITestCase):
         self.assertIn('Поступил новый заказ', args[1])  # Body
         self.assertEqual(args[3], [self.admin_user.email])
 
-    @patch('backend.views.get')
+    @patch('backend.fetch.get')
     def test_partner_update_authorized(self, mock_get):
         """Проверяет успешное обновление прайс-листа авторизованным магазином."""
         # Create a new shop user for this test to avoid conflicts with setUp
@@ -292,7 +447,8 @@ class APITests(APITestCase):
         # Mock the response from requests.get
         mock_response = Mock()
         mock_response.status_code = 200
-        mock_response.content = b"""
+        mock_response.headers = {'Content-Type': 'application/x-yaml'}
+        content = b"""
 shop: New Test Shop
 categories:
 - id: 99999
@@ -309,16 +465,23 @@ goods:
     param1: value1
     param2: value2
 """
-        mock_get.return_value = mock_response
+        mock_response.iter_content.return_value = [content]
+        mock_get.return_value.__enter__.return_value = mock_response
 
         self.client.force_authenticate(user=new_shop_user)
         url = reverse('backend:partner-update')
         data = {'url': 'http://example.com/new_price.yaml'}
         response = self.client.post(url, data, format='json')
 
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
         self.assertTrue(response.json()['Status'])
 
+        # Импорт выполняется асинхронно, результат доступен в задаче импорта
+        job = ImportJob.objects.get(id=response.json()['Job'])
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(job.progress, 1)
+        self.assertEqual(job.shop.name, 'New Test Shop')
+
         # Verify that the new product is in the database
         self.assertTrue(ProductInfo.objects.filter(
             shop__user=new_shop_user,
@@ -372,3 +535,938 @@ goods:
         self.assertEqual(args[0], f'Обновление статуса заказа {order.id}')  # Subject
         self.assertIn(f'Статус вашего заказа №{order.id} изменен на: Подтвержден.', args[1])  # Body
         self.assertEqual(args[3], [buyer_user.email])  # To
+
+
+class ImportTests(APITestCase):
+
+    def setUp(self):
+        """Создает магазин, в который импортируется тестовый прайс-лист."""
+        cache.clear()
+        self.shop_user = User.objects.create_user(email='import@example.com', password='password123', type='shop')
+        self.shop = Shop.objects.create(name='Import Shop', user=self.shop_user)
+        self.url = 'file://' + os.path.abspath('../../data/shop1.yaml')
+
+    def test_do_import_bulk(self):
+        """Проверяет импорт прайс-листа пачками и статистику импорта."""
+        result = do_import(self.url, self.shop.id)
+        self.assertTrue(result['Status'])
+        self.assertEqual(result['Stats']['goods'], 14)
+        self.assertEqual(ProductInfo.objects.filter(shop=self.shop).count(), 14)
+        self.assertEqual(ProductParameter.objects.filter(product_info__shop=self.shop).count(),
+                         result['Stats']['product_parameters'])
+        self.assertEqual(set(self.shop.categories.values_list('id', flat=True)), {224, 15, 1, 5})
+
+        # Повторный импорт не создает дубликатов продуктов и параметров
+        products, parameters = Product.objects.count(), Parameter.objects.count()
+        result = do_import(self.url, self.shop.id, force=True)
+        self.assertTrue(result['Status'])
+        self.assertEqual(result['Stats']['products_created'], 0)
+        self.assertEqual((Product.objects.count(), Parameter.objects.count()), (products, parameters))
+        self.assertEqual(ProductInfo.objects.filter(shop=self.shop).count(), 14)
+
+    def test_importer_query_count(self):
+        """Проверяет, что число запросов зависит от числа пачек, а не от числа товаров."""
+        with open('../../data/shop1.yaml') as file:
+            data = yaml.safe_load(file)
+        data['goods'] = [dict(item, id=index) for index in range(20) for item in data['goods']]
+        stats = PriceListImporter(self.shop, batch_size=100).run(data)
+        self.assertEqual(stats['goods'], 280)
+        self.assertEqual(ProductInfo.objects.filter(shop=self.shop).count(), 280)
+        self.assertLess(stats['queries'], 60)
+        self.assertIn('rows_per_sec', stats)
+
+    def test_diff_import(self):
+        """Проверяет дифференциальный импорт: обновление, добавление и снятие с продажи без удаления заказов."""
+        with open('../../data/shop1.yaml') as file:
+            data = yaml.safe_load(file)
+        stats = PriceListImporter(self.shop, mode='diff').run(data)
+        self.assertEqual(stats['inserted'], 14)
+
+        stats = PriceListImporter(self.shop, mode='diff').run(data)
+        self.assertEqual((stats['inserted'], stats['updated'], stats['unchanged'], stats['retired']), (0, 0, 14, 0))
+
+        removed, changed = data['goods'][0], data['goods'][1]
+        retired_info = ProductInfo.objects.get(shop=self.shop, external_id=removed['id'])
+        order = Order.objects.create(user=self.shop_user, state='new')
+        OrderItem.objects.create(order=order, product_info=retired_info, quantity=1)
+
+        data['goods'] = data['goods'][1:] + [dict(removed, id=1)]
+        changed['price'] += 100
+        changed['parameters']['Цвет'] = 'синий'
+        stats = PriceListImporter(self.shop, mode='diff').run(data)
+        self.assertEqual((stats['inserted'], stats['updated'], stats['unchanged'], stats['retired']), (1, 1, 12, 1))
+
+        retired_info.refresh_from_db()
+        self.assertFalse(retired_info.is_active)
+        self.assertTrue(OrderItem.objects.filter(product_info=retired_info).exists())
+        changed_info = ProductInfo.objects.get(shop=self.shop, external_id=changed['id'])
+        self.assertEqual(changed_info.price, changed['price'])
+        self.assertEqual(changed_info.product_parameters.get(parameter__name='Цвет').value, 'синий')
+
+        response = self.client.get(reverse('backend:products'), {'shop_id': self.shop.id})
+        self.assertEqual(len(response.json()['results']), 14)
+        self.assertNotIn(retired_info.id, [item['id'] for item in response.json()['results']])
+
+    def test_parse_yaml_streaming(self):
+        """Проверяет, что товары читаются потоково и совпадают с результатом обычной загрузки YAML."""
+        with open('../../data/shop1.yaml', 'rb') as file:
+            expected = yaml.safe_load(file)
+            file.seek(0)
+            data = parse_yaml(file)
+            self.assertEqual((data['shop'], data['categories']), (expected['shop'], expected['categories']))
+            self.assertIsInstance(data['goods'], GeneratorType)
+            self.assertEqual(list(data['goods']), expected['goods'])
+
+        with self.assertRaises(ValueError):
+            parse_yaml(b'shop: Test\ngoods: []\ncategories: []\n')
+
+    def test_import_formats(self):
+        """Проверяет импорт одного и того же прайс-листа в форматах JSON Lines, CSV и MessagePack."""
+        with open('../../data/shop1.yaml') as file:
+            data = yaml.safe_load(file)
+        names = dict((category['id'], category['name']) for category in data['categories'])
+        header = {'shop': data['shop'], 'categories': data['categories']}
+
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'shop.jsonl'), 'w') as file:
+                file.writelines(json.dumps(row, ensure_ascii=False) + '\n' for row in [header] + data['goods'])
+            with open(os.path.join(directory, 'shop.csv'), 'w', newline='') as file:
+                writer = csv.DictWriter(file, ['shop', 'id', 'category', 'category_name', 'model', 'name', 'price',
+                                               'price_rrc', 'quantity', 'parameters'])
+                writer.writeheader()
+                for item in data['goods']:
+                    writer.writerow(dict(item, shop=data['shop'], category_name=names[item['category']],
+                                         parameters=json.dumps(item['parameters'], ensure_ascii=False)))
+            with open(os.path.join(directory, 'shop.msgpack'), 'wb') as file:
+                for row in [header] + data['goods']:
+                    file.write(msgpack.packb(row))
+
+            for name in ('shop.jsonl', 'shop.csv', 'shop.msgpack'):
+                with self.subTest(name=name):
+                    Category.objects.all().delete()
+                    result = do_import('file://' + os.path.join(directory, name), self.shop.id)
+                    self.assertTrue(result['Status'], result)
+                    self.assertEqual(result['Stats']['goods'], 14)
+                    self.assertEqual(dict(Category.objects.values_list('id', 'name')), names)
+                    self.assertEqual(ProductParameter.objects.filter(product_info__shop=self.shop).count(),
+                                     sum(len(item['parameters']) for item in data['goods']))
+
+    def test_get_parser(self):
+        """Проверяет выбор парсера по формату, Content-Type и расширению файла."""
+        self.assertIs(get_parser(filename='/price.csv'), parse_csv)
+        self.assertIs(get_parser(content_type='application/x-ndjson; charset=utf-8', filename='/price.csv'),
+                      parse_jsonl)
+        self.assertIs(get_parser('msgpack', content_type='text/csv'), parse_msgpack)
+        self.assertIs(get_parser(content_type='application/octet-stream', filename='/price'), parse_yaml)
+        with self.assertRaises(ValueError):
+            get_parser('xml')
+
+    def test_parallel_import(self):
+        """Проверяет параллельный импорт чанками: повторный импорт обновляет товары на месте, а пропавшие удаляет."""
+        result = do_import(self.url, self.shop.id, chunk_size=5)
+        self.assertTrue(result['Status'], result)
+        self.assertEqual(result['Chunks'], 3)
+        self.assertEqual(ProductInfo.objects.filter(shop=self.shop).count(), 14)
+        ids = set(ProductInfo.objects.filter(shop=self.shop).values_list('id', flat=True))
+
+        extra = ProductInfo.objects.create(product=Product.objects.first(), shop=self.shop, external_id=1,
+                                           price=1, price_rrc=1, quantity=1)
+        result = do_import(self.url, self.shop.id, chunk_size=5, force=True)
+        self.assertTrue(result['Status'], result)
+        self.assertEqual(set(ProductInfo.objects.filter(shop=self.shop).values_list('id', flat=True)), ids)
+        self.assertFalse(ProductInfo.objects.filter(id=extra.id).exists())
+
+    def test_parallel_import_fallback(self):
+        """Проверяет, что без общего кеша воркеров или на SQLite импорт выполняется последовательно."""
+        self.assertTrue(parallel_import_supported())
+        with patch('backend.tasks.import_chunk', Mock(**{'app.conf.task_always_eager': False})):
+            self.assertFalse(parallel_import_supported())
+            with patch('backend.tasks.connection', Mock(vendor='postgresql')):
+                # локальный кеш процесса
+                self.assertFalse(parallel_import_supported())
+                with patch('backend.tasks.caches', {'default': Mock()}):
+                    self.assertTrue(parallel_import_supported())
+
+    def test_parallel_import_prepare_error(self):
+        """Проверяет, что ошибка в середине прайс-листа завершает параллельный импорт неудачей."""
+        with open('../../data/shop1.yaml') as file:
+            data = yaml.safe_load(file)
+        data['goods'][-1]['price'] = 'нет цены'
+        job = ImportJob.objects.create(user=self.shop_user, shop=self.shop, url=self.url)
+        with self.assertRaises(ValueError):
+            import_parallel(self.shop, data, 'diff', 5, self.url, {}, job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.state, 'failed')
+        self.assertEqual(ShopImportState.objects.get(shop=self.shop).status, 'failed')
+        # записанные чанки остаются, но пропавшие товары не снимаются с продажи
+        self.assertEqual(ProductInfo.objects.filter(shop=self.shop, is_active=True).count(), 10)
+
+    def test_skip_unchanged_price_list(self):
+        """Проверяет, что неизменившийся прайс-лист не импортируется повторно."""
+        self.assertTrue(do_import(self.url, self.shop.id)['Status'])
+        state = ShopImportState.objects.get(shop=self.shop)
+        self.assertEqual((state.status, state.url, len(state.content_hash)), ('imported', self.url, 64))
+
+        with CaptureQueriesContext(connection) as queries:
+            result = do_import(self.url, self.shop.id)
+        self.assertEqual(result, {'Status': True, 'NotModified': True})
+        self.assertFalse([query for query in queries if 'backend_productinfo' in query['sql']])
+        state.refresh_from_db()
+        self.assertEqual(state.status, 'not_modified')
+
+        self.assertIn('Stats', do_import(self.url, self.shop.id, force=True))
+
+    def test_reimport_after_catalog_edit(self):
+        """Проверяет, что после изменения товаров в обход импорта тот же прайс-лист загружается заново."""
+        do_import(self.url, self.shop.id)
+        info = ProductInfo.objects.filter(shop=self.shop).first()
+        StockUpdater(self.shop.id).run([(info.external_id, 1, 1, 0)])
+        self.assertEqual(ShopImportState.objects.get(shop=self.shop).content_hash, '')
+        self.assertIn('Stats', do_import(self.url, self.shop.id))
+        info = ProductInfo.objects.get(shop=self.shop, external_id=info.external_id)
+        self.assertNotEqual(info.quantity, 0)
+
+        self.assertIn('NotModified', do_import(self.url, self.shop.id))
+        info.quantity = 0
+        info.save()
+        ProductInfoAdmin(ProductInfo, admin.site).save_model(None, info, None, True)
+        self.assertIn('Stats', do_import(self.url, self.shop.id))
+
+    @patch('backend.fetch.get')
+    def test_conditional_fetch(self, mock_get):
+        """Проверяет условный запрос с ETag и Last-Modified и обработку ответа 304."""
+        ShopImportState.objects.create(shop=self.shop, url='http://example.com/shop.yaml', etag='"v1"',
+                                       last_modified='Mon, 01 Jan 2024 00:00:00 GMT', content_hash='abc')
+        mock_get.return_value.__enter__.return_value.status_code = 304
+
+        result = do_import('http://example.com/shop.yaml', self.shop.id)
+        self.assertEqual(result, {'Status': True, 'NotModified': True})
+        self.assertEqual(mock_get.call_args.kwargs['headers'], {
+            'If-None-Match': '"v1"', 'If-Modified-Since': 'Mon, 01 Jan 2024 00:00:00 GMT'})
+
+    def test_import_job_status(self):
+        """Проверяет получение статуса задачи импорта только ее владельцем."""
+        job = ImportJob.objects.create(user=self.shop_user, shop=self.shop, url=self.url)
+        do_import(self.url, self.shop.id, job_id=job.id)
+        url = reverse('backend:partner-import', kwargs={'job_id': job.id})
+
+        self.client.force_authenticate(user=self.shop_user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['state'], 'done')
+        self.assertEqual(response.data['progress'], 14)
+        self.assertEqual(response.data['stats']['inserted'], 14)
+        self.assertIsNotNone(response.data['duration'])
+
+        other = User.objects.create_user(email='other_shop@example.com', password='password123', type='shop')
+        self.client.force_authenticate(user=other)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        failed = ImportJob.objects.create(user=self.shop_user, shop=self.shop, url='file:///nonexistent.yaml')
+        do_import(failed.url, self.shop.id, job_id=failed.id)
+        failed.refresh_from_db()
+        self.assertEqual(failed.state, 'failed')
+        self.assertTrue(failed.error)
+
+    def test_partner_stock_update(self):
+        """Проверяет обновление цен и остатков без полного импорта."""
+        do_import(self.url, self.shop.id)
+        info = ProductInfo.objects.filter(shop=self.shop).order_by('id').first()
+        products, parameters = Product.objects.count(), ProductParameter.objects.count()
+
+        self.client.force_authenticate(user=self.shop_user)
+        response = self.client.post(reverse('backend:partner-stock'), {'items': [
+            [info.external_id, 1000, 1200, 7],
+            {'external_id': 999999, 'price': 1, 'price_rrc': 1, 'quantity': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        job = ImportJob.objects.get(id=response.json()['Job'])
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(job.stats['updated'], 1)
+        self.assertEqual(job.stats['unknown'], 1)
+        info.refresh_from_db()
+        self.assertEqual((info.price, info.price_rrc, info.quantity), (1000, 1200, 7))
+        self.assertEqual(Product.objects.count(), products)
+        self.assertEqual(ProductParameter.objects.count(), parameters)
+
+        response = self.client.post(reverse('backend:partner-stock'), {'items': [[info.external_id, -1, 0, 0]]},
+                                    format='json')
+        self.assertFalse(response.json()['Status'])
+        with self.assertRaises(ValueError):
+            clean_stock_item({'external_id': 1, 'price': 1})
+
+    def test_stock_update_query_count(self):
+        """Проверяет, что обновление цен выполняется фиксированным числом запросов на пачку."""
+        do_import(self.url, self.shop.id)
+        items = [(external_id, 1, 2, 3) for external_id in
+                 ProductInfo.objects.filter(shop=self.shop).values_list('external_id', flat=True)]
+        stats = StockUpdater(self.shop.id, batch_size=100).run(items)
+        self.assertEqual(stats['updated'], 14)
+        # SAVEPOINT/RELEASE, поиск товаров, один UPDATE, пересборка карточек (три чтения и upsert),
+        # пересчет сводок предложений (чтение, удаление и upsert), сброс метаданных загрузки прайс-листа
+        # и два запроса версии каталога
+        self.assertLessEqual(stats['queries'], 14)
+        stats = StockUpdater(self.shop.id).run(items)
+        self.assertEqual((stats['updated'], stats['unchanged']), (0, 14))
+
+    def test_catalog_cache(self):
+        """Проверяет кеширование ответов каталога и сброс кеша при изменении каталога."""
+        do_import(self.url, self.shop.id)
+        url = reverse('backend:products')
+        params = {'shop_id': self.shop.id, 'page_size': 5}
+        first = self.client.get(url, params)
+        with CaptureQueriesContext(connection) as context:
+            cached = self.client.get(url, {'page_size': 5, 'shop_id': self.shop.id})
+        # только чтение версии каталога
+        self.assertEqual(len(context), 1)
+        self.assertEqual(cached.json(), first.json())
+
+        # обновление остатков меняет версию магазина и каталога в целом
+        info = ProductInfo.objects.get(id=first.json()['results'][0]['id'])
+        StockUpdater(self.shop.id).run([(info.external_id, 1, 1, 1)])
+        self.assertEqual(self.client.get(url, params).json()['results'][0]['price'], 1)
+        self.assertEqual(self.client.get(url).json()['results'][0]['price'], 1)
+
+        # смена статуса магазина убирает его товары из каталога
+        self.client.get(reverse('backend:shops'))
+        self.client.force_authenticate(user=self.shop_user)
+        self.client.post(reverse('backend:partner-state'), {'state': 'false'}, format='json')
+        self.assertEqual(self.client.get(url, params).json()['results'], [])
+        self.assertEqual(self.client.get(reverse('backend:shops')).data['results'], [])
+
+        # переименование категории при импорте видно в каталоге других магазинов
+        other = Shop.objects.create(name='Other Shop', state=True)
+        do_import(self.url, other.id)
+        other_params = {'shop_id': other.id}
+        self.client.get(url, other_params)
+        data = yaml.safe_load(open('../../data/shop1.yaml', 'rb'))
+        data['categories'][0]['name'] = 'Renamed'
+        PriceListImporter(self.shop).run(data)
+        categories = {item['product']['category'] for item in self.client.get(url, other_params).json()['results']}
+        self.assertIn('Renamed', categories)
+
+        # представления, которые не фильтруют по магазину, не используют версию магазина из shop_id
+        shops_url = reverse('backend:shops')
+        self.assertEqual(len(self.client.get(shops_url, {'shop_id': self.shop.id}).data['results']), 1)
+        other.state = False
+        ShopAdmin(Shop, admin.site).save_model(None, other, None, True)
+        self.assertEqual(self.client.get(shops_url, {'shop_id': self.shop.id}).data['results'], [])
+
+    def test_product_cards(self):
+        """Проверяет, что карточки совпадают с ProductInfoSerializer и обновляются вместе с каталогом."""
+        do_import(self.url, self.shop.id)
+        infos = ProductInfo.objects.filter(shop=self.shop)
+        for info in infos:
+            card = json.loads(info.card.card)
+            parameters = card.pop('parameters')
+            self.assertEqual(card, json.loads(json.dumps(ProductInfoSerializer(info).data)))
+            self.assertEqual(parameters, {item['parameter']: item['value'] for item in card['product_parameters']})
+
+        url = reverse('backend:products')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {'category_id': 224})
+        # версия каталога и страница карточек
+        self.assertEqual(len(context), 2)
+        self.assertEqual({item['product']['category'] for item in response.json()['results']}, {'Смартфоны'})
+        self.assertEqual(self.client.get(url, {'format': 'api'}).status_code, status.HTTP_200_OK)
+
+        # сохранение объектов каталога пересобирает карточки
+        category = Category.objects.get(id=224)
+        category.name = 'Телефоны'
+        category.save()
+        info = infos.filter(product__category=category).first()
+        self.assertEqual(json.loads(info.card.card)['product']['category'], 'Телефоны')
+
+        # diff-импорт снимает карточки пропавших товаров с продажи
+        data = yaml.safe_load(open('../../data/shop1.yaml', 'rb'))
+        retired = data['goods'].pop()
+        PriceListImporter(self.shop, mode='diff').run(data)
+        self.assertFalse(ProductCard.objects.get(product_info__external_id=retired['id']).is_active)
+
+        ProductCard.objects.all().delete()
+        call_command('rebuild_product_cards', stdout=io.StringIO())
+        self.assertEqual(ProductCard.objects.count(), 14)
+
+    def test_parameter_filters_and_facets(self):
+        """Проверяет фильтры по характеристикам и счетчики фасетов."""
+        do_import(self.url, self.shop.id)
+        url = reverse('backend:products')
+
+        def get(*filters, **params):
+            return self.client.get(url, {'param': list(filters), **params}).json()
+
+        self.assertEqual(len(get('Встроенная память (Гб):256')['results']), 3)
+        self.assertEqual([item['parameters']['Цвет'] for item in get(
+            'Встроенная память (Гб):256', 'Цвет:красный')['results']], ['красный'])
+        self.assertEqual(len(get('Цвет:красный', 'Цвет:черный')['results']), 2)
+        self.assertEqual(get('Вес:1')['results'], [])
+        self.assertFalse(get('Цвет')['Status'])
+        self.assertNotIn('facets', get('Цвет:красный'))
+
+        facets = get('Цвет:красный', facets=1)['facets']
+        # значения характеристики из фильтра считаются без ее собственного условия
+        self.assertEqual(facets['Цвет'], {'золотистый': 1, 'красный': 1, 'синий': 1, 'черный': 1})
+        self.assertEqual(facets['Встроенная память (Гб)'], {'256': 1})
+        self.assertEqual(get(facets=1, category_id=224)['facets']['Встроенная память (Гб)'], {'256': 3, '512': 1})
+        response = self.client.get(url, {'param': 'Цвет:красный', 'facets': 1, 'format': 'api'})
+        self.assertEqual(response.data['facets'], facets)
+
+    def test_numeric_parameter_ranges(self):
+        """Проверяет числовые значения характеристик и фильтры по диапазону."""
+        self.assertEqual(parse_numeric('6,5'), 6.5)
+        self.assertEqual(parse_numeric(' 512 '), 512)
+        self.assertIsNone(parse_numeric('2688x1242'))
+        self.assertIsNone(parse_numeric('nan'))
+
+        do_import(self.url, self.shop.id)
+        url = reverse('backend:products')
+
+        def count(*filters):
+            return len(self.client.get(url, {'param': list(filters)}).json()['results'])
+
+        self.assertEqual(count('Диагональ (дюйм):6..6.2'), 3)
+        self.assertEqual(count('Диагональ (дюйм):6.2..'), 1)
+        self.assertEqual(count('Диагональ (дюйм):..6.5'), 4)
+        self.assertEqual(count('Встроенная память (Гб):300..', 'Диагональ (дюйм):6..6.2'), 0)
+        self.assertEqual(count('Диагональ (дюйм):6.1', 'Встроенная память (Гб):256..512'), 3)
+        self.assertEqual(count('Цвет:..100'), 0)
+
+        # diff-импорт заполняет числовые значения у записей, где их нет
+        ProductParameter.objects.update(value_numeric=None)
+        PriceListImporter(self.shop, mode='diff').run(yaml.safe_load(open('../../data/shop1.yaml', 'rb')))
+        self.assertEqual(ProductParameter.objects.filter(value_numeric__isnull=False).count(),
+                         len([value for value in ProductParameter.objects.values_list('value', flat=True)
+                              if parse_numeric(value) is not None]))
+
+    def test_product_search(self):
+        """Проверяет полнотекстовый поиск по названию, модели и характеристикам и его фильтры."""
+        do_import(self.url, self.shop.id)
+        url = reverse('backend:products-search')
+
+        def search(**params):
+            return [item['id'] for item in self.client.get(url, params).json()['results']]
+
+        xr = set(ProductInfo.objects.filter(model='apple/iphone/xr').values_list('id', flat=True))
+        self.assertEqual(set(search(q='iPhone XR')), xr)
+        self.assertEqual(set(search(q='APPLE/IPHONE/XR')), xr)
+        self.assertEqual(len(search(q='2688x1242')), 1)
+        self.assertEqual(len(search(q='smart tv', category_id=5)), 5)
+        self.assertEqual(search(q='smart tv', category_id=224), [])
+        self.assertEqual(search(q='iphone', shop_id=self.shop.id + 1), [])
+        self.assertEqual(len(search(q='samsung', limit=1)), 1)
+        self.assertEqual(search(q='"*'), [])
+        self.assertFalse(self.client.get(url).json()['Status'])
+
+        # индекс обновляется вместе с карточками
+        info = ProductInfo.objects.get(model='xiaomi/mi-10t-pro')
+        info.product.name = 'Смартфон Redmi'
+        info.product.save()
+        self.assertEqual(search(q='redmi'), [info.id])
+        self.assertEqual(search(q='smartphone xiaomi'), [])
+        info.delete()
+        self.assertEqual(search_product_cards('redmi'), [])
+
+    def test_offer_summaries(self):
+        """Проверяет сводки предложений продуктов нескольких магазинов и их пересчет."""
+        do_import(self.url, self.shop.id)
+        other_user = User.objects.create_user(email='other@example.com', password='password123', type='shop')
+        other = Shop.objects.create(name='Other Shop', user=other_user)
+        do_import(self.url, other.id)
+        url = reverse('backend:products-offers')
+        products = Product.objects.filter(product_infos__shop=self.shop).distinct()
+        self.assertEqual(ProductOfferSummary.objects.count(), products.count())
+
+        cheap = ProductInfo.objects.filter(shop=other).order_by('id').first()
+        StockUpdater(other.id).run([(cheap.external_id, 100, 200, 3)])
+        regular = ProductInfo.objects.get(shop=self.shop, product=cheap.product, external_id=cheap.external_id)
+        summary = ProductOfferSummary.objects.get(product=cheap.product)
+        self.assertEqual((summary.min_price, summary.max_price, summary.best_offer_id, summary.best_shop_id),
+                         (100, regular.price, cheap.id, other.id))
+        self.assertEqual((summary.offer_count, summary.total_quantity), (2, regular.quantity + 3))
+
+        results = self.client.get(url).json()['results']
+        self.assertEqual(results[0]['product'], cheap.product_id)
+        self.assertEqual([item['min_price'] for item in results], sorted(item['min_price'] for item in results))
+        results = self.client.get(url, {'ordering': '-price', 'price_max': 1000}).json()['results']
+        self.assertEqual(results[-1]['product'], cheap.product_id)
+        self.assertTrue(all(item['min_price'] <= 1000 for item in results))
+        self.assertEqual(len(self.client.get(url, {'category_id': 5}).json()['results']), 5)
+        self.assertFalse(self.client.get(url, {'ordering': 'name'}).json()['Status'])
+
+        # сводки строятся по всем магазинам, поэтому параметр shop_id не привязывает ответ к версии магазина
+        self.assertEqual(self.client.get(url, {'shop_id': self.shop.id}).json()['results'][0]['min_price'], 100)
+        StockUpdater(other.id).run([(cheap.external_id, 50, 200, 3)])
+        self.assertEqual(self.client.get(url, {'shop_id': self.shop.id}).json()['results'][0]['min_price'], 50)
+
+        # магазин перестал принимать заказы, а у другого товар закончился
+        self.client.force_authenticate(user=other_user)
+        self.client.post(reverse('backend:partner-state'), {'state': 'false'})
+        summary.refresh_from_db()
+        self.assertEqual((summary.min_price, summary.best_shop_id, summary.offer_count),
+                         (regular.price, self.shop.id, 1))
+        StockUpdater(self.shop.id).run([(regular.external_id, regular.price, regular.price_rrc, 0)])
+        self.assertFalse(ProductOfferSummary.objects.filter(product=cheap.product).exists())
+
+    def test_offer_summary_product_change(self):
+        """Проверяет, что сводка прежнего продукта пересчитывается, когда товар переходит к другому продукту."""
+        with open('../../data/shop1.yaml') as file:
+            data = yaml.safe_load(file)
+        PriceListImporter(self.shop, mode='diff').run(data)
+        info = ProductInfo.objects.get(shop=self.shop, external_id=data['goods'][0]['id'])
+        old_product = info.product
+        self.assertTrue(ProductOfferSummary.objects.filter(product=old_product).exists())
+
+        data['goods'][0]['name'] = 'Переименованный продукт'
+        PriceListImporter(self.shop, mode='diff').run(data)
+        info.refresh_from_db()
+        self.assertNotEqual(info.product_id, old_product.id)
+        self.assertFalse(ProductOfferSummary.objects.filter(product=old_product).exists())
+        self.assertEqual(ProductOfferSummary.objects.get(product=info.product).best_offer_id, info.id)
+
+    def test_offer_pagination_equal_prices(self):
+        """Проверяет курсор по (цена, продукт): страницы с равными ценами без пропусков, повторов и OFFSET."""
+        do_import(self.url, self.shop.id)
+        ProductOfferSummary.objects.filter(product_id__in=ProductOfferSummary.objects.order_by('product')[::2]).update(
+            min_price=100)
+        ProductOfferSummary.objects.exclude(min_price=100).update(min_price=200)
+        url = reverse('backend:products-offers')
+
+        for ordering in ('price', '-price'):
+            expected = list(ProductOfferSummary.objects.order_by(
+                *OfferCursorPagination.orderings[ordering]).values_list('product', flat=True))
+            pages, link = [], f'{url}?ordering={ordering}&page_size=3'
+            with CaptureQueriesContext(connection) as context:
+                while link:
+                    response = self.client.get(link).json()
+                    pages.append([item['product'] for item in response['results']])
+                    link = response['next']
+            self.assertEqual([product for page in pages for product in page], expected)
+            self.assertFalse([query for query in context if 'OFFSET' in query['sql']])
+
+            # обратно по ссылкам previous - те же страницы в обратном порядке
+            backward = []
+            while link := response['previous']:
+                response = self.client.get(link).json()
+                backward.append([item['product'] for item in response['results']])
+            self.assertEqual(backward, pages[-2::-1])
+        self.assertEqual(self.client.get(url, {'cursor': 'invalid'}).status_code, 404)
+
+    def test_category_counts(self):
+        """Проверяет счетчики товаров категорий по магазинам и их обновление."""
+        do_import(self.url, self.shop.id)
+        url = reverse('backend:categories')
+
+        def counts():
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertFalse([query for query in context if 'backend_productinfo' in query['sql']])
+            return {item['id']: (item['product_count'], item['shops']) for item in response.json()['results']}
+
+        expected = {category_id: ProductInfo.objects.filter(shop=self.shop, product__category_id=category_id).count()
+                    for category_id in (224, 15, 1, 5)}
+        self.assertEqual({key: total for key, (total, _) in counts().items()}, expected)
+        self.assertEqual(counts()[5][1], [{'shop': self.shop.id, 'count': 5}])
+
+        # остатки на счетчики не влияют и их не пересчитывают
+        info = ProductInfo.objects.filter(shop=self.shop, product__category_id=5).first()
+        with CaptureQueriesContext(connection) as context:
+            StockUpdater(self.shop.id).run([(info.external_id, 1, 1, 0)])
+        self.assertFalse([query for query in context if 'backend_categoryoffercount' in query['sql']])
+
+        info.is_active = False
+        info.save()
+        self.assertEqual(counts()[5][0], 4)
+        self.client.force_authenticate(user=self.shop_user)
+        self.client.post(reverse('backend:partner-state'), {'state': 'false'})
+        self.assertEqual(counts()[5], (0, []))
+        self.client.post(reverse('backend:partner-state'), {'state': 'true'})
+        self.assertEqual(counts()[5][0], 4)
+
+        # товары, пропавшие из прайс-листа, уходят из счетчиков
+        with open('../../data/shop1.yaml') as file:
+            data = yaml.safe_load(file)
+        data['goods'] = [item for item in data['goods'] if item['category'] != 5]
+        PriceListImporter(self.shop).run(data)
+        self.assertEqual(counts()[5], (0, []))
+        self.assertEqual(counts()[224][0], expected[224])
+
+        # пересчитываются и блокируются только указанные пары, а не все сочетания их категорий и магазинов
+        other = Shop.objects.create(name='Other Shop', state=True)
+        do_import(self.url, other.id)
+        pairs = {(224, self.shop.id), (15, other.id)}
+        self.assertEqual(category_pairs(ProductCard.objects.filter(pairs_filter(pairs))), pairs)
+
+        # счетчики всех магазинов не привязывают ответ с shop_id к версии магазина
+        def shops():
+            results = self.client.get(url, {'shop_id': self.shop.id}).json()['results']
+            return {item['id']: item['shops'] for item in results}
+
+        self.assertEqual(len(shops()[224]), 2)
+        other.state = False
+        ShopAdmin(Shop, admin.site).save_model(None, other, None, True)
+        self.assertEqual([item['shop'] for item in shops()[224]], [self.shop.id])
+
+    def test_product_suggest(self):
+        """Проверяет подсказки по префиксу из индекса в памяти и его перестроение."""
+        # версии каталога откатываются вместе с тестами, поэтому индекс прошлых тестов сбрасывается
+        suggest_index.index = None
+        do_import(self.url, self.shop.id)
+        url = reverse('backend:products-suggest')
+
+        def get(prefix, **params):
+            return self.client.get(url, {'prefix': prefix, **params}).json()['results']
+
+        self.assertEqual(get('apple/iphone/x'), ['apple/iphone/xr', 'apple/iphone/xs-max'])
+        self.assertIn('apple/iphone/xr', get('XR'))
+        self.assertTrue(all(name.startswith('Смартфон') for name in get('смарт')))
+        self.assertEqual(len(get('a', limit=2)), 2)
+        self.assertEqual(get('nothing'), [])
+        self.assertFalse(self.client.get(url).json()['Status'])
+        # подсказки отдаются без запросов к базе данных
+        with self.assertNumQueries(0):
+            suggest('apple', 10)
+
+        with override_settings(SUGGEST_CHECK_INTERVAL=0, SUGGEST_BACKGROUND_REBUILD=False):
+            # цены и остатки не меняют названий, индекс не перестраивается
+            index = suggest_index.index
+            info = ProductInfo.objects.filter(model='apple/iphone/xr').first()
+            StockUpdater(self.shop.id).run([(info.external_id, info.price + 1, info.price_rrc, info.quantity + 1)])
+            get('apple')
+            self.assertIs(suggest_index.index, index)
+
+            for info in ProductInfo.objects.filter(model='apple/iphone/xr'):
+                info.model = 'apple/iphone/xr-2020'
+                info.save()
+            self.assertEqual(get('apple/iphone/x'), ['apple/iphone/xr-2020', 'apple/iphone/xs-max'])
+
+    def test_suggest_background_rebuild(self):
+        """Проверяет, что до готовности нового индекса подсказок запросы обслуживает прежний."""
+        suggest_index.index = None
+        do_import(self.url, self.shop.id)
+        self.assertIn('apple/iphone/xr', suggest('apple', 10))
+
+        built = threading.Event()
+
+        def build(version):
+            built.wait(5)
+            return SuggestIndex(version, ['apple/iphone/xr-2020'])
+
+        with override_settings(SUGGEST_CHECK_INTERVAL=0, SUGGEST_BACKGROUND_REBUILD=True), \
+                patch('backend.suggest.build_suggest_index', side_effect=build):
+            bump_versions([NAMES_SCOPE])
+            self.assertIn('apple/iphone/xr', suggest('apple', 10))
+            built.set()
+            suggest_index.thread.join(5)
+            self.assertEqual(suggest('apple', 10), ['apple/iphone/xr-2020'])
+
+    def test_product_variants(self):
+        """Проверяет варианты товара по пути модели и различающиеся характеристики."""
+        do_import(self.url, self.shop.id)
+        xr = list(ProductInfo.objects.filter(model='apple/iphone/xr').order_by('id'))
+
+        with self.assertNumQueries(1):
+            variants = product_variants(xr[0].id)
+        self.assertEqual(variants['variant_group'], 'apple/iphone/xr')
+        self.assertEqual(variants['differing_parameters'], ['Цвет'])
+        self.assertEqual([item['id'] for item in variants['variants']], [info.id for info in xr[1:]])
+        self.assertEqual(set(variants['variants'][0]['parameters']), {'Цвет'})
+        self.assertNotEqual(variants['variants'][0]['parameters'], variants['parameters'])
+
+        # варианты, снятые с продажи, не показываются
+        xr[1].is_active = False
+        xr[1].save()
+        response = self.client.get(reverse('backend:products-variants', args=[xr[0].id]))
+        self.assertEqual([item['id'] for item in response.json()['variants']], [xr[2].id])
+
+        # варианты собираются из всех магазинов, поэтому параметр shop_id не привязывает ответ к версии магазина
+        other = Shop.objects.create(name='Other Shop', state=True)
+        do_import(self.url, other.id)
+        url = reverse('backend:products-variants', args=[xr[0].id])
+        self.assertEqual(len(self.client.get(url, {'shop_id': self.shop.id}).json()['variants']), 4)
+        other.state = False
+        ShopAdmin(Shop, admin.site).save_model(None, other, None, True)
+        self.assertEqual(len(self.client.get(url, {'shop_id': self.shop.id}).json()['variants']), 1)
+
+        galaxy = ProductInfo.objects.get(model='samsung/galaxy-s20', shop=self.shop)
+        response = self.client.get(reverse('backend:products-variants', args=[galaxy.id]))
+        self.assertEqual((response.json()['variants'], response.json()['differing_parameters']), ([], []))
+        response = self.client.get(reverse('backend:products-variants', args=[999999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_catalog_export(self):
+        """Проверяет потоковую выгрузку каталога в NDJSON и CSV."""
+        do_import(self.url, self.shop.id)
+        url = reverse('backend:products-export')
+        cards = list(ProductCard.objects.order_by('product_info').values_list('card', flat=True))
+
+        with override_settings(EXPORT_CHUNK_SIZE=5):
+            response = self.client.get(url)
+            chunks = list(response.streaming_content)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(b''.join(chunks).decode().splitlines(), cards)
+
+        response = self.client.get(url, {'file_format': 'csv', 'category_id': 5})
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 5)
+        card = json.loads(ProductCard.objects.get(product_info_id=rows[0]['id']).card)
+        self.assertEqual(rows[0]['name'], card['product']['name'])
+        self.assertEqual(json.loads(rows[0]['parameters']), card['parameters'])
+
+        self.assertFalse(self.client.get(url, {'file_format': 'xml'}).json()['Status'])
+
+    def test_generate_price_lists(self):
+        """Проверяет, что синтетические прайс-листы читаются всеми парсерами."""
+        with tempfile.TemporaryDirectory() as directory:
+            for file_format in FORMAT_EXTENSIONS:
+                paths = generate_price_lists(os.path.join(directory, file_format), 25, parameters=3, shops=2,
+                                             file_format=file_format)
+                self.assertEqual(len(paths), 2)
+                with open(paths[1], 'rb') as file:
+                    data = get_parser(filename=paths[1])(file)
+                    goods = list(data['goods'])
+                self.assertEqual(data['shop'], 'Benchmark shop 2')
+                self.assertEqual(len(goods), 25)
+                self.assertEqual(len(goods[0]['parameters']), 3)
+
+    def test_benchmark_import(self):
+        """Проверяет отчет замера импорта всеми способами."""
+        # объекты с похожими именами, созданные не замером, не удаляются
+        shop = Shop.objects.create(name='Benchmark Ltd')
+        with tempfile.TemporaryDirectory() as directory:
+            report_path = os.path.join(directory, 'report.json')
+            call_command('benchmark_import', '--sizes', '20', '--shops', '2', '--in-process', '--output', report_path,
+                         stderr=io.StringIO())
+            with open(report_path) as file:
+                report = json.load(file)
+        self.assertEqual([result['runner'] for result in report['results']],
+                         ['do_import', 'partner_update', 'load_shop_data'])
+        for result in report['results']:
+            self.assertEqual(result['status'], 'ok', result.get('error'))
+            self.assertEqual(result['goods'], 40)
+            self.assertGreater(result['queries'], 0)
+        # данные замера удалены
+        self.assertEqual(list(Shop.objects.filter(name__startswith='Benchmark')), [shop])
+
+    def test_benchmark_category_ids(self):
+        """Проверяет, что замер не запускается, если id его категорий заняты."""
+        Category.objects.create(id=CATEGORY_ID_BASE + 1, name='Ноутбуки')
+        with self.assertRaises(CommandError):
+            call_command('benchmark_import', '--sizes', '5', '--in-process', stdout=io.StringIO(),
+                         stderr=io.StringIO())
+        self.assertEqual(Category.objects.get(id=CATEGORY_ID_BASE + 1).name, 'Ноутбуки')
+        self.assertFalse(Shop.objects.filter(name__startswith='Benchmark').exists())
+
+    def test_benchmark_cleanup(self):
+        """Проверяет, что удаление данных замера пересчитывает сводки предложений и версии каталога."""
+        existing = existing_data()
+        product = Product.objects.create(name='Телефон', category=Category.objects.create(name='Телефоны'))
+        shop = Shop.objects.create(name='Магазин')
+        ProductInfo.objects.create(product=product, shop=shop, external_id=1, price=200, price_rrc=200, quantity=1)
+        ProductInfo.objects.create(product=product, shop=Shop.objects.create(name=shop_name(1)), external_id=1,
+                                   price=100, price_rrc=100, quantity=1)
+        self.assertEqual(ProductOfferSummary.objects.get(product=product).min_price, 100)
+        version, names = get_catalog_version(), get_versions([NAMES_SCOPE])
+
+        cleanup(existing)
+        summary = ProductOfferSummary.objects.get(product=product)
+        self.assertEqual((summary.min_price, summary.best_shop_id, summary.offer_count), (200, shop.id, 1))
+        self.assertNotEqual(get_catalog_version(), version)
+        self.assertNotEqual(get_versions([NAMES_SCOPE]), names)
+
+    def test_benchmark_serialization(self):
+        """Проверяет отчет замера сериализации заказов."""
+        output = io.StringIO()
+        call_command('benchmark_serialization', '--orders', '3', '--items', '2', '--repeat', '1', stdout=output,
+                     stderr=io.StringIO())
+        report = json.loads(output.getvalue())
+        self.assertEqual([result['endpoint'] for result in report['results']], ['order', 'basket'])
+        self.assertTrue(all(result['identical'] for result in report['results']))
+        self.assertFalse(Order.objects.exists())
+
+
+class QueryPlanTests(APITestCase):
+    """
+    Регрессионные тесты числа запросов основных представлений и использования индексов:
+    лишний запрос (N+1) или запрос, перешедший на полный просмотр таблицы, ломают тесты.
+    """
+
+    def setUp(self):
+        """Импортирует тестовый прайс-лист и создает покупателя с корзиной и оформленным заказом."""
+        cache.clear()
+        suggest_index.index = None
+        self.shop_user = User.objects.create_user(email='plan-shop@example.com', password='password123', type='shop')
+        self.shop = Shop.objects.create(name='Plan Shop', user=self.shop_user)
+        do_import('file://' + os.path.abspath('../../data/shop1.yaml'), self.shop.id)
+        self.buyer = User.objects.create_user(email='plan-buyer@example.com', password='password123', type='buyer')
+        contact = Contact.objects.create(user=self.buyer, city='Москва', street='Ленина', phone='+79001234567')
+        infos = list(ProductInfo.objects.order_by('id')[:3])
+        for state, items in (('new', infos[:2]), ('basket', infos[2:])):
+            order = Order.objects.create(user=self.buyer, state=state, contact=contact if state == 'new' else None)
+            OrderItem.objects.bulk_create([OrderItem(order=order, product_info=info, quantity=1) for info in items])
+        self.product_info = infos[0]
+
+    def assertQueryCount(self, expected, url, params=None, user=None):
+        self.client.force_authenticate(user=user)
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+        self.assertEqual(len(context), expected, f'{url}: {[query["sql"] for query in context]}')
+
+    def test_endpoint_query_counts(self):
+        """Проверяет число запросов каждого представления на чтение."""
+        # каталог: версия каталога и страница карточек (категории и магазины - еще COUNT и связи)
+        self.assertQueryCount(4, reverse('backend:categories'))
+        self.assertQueryCount(3, reverse('backend:shops'))
+        self.assertQueryCount(2, reverse('backend:products'))
+        # + id характеристик фильтра и фасетов и два подсчета фасетов
+        self.assertQueryCount(6, reverse('backend:products'), {'param': 'Цвет:черный', 'facets': 1})
+        self.assertQueryCount(2, reverse('backend:products-search'), {'q': 'iphone'})
+        self.assertQueryCount(2, reverse('backend:products-offers'), {'ordering': '-price'})
+        self.assertQueryCount(2, reverse('backend:products-variants', args=[self.product_info.id]))
+        # подсказки: построение индекса при первом запросе, затем без запросов
+        self.assertQueryCount(2, reverse('backend:products-suggest'), {'prefix': 'apple'})
+        self.assertQueryCount(0, reverse('backend:products-suggest'), {'prefix': 'apple'})
+        # заказы: версии, заказы, позиции и характеристики
+        self.assertQueryCount(4, reverse('backend:basket'), user=self.buyer)
+        self.assertQueryCount(4, reverse('backend:order'), user=self.buyer)
+        self.assertQueryCount(1, reverse('backend:user-contact'), user=self.buyer)
+        # заказы и по запросу на каждую связь prefetch_related, а не на каждый заказ
+        self.assertQueryCount(7, reverse('backend:partner-orders'), user=self.shop_user)
+
+    def test_index_usage(self):
+        """Проверяет по плану запроса, что запросы представлений и импорта используют индексы."""
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest('Планы запросов проверяются только для SQLite и PostgreSQL')
+        if connection.vendor == 'postgresql':
+            # на нескольких строках тестовых таблиц PostgreSQL выбирает полный просмотр дешевле индекса;
+            # запрет действует до конца транзакции теста и проверяет, что индекс вообще применим
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        user_id = self.buyer.id
+        plans = {
+            'order_basket_idx': Order.objects.filter(user_id=user_id, state='basket'),
+            'order_history_idx': Order.objects.filter(user_id=user_id).exclude(state='basket').order_by('-id'),
+            'product_info_shop_external_idx': ProductInfo.objects.filter(shop_id=self.shop.id, external_id__in=[1, 2]),
+            'product_info_offer_idx': ProductInfo.objects.filter(
+                product_id__in=[1, 2], is_active=True, shop__state=True, quantity__gt=0).order_by(
+                'product_id', 'price', 'id'),
+            'product_card_category_idx': ProductCard.objects.filter(category_id=5, is_active=True).order_by(
+                'product_info'),
+            'product_card_variant_idx': ProductCard.objects.filter(variant_group='apple/iphone/xr'),
+            'product_parameter_value_idx': ProductParameter.objects.filter(parameter_id=1, value='черный').values(
+                'product_info'),
+            'offer_summary_price_idx': ProductOfferSummary.objects.order_by('min_price', 'product_id')[:20],
+        }
+        for index, queryset in plans.items():
+            with self.subTest(index=index):
+                self.assertIn(index, queryset.explain())
+
+
+class PriceListHandler(BaseHTTPRequestHandler):
+    """Локальный сервер поставщика прайс-листов для тестов загрузки."""
+    protocol_version = 'HTTP/1.1'
+    body = b'shop: Test\ncategories: []\ngoods: []\n'
+    requests = []
+    failures = 0
+
+    def do_GET(self):
+        type(self).requests.append((self.path, self.client_address[1], dict(self.headers)))
+        if self.path == '/flaky' and type(self).failures:
+            type(self).failures -= 1
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        if self.path == '/slow':
+            time.sleep(1)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-yaml')
+        self.send_header('ETag', '"v1"')
+        if self.path == '/chunked':
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for _ in range(4):
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(self.body), self.body))
+            self.wfile.write(b'0\r\n\r\n')
+            return
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@override_settings(PRICE_LIST_RETRY_BACKOFF=0, PRICE_LIST_READ_TIMEOUT=5)
+class PriceListFetchTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), PriceListHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        PriceListHandler.requests = []
+        PriceListHandler.failures = 0
+        fetch._session = None
+
+    def test_download_and_conditional_request(self):
+        """Проверяет загрузку во временный файл, метаданные и ответ 304."""
+        with fetch.open_price_list(self.base_url + '/price.yaml') as source:
+            self.assertEqual(source.stream.read(), PriceListHandler.body)
+            self.assertEqual(source.etag, '"v1"')
+            self.assertEqual(source.content_type, 'application/x-yaml')
+        with fetch.open_price_list(self.base_url + '/price.yaml', etag='"v1"') as source:
+            self.assertTrue(source.not_modified)
+
+    def test_connection_reuse(self):
+        """Проверяет, что запросы процесса идут через один пул соединений."""
+        for _ in range(3):
+            with fetch.open_price_list(self.base_url + '/price.yaml'):
+                pass
+        self.assertEqual(len({port for _, port, _ in PriceListHandler.requests}), 1)
+        self.assertIs(fetch.get_session(), fetch.get_session())
+
+    def test_retry(self):
+        """Проверяет повтор запроса при ответе 503."""
+        PriceListHandler.failures = 2
+        with fetch.open_price_list(self.base_url + '/flaky') as source:
+            self.assertEqual(source.stream.read(), PriceListHandler.body)
+        self.assertEqual(len(PriceListHandler.requests), 3)
+
+    def test_max_size(self):
+        """Проверяет ограничение размера по Content-Length и по фактически полученным данным."""
+        size = len(PriceListHandler.body)
+        with self.settings(PRICE_LIST_MAX_SIZE=size - 1):
+            with self.assertRaises(fetch.PriceListTooLarge):
+                with fetch.open_price_list(self.base_url + '/price.yaml'):
+                    pass
+        with self.settings(PRICE_LIST_MAX_SIZE=size * 2):
+            with self.assertRaises(fetch.PriceListTooLarge):
+                with fetch.open_price_list(self.base_url + '/chunked'):
+                    pass
+
+    def test_read_timeout(self):
+        """Проверяет, что медленный поставщик не блокирует воркер."""
+        with self.settings(PRICE_LIST_READ_TIMEOUT=0.2, PRICE_LIST_RETRIES=0):
+            fetch._session = None
+            with self.assertRaises(Exception):
+                with fetch.open_price_list(self.base_url + '/slow'):
+                    pass
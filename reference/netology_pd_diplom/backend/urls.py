@@ -3,11 +3,15 @@ from django_rest_passwordreset.views import reset_password_request_token, reset_
 
 from backend.views import PartnerUpdate, RegisterAccount, LoginAccount, CategoryView, ShopView, ProductInfoView, \
     BasketView, \
-    AccountDetails, ContactView, OrderView, PartnerState, PartnerOrders, ConfirmAccount
+    AccountDetails, ContactView, OrderView, PartnerState, PartnerOrders, ConfirmAccount, ImportJobView, \
+    PartnerStock, ProductSearchView, ProductExportView, ProductOfferView, \
+    ProductSuggestView, ProductVariantView
 
 app_name = 'backend'
 urlpatterns = [
     path('partner/update', PartnerUpdate.as_view(), name='partner-update'),
+    path('partner/stock', PartnerStock.as_view(), name='partner-stock'),
+    path('partner/import/<int:job_id>', ImportJobView.as_view(), name='partner-import'),
     path('partner/state', PartnerState.as_view(), name='partner-state'),
     path('partner/orders', PartnerOrders.as_view(), name='partner-orders'),
     path('user/register', RegisterAccount.as_view(), name='user-register'),
@@ -20,6 +24,11 @@ urlpatterns = [
     path('categories', CategoryView.as_view(), name='categories'),
     path('shops', ShopView.as_view(), name='shops'),
     path('products', ProductInfoView.as_view(), name='products'),
+    path('products/search', ProductSearchView.as_view(), name='products-search'),
+    path('products/suggest', ProductSuggestView.as_view(), name='products-suggest'),
+    path('products/export', ProductExportView.as_view(), name='products-export'),
+    path('products/offers', ProductOfferView.as_view(), name='products-offers'),
+    path('products/<int:product_info_id>/variants', ProductVariantView.as_view(), name='products-variants'),
     path('basket', BasketView.as_view(), name='basket'),
     path('order', OrderView.as_view(), name='order'),
 
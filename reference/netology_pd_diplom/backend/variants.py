@@ -0,0 +1,78 @@
+"""
+Варианты товара.
+
+Модель товара (ProductInfo.model) вида apple/iphone/xr объединяет варианты одного товара,
+различающиеся цветом, объемом памяти и т. п. refresh_product_cards сохраняет нормализованную
+модель в ProductCard.variant_group с индексом (variant_group, product_info), поэтому все варианты
+товара во всех магазинах вместе с его собственной карточкой читаются одним запросом по индексу,
+а различающиеся характеристики определяются по готовым карточкам.
+"""
+from django.db.models import Q, Subquery
+from ujson import loads as load_json
+
+from backend.models import ProductCard
+
+
+def variant_cards(product_info_id):
+    """
+    Карточка товара и карточки его вариантов в продаже одним запросом.
+
+    Returns:
+        tuple: (группа вариантов, карточка товара, список карточек остальных вариантов) или None,
+        если товара нет.
+    """
+    group = ProductCard.objects.filter(product_info_id=product_info_id).exclude(variant_group='').values(
+        'variant_group')
+    rows = ProductCard.objects.filter(
+        Q(product_info_id=product_info_id) |
+        Q(variant_group=Subquery(group), is_active=True, shop_state=True)).order_by('product_info').values_list(
+        'product_info', 'variant_group', 'card')
+    current, siblings = None, []
+    for pk, variant_group, card in rows:
+        if pk == product_info_id:
+            current = (variant_group, load_json(card))
+        else:
+            siblings.append(load_json(card))
+    if current is None:
+        return None
+    return current[0], current[1], siblings
+
+
+def differing_parameters(cards):
+    """
+    Названия характеристик, значения которых различаются у карточек (отсутствие значения
+    тоже считается отличием), в порядке первого появления.
+    """
+    names = list(dict.fromkeys(name for card in cards for name in card['parameters']))
+    return [name for name in names if len({card['parameters'].get(name) for card in cards}) > 1]
+
+
+def product_variants(product_info_id):
+    """
+    Варианты товара с различающимися характеристиками.
+
+    Args:
+        product_info_id (int): ID ProductInfo.
+
+    Returns:
+        dict: группа вариантов, различающиеся характеристики, их значения у товара и варианты
+        со значениями этих характеристик; None, если товара нет.
+    """
+    found = variant_cards(product_info_id)
+    if found is None:
+        return None
+    group, card, siblings = found
+    names = differing_parameters([card, *siblings])
+
+    def variant(item):
+        data = {key: value for key, value in item.items() if key not in ('product_parameters', 'parameters')}
+        data['parameters'] = {name: item['parameters'].get(name) for name in names}
+        return data
+
+    return {
+        'id': card['id'],
+        'variant_group': group,
+        'differing_parameters': names,
+        'parameters': {name: card['parameters'].get(name) for name in names},
+        'variants': [variant(item) for item in siblings],
+    }
@@ -2,22 +2,45 @@ from rest_framework.request import Request
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
+from django.core.cache import cache
 from django.core.validators import URLValidator
-from django.db import IntegrityError
-from django.db.models import Q, Sum, F
-from django.http import JsonResponse
-from requests import get
+from django.db import IntegrityError, transaction
+from django.db.models import Q, Sum, F, Prefetch
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from rest_framework.authtoken.models import Token
 from rest_framework.generics import ListAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from ujson import loads as load_json
-from yaml import load as load_yaml, Loader
 import logging
 
-from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem,     Contact, ConfirmEmailToken
-from backend.serializers import UserSerializer, CategorySerializer, ShopSerializer, ProductInfoSerializer,     OrderItemSerializer, OrderSerializer, ContactSerializer
+from backend.catalog import cache_catalog_response, conditional_order_response, bump_catalog_version, \
+    bump_order_version, render_json, CatalogChanges
+from backend.fast_serializers import use_fast_serialization, dump_json, order_rows, serialize_orders
+from backend.export import EXPORT_FORMATS, export_cards
+from backend.facets import PARAMETER_FILTER, parse_parameter_filters, filter_by_parameters, facet_counts
+from backend.importer import IMPORT_MODES, clean_stock_item
+from backend.models import Shop, Category, ProductInfo, Order, OrderItem, Contact, ConfirmEmailToken, ImportJob, \
+    ProductCard, ProductOfferSummary, CategoryOfferCount
+from backend.counters import category_pairs
+from backend.offers import offer_products
+from backend.pagination import ProductCardCursorPagination, OrderCursorPagination, OfferCursorPagination
+from backend.parsers import PARSERS
+from backend.search import search_product_cards
+from backend.suggest import suggest
+from backend.variants import product_variants
+from backend.serializers import UserSerializer, CategorySerializer, ShopSerializer, OrderItemSerializer, \
+    OrderSerializer, ContactSerializer, ImportJobSerializer, ProductOfferSummarySerializer
+from backend.tasks import do_import, update_stock, import_progress_key
 from backend.signals import new_order
+from backend.sparse import ORDER_FIELDS, ORDER_EXPANSIONS, parse_fieldset, product_fieldset, order_queryset
+
+# количество результатов поиска по умолчанию и максимальное
+SEARCH_LIMIT = 40
+MAX_SEARCH_LIMIT = 200
+# количество подсказок по умолчанию и максимальное
+SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
 
 
 class RegisterAccount(APIView):
@@ -195,11 +218,17 @@ class LoginAccount(APIView):
 
 class CategoryView(ListAPIView):
     """
-    Класс для просмотра категорий
+    Класс для просмотра категорий с количеством товаров в продаже всего и по магазинам
     """
-    queryset = Category.objects.all()
+    queryset = Category.objects.prefetch_related(Prefetch(
+        'offer_counts', queryset=CategoryOfferCount.objects.filter(count__gt=0).order_by('shop'),
+        to_attr='active_offer_counts'))
     serializer_class = CategorySerializer
 
+    @cache_catalog_response
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 
 class ShopView(ListAPIView):
     """
@@ -208,6 +237,10 @@ class ShopView(ListAPIView):
     queryset = Shop.objects.filter(state=True)
     serializer_class = ShopSerializer
 
+    @cache_catalog_response
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 
 class ProductInfoView(APIView):
     """
@@ -220,17 +253,24 @@ class ProductInfoView(APIView):
         - None
         """
 
+    @cache_catalog_response(shop_scoped=True)
     def get(self, request: Request, *args, **kwargs):
         """
                Retrieve the product information based on the specified filters.
 
+               Products can be filtered by shop_id, category_id and parameters: param=<name>:<value>,
+               repeated values of one parameter are combined with OR, different parameters with AND;
+               a value can be a numeric range <from>..<to> with optional bounds.
+               With facets=1 the response also contains product counts per parameter value.
+               fields=<field>,... limits the product fields, expand= without product_parameters drops the parameters.
+
                Args:
                - request (Request): The Django request object.
 
                Returns:
-               - Response: The response containing the product information.
+               - Response: The page of the product information with the next and previous page cursors.
                """
-        query = Q(shop__state=True)
+        query = Q(shop_state=True, is_active=True)
         shop_id = request.query_params.get('shop_id')
         category_id = request.query_params.get('category_id')
 
@@ -238,17 +278,234 @@ class ProductInfoView(APIView):
             query = query & Q(shop_id=shop_id)
 
         if category_id:
-            query = query & Q(product__category_id=category_id)
+            query = query & Q(category_id=category_id)
+
+        try:
+            parameters = parse_parameter_filters(request.query_params.getlist(PARAMETER_FILTER))
+            fieldset = product_fieldset(request.query_params)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)})
+
+        cards = ProductCard.objects.filter(query)
+        # карточки содержат готовый JSON, поэтому страница читается одним запросом
+        queryset = filter_by_parameters(cards, parameters).values('product_info', 'card')
+
+        paginator = ProductCardCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        facets = facet_counts(cards, parameters) if request.query_params.get('facets') else None
+        results = [item['card'] for item in page]
+        if not fieldset.is_default:
+            # карточка хранится целиком, невыбранные поля убираются при выдаче
+            results = [dump_json({name: card[name] for name in fieldset.fields}).decode()
+                       for card in map(load_json, results)]
+
+        if request.accepted_renderer.format != 'json':
+            response = paginator.get_paginated_response([load_json(card) for card in results])
+            if facets is not None:
+                response.data['facets'] = facets
+            return response
+        content = b''.join((
+            b'{"next":', render_json(paginator.get_next_link()),
+            b',"previous":', render_json(paginator.get_previous_link()),
+            b',"results":[', ','.join(results).encode(), b']',
+            b'' if facets is None else b',"facets":' + render_json(facets), b'}'))
+        return HttpResponse(content, content_type='application/json')
+
+
+class ProductOfferView(APIView):
+    """
+        A class for comparing the offers of the shops.
 
-        # фильтруем и отбрасываем дуликаты
-        queryset = ProductInfo.objects.filter(
-            query).select_related(
-            'shop', 'product__category').prefetch_related(
-            'product_parameters__parameter').distinct()
+        Methods:
+        - get: Retrieve the offer summaries of the products sorted by price.
 
-        serializer = ProductInfoSerializer(queryset, many=True)
+        Attributes:
+        - None
+        """
 
-        return Response(serializer.data)
+    @cache_catalog_response
+    def get(self, request: Request, *args, **kwargs):
+        """
+               Retrieve the minimum and maximum price, the best offer and its shop, the number of offers
+               and the total stock of every product in stock. Filters: category_id, price_min and price_max
+               (by the best price); ordering=price or -price.
+
+               Args:
+               - request (Request): The Django request object.
+
+               Returns:
+               - Response: The page of the offer summaries with the next and previous page cursors.
+               """
+        ordering = request.query_params.get('ordering', 'price')
+        if ordering not in OfferCursorPagination.orderings:
+            return JsonResponse({'Status': False, 'Errors': f'Неизвестная сортировка: {ordering}'})
+        try:
+            category_id = int(request.query_params.get('category_id') or 0)
+            price_min = int(request.query_params.get('price_min') or 0)
+            price_max = int(request.query_params.get('price_max') or 0)
+        except ValueError:
+            return JsonResponse({'Status': False, 'Errors': 'Неверный формат запроса'})
+
+        queryset = ProductOfferSummary.objects.all()
+        if category_id:
+            queryset = queryset.filter(category_id=category_id)
+        if price_min:
+            queryset = queryset.filter(min_price__gte=price_min)
+        if price_max:
+            queryset = queryset.filter(min_price__lte=price_max)
+
+        paginator = OfferCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(ProductOfferSummarySerializer(page, many=True).data)
+
+
+class ProductVariantView(APIView):
+    """
+        A class for viewing the variants of a product.
+
+        Methods:
+        - get: Retrieve the products of the same model in all shops with their differing parameters.
+
+        Attributes:
+        - None
+        """
+
+    @cache_catalog_response
+    def get(self, request: Request, product_info_id, *args, **kwargs):
+        """
+               Retrieve the products on sale sharing the model path of the product (e.g. apple/iphone/xr),
+               the names of the parameters whose values differ between them and the values of those parameters.
+
+               Args:
+               - request (Request): The Django request object.
+               - product_info_id (int): The ID of the product information.
+
+               Returns:
+               - Response: The variant group, the differing parameters and the variants.
+               """
+        variants = product_variants(product_info_id)
+        if variants is None:
+            return JsonResponse({'Status': False, 'Errors': 'Товар не найден'}, status=404)
+        return Response(variants)
+
+
+class ProductSuggestView(APIView):
+    """
+        A class for search-as-you-type suggestions.
+
+        Methods:
+        - get: Retrieve the product names and models starting with the prefix.
+
+        Attributes:
+        - None
+        """
+
+    def get(self, request: Request, *args, **kwargs):
+        """
+               Retrieve the product names and models of the products on sale that start with the prefix
+               or contain a word starting with it. Served from the in-process index without database queries.
+
+               Args:
+               - request (Request): The Django request object.
+
+               Returns:
+               - Response: At most `limit` suggestions.
+               """
+        prefix = request.query_params.get('prefix', '').strip()
+        if not prefix:
+            return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+        try:
+            limit = min(int(request.query_params.get('limit') or SUGGEST_LIMIT), MAX_SUGGEST_LIMIT)
+        except ValueError:
+            return JsonResponse({'Status': False, 'Errors': 'Неверный формат запроса'})
+        return Response({'results': suggest(prefix, max(limit, 1))})
+
+
+class ProductSearchView(APIView):
+    """
+        A class for full-text product search.
+
+        Methods:
+        - get: Retrieve the products matching the search query, most relevant first.
+
+        Attributes:
+        - None
+        """
+
+    @cache_catalog_response(shop_scoped=True)
+    def get(self, request: Request, *args, **kwargs):
+        """
+               Retrieve the products whose name, model or parameter values contain all words of the query.
+
+               Args:
+               - request (Request): The Django request object.
+
+               Returns:
+               - Response: The most relevant products, at most `limit` of them.
+               """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+
+        try:
+            shop_id = int(request.query_params.get('shop_id') or 0)
+            category_id = int(request.query_params.get('category_id') or 0)
+            limit = min(int(request.query_params.get('limit') or SEARCH_LIMIT), MAX_SEARCH_LIMIT)
+        except ValueError:
+            return JsonResponse({'Status': False, 'Errors': 'Неверный формат запроса'})
+
+        found = search_product_cards(query, shop_id, category_id, max(limit, 1))
+
+        if request.accepted_renderer.format != 'json':
+            return Response({'results': [load_json(card) for _, card in found]})
+        content = b''.join((b'{"results":[', ','.join(card for _, card in found).encode(), b']}'))
+        return HttpResponse(content, content_type='application/json')
+
+
+class ProductExportView(APIView):
+    """
+        A class for exporting the whole active catalog.
+
+        Methods:
+        - get: Stream the products as NDJSON or CSV.
+
+        Attributes:
+        - None
+        """
+
+    def get(self, request: Request, *args, **kwargs):
+        """
+               Stream the active products in the requested file format (file_format=ndjson or csv).
+               The export is written while reading the catalog with a server-side cursor,
+               so memory use does not depend on the catalog size.
+               Supports the shop_id, category_id and param filters of the products endpoint.
+
+               Args:
+               - request (Request): The Django request object.
+
+               Returns:
+               - StreamingHttpResponse: The export file.
+               """
+        file_format = request.query_params.get('file_format', 'ndjson')
+        if file_format not in EXPORT_FORMATS:
+            return JsonResponse({'Status': False, 'Errors': f'Неизвестный формат выгрузки: {file_format}'})
+        try:
+            parameters = parse_parameter_filters(request.query_params.getlist(PARAMETER_FILTER))
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)})
+
+        query = Q(shop_state=True, is_active=True)
+        shop_id = request.query_params.get('shop_id')
+        category_id = request.query_params.get('category_id')
+        if shop_id:
+            query = query & Q(shop_id=shop_id)
+        if category_id:
+            query = query & Q(category_id=category_id)
+        cards = filter_by_parameters(ProductCard.objects.filter(query), parameters)
+
+        response = StreamingHttpResponse(export_cards(cards, file_format), content_type=EXPORT_FORMATS[file_format])
+        response['Content-Disposition'] = f'attachment; filename="catalog.{file_format}"'
+        return response
 
 
 class BasketView(APIView):
@@ -266,9 +523,11 @@ class BasketView(APIView):
     """
 
     # получить корзину
+    @conditional_order_response
     def get(self, request, *args, **kwargs):
         """
                 Retrieve the items in the user's basket.
+                fields= and expand= select the order fields and the embedded relations (see backend.sparse).
 
                 Args:
                 - request (Request): The Django request object.
@@ -278,13 +537,17 @@ class BasketView(APIView):
                 """
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
-        basket = Order.objects.filter(
-            user_id=request.user.id, state='basket').prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameters__parameter').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
+        try:
+            fieldset = parse_fieldset(request.query_params, ORDER_FIELDS, ORDER_EXPANSIONS)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)})
+
+        basket = Order.objects.filter(user_id=request.user.id, state='basket')
+        if use_fast_serialization(request):
+            rows = order_rows(basket, fieldset)
+            return HttpResponse(dump_json(serialize_orders(rows, fieldset)), content_type='application/json')
 
-        serializer = OrderSerializer(basket, many=True)
+        serializer = OrderSerializer(order_queryset(basket, fieldset), many=True, fieldset=fieldset)
         return Response(serializer.data)
 
     # редактировать корзину
@@ -317,14 +580,16 @@ class BasketView(APIView):
                         try:
                             serializer.save()
                         except IntegrityError as error:
+                            bump_order_version(request.user.id)
                             return JsonResponse({'Status': False, 'Errors': str(error)})
                         else:
                             objects_created += 1
 
                     else:
-
+                        bump_order_version(request.user.id)
                         return JsonResponse({'Status': False, 'Errors': serializer.errors})
 
+                bump_order_version(request.user.id)
                 return JsonResponse({'Status': True, 'Создано объектов': objects_created})
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
@@ -355,6 +620,7 @@ class BasketView(APIView):
 
             if objects_deleted:
                 deleted_count = OrderItem.objects.filter(query).delete()[0]
+                bump_order_version(request.user.id)
                 return JsonResponse({'Status': True, 'Удалено объектов': deleted_count})
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
@@ -386,6 +652,7 @@ class BasketView(APIView):
                         objects_updated += OrderItem.objects.filter(order_id=basket.id, id=order_item['id']).update(
                             quantity=order_item['quantity'])
 
+                bump_order_version(request.user.id)
                 return JsonResponse({'Status': True, 'Обновлено объектов': objects_updated})
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
@@ -403,13 +670,13 @@ class PartnerUpdate(APIView):
 
     def post(self, request, *args, **kwargs):
         """
-                Update the partner price list information.
+                Start an asynchronous import of the partner price list.
 
                 Args:
                 - request (Request): The Django request object.
 
                 Returns:
-                - JsonResponse: The response indicating the status of the operation and any errors.
+                - JsonResponse: The ID of the import job (status 202) or the errors.
                 """
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
@@ -418,6 +685,12 @@ class PartnerUpdate(APIView):
             return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
 
         url = request.data.get('url')
+        mode = request.data.get('mode', 'replace')
+        file_format = request.data.get('format')
+        if mode not in IMPORT_MODES:
+            return JsonResponse({'Status': False, 'Errors': f'Неизвестный режим импорта: {mode}'})
+        if file_format and file_format not in PARSERS:
+            return JsonResponse({'Status': False, 'Errors': f'Неизвестный формат прайс-листа: {file_format}'})
         if url:
             validate_url = URLValidator()
             try:
@@ -425,37 +698,103 @@ class PartnerUpdate(APIView):
             except ValidationError as e:
                 return JsonResponse({'Status': False, 'Error': str(e)})
             else:
-                stream = get(url).content
-
-                data = load_yaml(stream, Loader=Loader)
-
-                shop, _ = Shop.objects.get_or_create(name=data['shop'], user_id=request.user.id)
-                for category in data['categories']:
-                    category_object, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
-                    category_object.shops.add(shop.id)
-                    category_object.save()
-                ProductInfo.objects.filter(shop_id=shop.id).delete()
-                for item in data['goods']:
-                    product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category'])
-
-                    product_info = ProductInfo.objects.create(product_id=product.id,
-                                                              external_id=item['id'],
-                                                              model=item['model'],
-                                                              price=item['price'],
-                                                              price_rrc=item['price_rrc'],
-                                                              quantity=item['quantity'],
-                                                              shop_id=shop.id)
-                    for name, value in item['parameters'].items():
-                        parameter_object, _ = Parameter.objects.get_or_create(name=name)
-                        ProductParameter.objects.create(product_info_id=product_info.id,
-                                                        parameter_id=parameter_object.id,
-                                                        value=value)
+                # название магазина обновится из прайс-листа при импорте
+                shop, _ = Shop.objects.get_or_create(user_id=request.user.id,
+                                                     defaults={'name': request.user.company or request.user.email})
+                job = ImportJob.objects.create(user=request.user, shop=shop, url=url, mode=mode)
+                do_import.delay(url, shop.id, mode=mode, file_format=file_format, job_id=job.id, rename_shop=True)
 
-                return JsonResponse({'Status': True})
+                return JsonResponse({'Status': True, 'Job': job.id}, status=202)
 
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
 
+class PartnerStock(APIView):
+    """
+    A class for updating prices and stock of the partner products without a full price list import.
+
+    Methods:
+    - post: Queue the price and stock update.
+
+    Attributes:
+    - None
+    """
+
+    def post(self, request, *args, **kwargs):
+        """
+        Queue the price and stock update of the partner products.
+
+        Args:
+        - request (Request): The Django request object. The items argument is a list (or its JSON)
+          of [external_id, price, price_rrc, quantity] lists or objects with the same keys.
+
+        Returns:
+        - JsonResponse: The ID of the import job (status 202) or the errors.
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        items = request.data.get('items')
+        if items:
+            try:
+                if isinstance(items, str):
+                    items = load_json(items)
+                if not isinstance(items, list):
+                    raise ValueError('Неверный формат запроса')
+                items = [clean_stock_item(item) for item in items]
+            except ValueError as error:
+                return JsonResponse({'Status': False, 'Errors': str(error)})
+
+            shop = Shop.objects.filter(user_id=request.user.id).first()
+            if shop is None:
+                return JsonResponse({'Status': False, 'Errors': 'Магазин не найден'})
+
+            job = ImportJob.objects.create(user=request.user, shop=shop, mode='stock')
+            update_stock.delay(shop.id, items, job_id=job.id)
+            return JsonResponse({'Status': True, 'Job': job.id}, status=202)
+
+        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+
+
+class ImportJobView(APIView):
+    """
+    A class for checking the status of a price list import job.
+
+    Methods:
+    - get: Retrieve the state, progress and result of the import job.
+
+    Attributes:
+    - None
+    """
+
+    def get(self, request, job_id, *args, **kwargs):
+        """
+        Retrieve the import job started by the current user.
+
+        Args:
+        - request (Request): The Django request object.
+        - job_id (int): The import job ID.
+
+        Returns:
+        - Response: The response containing the import job details.
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        job = ImportJob.objects.filter(id=job_id, user_id=request.user.id).first()
+        if job is None:
+            return JsonResponse({'Status': False, 'Errors': 'Задача импорта не найдена'}, status=404)
+
+        if job.state == 'running':
+            # последовательный импорт сообщает прогресс через кеш
+            job.progress = max(job.progress, cache.get(import_progress_key(job.id), 0))
+        serializer = ImportJobSerializer(job)
+        return Response(serializer.data)
+
+
 class PartnerState(APIView):
     """
        A class for managing partner state.
@@ -506,7 +845,14 @@ class PartnerState(APIView):
         state = request.data.get('state')
         if state:
             try:
-                Shop.objects.filter(user_id=request.user.id).update(state=state.lower() in ('true', '1', 'yes'))
+                state = state.lower() in ('true', '1', 'yes')
+                with transaction.atomic():
+                    shop_ids = list(Shop.objects.filter(user_id=request.user.id).values_list('id', flat=True))
+                    Shop.objects.filter(id__in=shop_ids).update(state=state)
+                    ProductCard.objects.filter(shop_id__in=shop_ids).update(shop_state=state)
+                    CatalogChanges(offer_products(ProductInfo.objects.filter(shop_id__in=shop_ids)),
+                                   category_pairs(ProductCard.objects.filter(shop_id__in=shop_ids)), names=True).apply()
+                    bump_catalog_version(*shop_ids)
                 return JsonResponse({'Status': True})
             except ValueError as error:
                 return JsonResponse({'Status': False, 'Errors': str(error)})
@@ -532,7 +878,7 @@ class PartnerOrders(APIView):
                - request (Request): The Django request object.
 
                Returns:
-               - Response: The response containing the orders associated with the partner.
+               - Response: The page of the orders associated with the partner.
                """
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
@@ -546,8 +892,10 @@ class PartnerOrders(APIView):
             'ordered_items__product_info__product_parameters__parameter').select_related('contact').annotate(
             total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
 
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        paginator = OrderCursorPagination()
+        page = paginator.paginate_queryset(order, request, view=self)
+        serializer = OrderSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 
 class ContactView(APIView):
@@ -634,6 +982,8 @@ class ContactView(APIView):
 
             if objects_deleted:
                 deleted_count = Contact.objects.filter(query).delete()[0]
+                # заказы с удаленным адресом удаляются каскадно
+                bump_order_version(request.user.id)
                 return JsonResponse({'Status': True, 'Удалено объектов': deleted_count})
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
@@ -659,6 +1009,7 @@ class ContactView(APIView):
                     serializer = ContactSerializer(contact, data=request.data, partial=True)
                     if serializer.is_valid():
                         serializer.save()
+                        bump_order_version(request.user.id)
                         return JsonResponse({'Status': True})
                     else:
                         return JsonResponse({'Status': False, 'Errors': serializer.errors})
@@ -680,26 +1031,38 @@ class OrderView(APIView):
     """
 
     # получить мои заказы
+    @conditional_order_response
     def get(self, request, *args, **kwargs):
         """
                Retrieve the details of user orders.
+               fields= and expand= select the order fields and the embedded relations (see backend.sparse).
 
                Args:
                - request (Request): The Django request object.
 
                Returns:
-               - Response: The response containing the details of the order.
+               - Response: The page of the user orders.
                """
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
-        order = Order.objects.filter(
-            user_id=request.user.id).exclude(state='basket').prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameters__parameter').select_related('contact').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
-
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        try:
+            fieldset = parse_fieldset(request.query_params, ORDER_FIELDS, ORDER_EXPANSIONS)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)})
+
+        order = Order.objects.filter(user_id=request.user.id).exclude(state='basket')
+        paginator = OrderCursorPagination()
+        if use_fast_serialization(request):
+            page = paginator.paginate_queryset(order_rows(order, fieldset), request, view=self)
+            return HttpResponse(dump_json({
+                'next': paginator.get_next_link(),
+                'previous': paginator.get_previous_link(),
+                'results': serialize_orders(page, fieldset),
+            }), content_type='application/json')
+
+        page = paginator.paginate_queryset(order_queryset(order, fieldset), request, view=self)
+        serializer = OrderSerializer(page, many=True, fieldset=fieldset)
+        return paginator.get_paginated_response(serializer.data)
 
     # разместить заказ из корзины
     def post(self, request, *args, **kwargs):
@@ -727,6 +1090,7 @@ class OrderView(APIView):
                     return JsonResponse({'Status': False, 'Errors': 'Неправильно указаны аргументы'})
                 else:
                     if is_updated:
+                        bump_order_version(request.user.id)
                         new_order.send(sender=self.__class__, user_id=request.user.id)
                         return JsonResponse({'Status': True})
 
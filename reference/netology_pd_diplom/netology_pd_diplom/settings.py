@@ -153,6 +153,48 @@ REST_FRAMEWORK = {
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Размер пачки для bulk_create при импорте прайс-листов
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', default=1000))
+# Размер чанка для параллельного импорта задачами Celery (0 - импорт в одной задаче); требует PostgreSQL
+# и общего кеша (CACHE_URL), на SQLite или с локальным кешем процесса импорт всегда последовательный
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', default=0))
+
+# Загрузка прайс-листов по HTTP: таймауты (с), общее время загрузки (с), максимальный размер (байт),
+# количество повторов с экспоненциальной задержкой и размер пула соединений на процесс
+PRICE_LIST_CONNECT_TIMEOUT = float(os.getenv('PRICE_LIST_CONNECT_TIMEOUT', default=5))
+PRICE_LIST_READ_TIMEOUT = float(os.getenv('PRICE_LIST_READ_TIMEOUT', default=30))
+PRICE_LIST_DOWNLOAD_TIMEOUT = float(os.getenv('PRICE_LIST_DOWNLOAD_TIMEOUT', default=600))
+PRICE_LIST_MAX_SIZE = int(os.getenv('PRICE_LIST_MAX_SIZE', default=500 * 1024 * 1024))
+PRICE_LIST_RETRIES = int(os.getenv('PRICE_LIST_RETRIES', default=3))
+PRICE_LIST_RETRY_BACKOFF = float(os.getenv('PRICE_LIST_RETRY_BACKOFF', default=0.5))
+PRICE_LIST_POOL_SIZE = int(os.getenv('PRICE_LIST_POOL_SIZE', default=10))
+
+# Общий для веб-сервера и воркеров Celery кеш (прогресс импорта, ответы каталога); без CACHE_URL - локальный в памяти
+CACHE_URL = os.getenv('CACHE_URL')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# Время жизни закешированных ответов каталога (с); актуальность обеспечивают версии каталога
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', default=3600))
+# Отдавать заказы и корзину в JSON без сериализаторов DRF (см. backend.fast_serializers)
+FAST_SERIALIZATION = os.getenv('FAST_SERIALIZATION', default='1') == '1'
+# Количество карточек, читаемых курсором и отдаваемых клиенту за раз при выгрузке каталога
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', default=2000))
+# Как часто (с) индекс подсказок сверяет версию каталога (см. backend.suggest)
+SUGGEST_CHECK_INTERVAL = float(os.getenv('SUGGEST_CHECK_INTERVAL', default=1))
+# Перестраивать индекс подсказок в фоновом потоке, отдавая до готовности прежний
+SUGGEST_BACKGROUND_REBUILD = os.getenv('SUGGEST_BACKGROUND_REBUILD', default='1') == '1'
+
 import sys
 
 # ...